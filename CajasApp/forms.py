@@ -1,6 +1,6 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from Task.models import Cajas, TurnosCaja
+from Task.models import Cajas, TurnosCaja, Gastos
 
 UBICACIONES = [
     ('Monona, zn oeste', 'Monona, zn oeste'),
@@ -56,4 +56,35 @@ class TurnoForm(forms.ModelForm):
                     "Debe cerrarse antes de abrir otro."
                 )
 
-        return cleaned
\ No newline at end of file
+        return cleaned
+
+class GastoForm(forms.ModelForm):
+    class Meta:
+        model = Gastos
+        fields = ['concepto', 'monto']
+        widgets = {
+            'concepto': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Concepto del gasto'}),
+            'monto': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0.01'}),
+        }
+
+    def clean_monto(self):
+        monto = self.cleaned_data['monto']
+        if monto is not None and monto <= 0:
+            raise ValidationError("El monto debe ser mayor a cero.")
+        return monto
+
+
+class RegistroGastosForm(forms.Form):
+    id_turno = forms.ModelChoiceField(
+        queryset=TurnosCaja.objects.filter(fecha_cierre__isnull=True),
+        label="Turno",
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+
+GastoFormSet = forms.modelformset_factory(
+    Gastos,
+    form=GastoForm,
+    extra=3,
+    can_delete=False,
+)
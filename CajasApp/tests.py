@@ -1,3 +1,99 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Task.models import Cajas, Gastos, TurnosCaja, Ventas
+from Task.tests import crear_base
+
+
+class ApiGastosTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base(productos=0)
+        self.client.force_login(self.datos['user'])
+
+    def enviar(self, cuerpo):
+        return self.client.post(reverse('api_gastos'), json.dumps(cuerpo), content_type='application/json')
+
+    def test_registra_todos_los_gastos_y_suma_egresos(self):
+        turno = self.datos['turno']
+        respuesta = self.enviar({'id_turno': turno.pk, 'gastos': [
+            {'monto': '150.50', 'concepto': 'Hielo'},
+            {'monto': '49.50', 'concepto': 'Bolsas'},
+        ]})
+
+        self.assertEqual(respuesta.json(), {'success': True, 'registrados': 2, 'total': '200.00'})
+        self.assertEqual(Gastos.objects.filter(id_turno=turno).count(), 2)
+        turno.refresh_from_db()
+        self.assertEqual(turno.egresos_totales, Decimal('200.00'))
+
+    def test_cantidad_de_consultas_no_depende_de_los_gastos(self):
+        # Sesión, usuario y versiones; bloqueo del turno, bulk_create y egresos (con su savepoint)
+        turno = self.datos['turno']
+        with self.assertNumQueries(8):
+            self.enviar({'id_turno': turno.pk, 'gastos': [{'monto': '1'}]})
+        with self.assertNumQueries(8):
+            self.enviar({'id_turno': turno.pk, 'gastos': [{'monto': '1'}] * 30})
+
+    def test_un_gasto_invalido_no_registra_ninguno(self):
+        respuesta = self.enviar({'id_turno': self.datos['turno'].pk, 'gastos': [
+            {'monto': '10'},
+            {'monto': 'mucho'},
+        ]})
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('1', respuesta.json()['errors'])
+        self.assertFalse(Gastos.objects.exists())
+
+    def test_turno_cerrado(self):
+        TurnosCaja.objects.filter(pk=self.datos['turno'].pk).update(fecha_cierre=timezone.now())
+        respuesta = self.enviar({'id_turno': self.datos['turno'].pk, 'gastos': [{'monto': '10'}]})
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('id_turno', respuesta.json()['errors'])
+        self.assertFalse(Gastos.objects.exists())
+
+
+class TableroCajasTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base(productos=0)
+        self.client.force_login(self.datos['user'])
+
+    def test_estado_de_la_caja(self):
+        turno, caja = self.datos['turno'], self.datos['caja']
+        ahora = timezone.now()
+        cerrado = TurnosCaja.objects.create(
+            id_caja=caja, id_empleado=self.datos['empleado'], fecha_apertura=ahora, fecha_cierre=ahora,
+        )
+        Ventas.objects.bulk_create([
+            Ventas(id_turno=turno, total_venta=Decimal('10')),
+            Ventas(id_turno=turno, total_venta=Decimal('15')),
+            Ventas(id_turno=cerrado, total_venta=Decimal('5')),
+            Ventas(id_turno=cerrado, total_venta=Decimal('100'), fecha_venta=ahora - datetime.timedelta(days=2)),
+        ])
+
+        [estado] = self.client.get(reverse('estado_cajas')).json()['cajas']
+
+        self.assertEqual(estado['turno'], turno.pk)
+        self.assertEqual(estado['empleado'], 'Ana Pérez')
+        self.assertEqual(
+            (estado['ventas_turno'], estado['recaudado_turno'], estado['recaudado_hoy']), (2, '25.00', '30.00'),
+        )
+
+    def test_cantidad_de_consultas_no_depende_de_las_cajas(self):
+        # El primer request llena la cache de versiones y permisos
+        self.client.get(reverse('lista_cajas'))
+        with CaptureQueriesContext(connection) as una:
+            self.assertEqual(self.client.get(reverse('lista_cajas')).status_code, 200)
+        oeste = self.datos['sucursales'][0]
+        Cajas.objects.bulk_create([Cajas(id_sucursal=oeste, ubicacion=f'Caja {i}') for i in range(10)])
+        with CaptureQueriesContext(connection) as once:
+            respuesta = self.client.get(reverse('lista_cajas'))
 
-# Create your tests here.
+        self.assertEqual(len(once), len(una))
+        self.assertContains(respuesta, 'Caja 9')
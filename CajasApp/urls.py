@@ -3,7 +3,10 @@ from . import views
 
 urlpatterns = [
     path('', views.lista_cajas, name='lista_cajas'),
+    path('estado/', views.estado_cajas, name='estado_cajas'),
     path('nueva/', views.crear_caja, name='crear_caja'),
     path('editar/<int:pk>/', views.editar_caja, name='editar_caja'),
     path('eliminar/<int:pk>/', views.eliminar_caja, name='eliminar_caja'),
+    path('gastos/', views.registrar_gastos, name='registrar_gastos'),
+    path('api/gastos/', views.api_gastos, name='api_gastos'),
 ]
\ No newline at end of file
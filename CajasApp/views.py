@@ -5,15 +5,92 @@ from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
-from Task.models import Cajas, TurnosCaja, Empleados, AuthUser
-from .forms import CajaForm, TurnoForm
+from django.core.exceptions import ValidationError
+from django.db.models import F, Value, DecimalField, IntegerField, CharField, Count, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Concat
+from django.http import JsonResponse
+from Task.models import Cajas, TurnosCaja, Empleados, AuthUser, Gastos, Ventas
+from Task import versiones
+from .forms import CajaForm, TurnoForm, GastoForm, GastoFormSet, RegistroGastosForm
+import datetime
+import json
+
+
+def _inicio_del_dia():
+    return timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min))
+
+
+def _tablero_cajas():
+    """
+    Cajas con su sucursal, el turno abierto, el empleado a cargo y lo vendido en el turno
+    y en el día, todo en una sola consulta con subconsultas correlacionadas.
+    """
+    abiertos = TurnosCaja.objects.filter(id_caja=OuterRef('pk'), fecha_cierre__isnull=True).order_by('-fecha_apertura')
+    del_turno = Ventas.objects.filter(id_turno=OuterRef('turno_abierto')).values('id_turno')
+    de_hoy = (
+        Ventas.objects
+        .filter(id_turno__id_caja=OuterRef('pk'), fecha_venta__gte=_inicio_del_dia())
+        .values('id_turno__id_caja')
+    )
+    cero = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+    return (
+        Cajas.objects
+        .select_related('id_sucursal')
+        .annotate(
+            turno_abierto=Subquery(abiertos.values('pk')[:1]),
+            apertura=Subquery(abiertos.values('fecha_apertura')[:1]),
+            empleado=Subquery(
+                abiertos.annotate(
+                    nombre_completo=Concat('id_empleado__nombre', Value(' '), 'id_empleado__apellido', output_field=CharField())
+                ).values('nombre_completo')[:1]
+            ),
+            ventas_turno=Coalesce(
+                Subquery(del_turno.annotate(n=Count('pk')).values('n'), output_field=IntegerField()), 0,
+            ),
+            recaudado_turno=Coalesce(
+                Subquery(del_turno.annotate(total=Sum('total_venta')).values('total'), output_field=DecimalField()), cero,
+            ),
+            recaudado_hoy=Coalesce(
+                Subquery(de_hoy.annotate(total=Sum('total_venta')).values('total'), output_field=DecimalField()), cero,
+            ),
+        )
+        .order_by('id_sucursal__nombre_sucursal', 'pk')
+    )
+
+
+# El día entra en el ETag: a medianoche "hoy" vuelve a cero sin que cambie ninguna versión.
+# Estas vistas no van con @solo_lectura: el ETag sale de la primaria y el cuerpo también.
+_por_dia = versiones.condicional(versiones.CAJAS, versiones.VENTAS, extra=lambda request: timezone.localdate())
 
 
 @login_required
 @require_http_methods(["GET", "POST"])
+@_por_dia
 def lista_cajas(request):
-    cajas = Cajas.objects.all()
-    return render(request, 'cajas/lista.html', {'cajas': cajas})
+    return render(request, 'cajas/lista.html', {'cajas': _tablero_cajas()})
+
+
+@login_required
+@require_http_methods(["GET"])
+@_por_dia
+def estado_cajas(request):
+    """Mismo tablero que lista_cajas en JSON, para refrescarlo sin recargar la página"""
+    cajas = [
+        {
+            'id_caja': caja.id_caja,
+            'sucursal': caja.id_sucursal.nombre_sucursal,
+            'ubicacion': caja.ubicacion,
+            'estado': caja.estado,
+            'turno': caja.turno_abierto,
+            'apertura': caja.apertura.isoformat() if caja.apertura else None,
+            'empleado': caja.empleado,
+            'ventas_turno': caja.ventas_turno,
+            'recaudado_turno': f'{caja.recaudado_turno:.2f}',
+            'recaudado_hoy': f'{caja.recaudado_hoy:.2f}',
+        }
+        for caja in _tablero_cajas()
+    ]
+    return JsonResponse({'cajas': cajas, 'actualizado': timezone.now().isoformat()})
 
 
 @login_required
@@ -95,3 +172,101 @@ def eliminar_caja(request, pk):
         caja.delete()
         return redirect('lista_cajas')
     return render(request, 'cajas/eliminar.html', {'caja': caja})
+
+
+# ===== GASTOS DEL TURNO =====
+def _registrar_gastos(id_turno, gastos):
+    """
+    Registra varios gastos en un turno abierto con una cantidad fija de consultas:
+    bloqueo del turno, bulk_create de los gastos y actualización de egresos_totales.
+    """
+    with transaction.atomic():
+        turno = (
+            TurnosCaja.objects.select_for_update()
+            .filter(pk=id_turno, fecha_cierre__isnull=True)
+            .first()
+        )
+        if turno is None:
+            raise ValidationError("El turno no existe o ya está cerrado.")
+
+        ahora = timezone.now()
+        nuevos = [
+            Gastos(
+                id_turno=turno,
+                fecha_gasto=gasto.get('fecha_gasto') or ahora,
+                monto=gasto['monto'],
+                concepto=gasto.get('concepto'),
+            )
+            for gasto in gastos
+        ]
+        Gastos.objects.bulk_create(nuevos)
+
+        total = sum((gasto.monto for gasto in nuevos), 0)
+        TurnosCaja.objects.filter(pk=turno.pk).update(
+            egresos_totales=Coalesce(
+                F('egresos_totales'), Value(0, output_field=DecimalField())
+            ) + total
+        )
+        versiones.incrementar(versiones.CAJAS)
+    return len(nuevos), total
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def registrar_gastos(request):
+    """Pantalla para cargar varios gastos de un turno en un solo envío"""
+    if request.method == 'POST':
+        turno_form = RegistroGastosForm(request.POST)
+        formset = GastoFormSet(request.POST, queryset=Gastos.objects.none())
+        if turno_form.is_valid() and formset.is_valid():
+            gastos = [f.cleaned_data for f in formset.forms if f.has_changed()]
+            if not gastos:
+                messages.warning(request, 'No se cargó ningún gasto.')
+            else:
+                try:
+                    cantidad, total = _registrar_gastos(turno_form.cleaned_data['id_turno'].pk, gastos)
+                except ValidationError as e:
+                    turno_form.add_error('id_turno', e)
+                else:
+                    messages.success(request, f'{cantidad} gasto(s) registrados ✅ Total: ${total:.2f}')
+                    return redirect('lista_cajas')
+    else:
+        turno_form = RegistroGastosForm()
+        formset = GastoFormSet(queryset=Gastos.objects.none())
+
+    return render(request, 'cajas/gastos.html', {'turno_form': turno_form, 'formset': formset})
+
+
+@login_required
+@require_http_methods(["POST"])
+def api_gastos(request):
+    """
+    Recibe {"id_turno": n, "gastos": [{"monto": ..., "concepto": ...}, ...]} y
+    registra todos los gastos en una sola transacción.
+    """
+    try:
+        data = json.loads(request.body)
+        id_turno = int(data['id_turno'])
+        items = data['gastos']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'errors': {'__all__': ['JSON inválido.']}}, status=400)
+
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'success': False, 'errors': {'gastos': ['Debe enviar al menos un gasto.']}}, status=400)
+
+    gastos, errores = [], {}
+    for i, item in enumerate(items):
+        form = GastoForm(item if isinstance(item, dict) else {})
+        if form.is_valid():
+            gastos.append(form.cleaned_data)
+        else:
+            errores[i] = form.errors
+    if errores:
+        return JsonResponse({'success': False, 'errors': errores}, status=400)
+
+    try:
+        cantidad, total = _registrar_gastos(id_turno, gastos)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'errors': {'id_turno': e.messages}}, status=400)
+
+    return JsonResponse({'success': True, 'registrados': cantidad, 'total': f'{total:.2f}'})
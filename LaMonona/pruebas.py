@@ -0,0 +1,33 @@
+"""
+Runner de `manage.py test`.
+
+Varios modelos de Task/models.py son managed=False porque sus tablas vienen de la base
+existente (ver inspectdb). Mientras corren las pruebas se marcan como managed, así la
+base de prueba crea sus tablas y TransactionTestCase las vacía entre pruebas; se
+exceptúan los que espejan tablas de Django (auth_user, django_session, ...), que ya
+crean sus propias apps.
+
+Sin MySQL a mano se puede correr contra sqlite:
+    DATABASE_URL=sqlite:////tmp/lamonona.sqlite3 python manage.py test
+"""
+from django.apps import apps
+from django.db.migrations.recorder import MigrationRecorder
+from django.test.runner import DiscoverRunner
+
+
+class Runner(DiscoverRunner):
+    def setup_databases(self, **kwargs):
+        propias = {m._meta.db_table for m in apps.get_models(include_auto_created=True) if m._meta.managed}
+        propias.add(MigrationRecorder.Migration._meta.db_table)
+        self.sin_tabla = [
+            m for m in apps.get_models()
+            if not m._meta.managed and m._meta.db_table not in propias
+        ]
+        for modelo in self.sin_tabla:
+            modelo._meta.managed = True
+        return super().setup_databases(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        super().teardown_databases(old_config, **kwargs)
+        for modelo in self.sin_tabla:
+            modelo._meta.managed = False
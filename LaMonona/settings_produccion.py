@@ -0,0 +1,29 @@
+"""
+Settings de producción para LaMonona.
+
+Usar con DJANGO_SETTINGS_MODULE=LaMonona.settings_produccion. Hereda todo de
+LaMonona.settings y solo cambia lo que no debe quedar como en desarrollo.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import TEMPLATES
+
+DEBUG = False
+
+ALLOWED_HOSTS = [h for h in os.environ.get('LAMONONA_ALLOWED_HOSTS', '*').split(',') if h]
+
+# Plantillas compiladas una sola vez por proceso con el cached loader
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+# Paquetes estáticos locales con hash y precomprimidos (ver manage.py construir_assets)
+ASSETS_LOCALES = os.environ.get('LAMONONA_ASSETS_LOCALES', '1') == '1'
+
+if ASSETS_LOCALES:
+    STORAGES['staticfiles'] = {'BACKEND': 'Task.storage.ManifestComprimidoStorage'}  # noqa: F405
@@ -30,6 +30,7 @@ urlpatterns = [
     path('users/', views.user_list, name='userlist'),
     path('users/add/', views.add_user, name='add_user'),
     path('users/edit/<int:user_id>/', views.edit_user, name='edit_user'),
+    path('users/<int:user_id>/json/', views.user_detail_json, name='user_detail_json'),
     path('user/edit/<int:user_id>/', views.edit_profile, name='edit_profile'),
     path('user/change-password/', views.change_password, name='change_password'),
     path('users/toggle-active/<int:user_id>/', views.toggle_user_active, name='toggle_user_active'),
@@ -43,7 +44,18 @@ urlpatterns = [
     path('productos/editar/<int:producto_id>/', views.editar_producto, name='editar_producto'),
     path('productos/eliminar/<int:producto_id>/', views.eliminar_producto, name='eliminar_producto'),
     path('productos/dashboard/', views.dashboard_stock, name='dashboard_stock'),
+    path('productos/buscar/', views.buscar_productos, name='buscar_productos'),
+    path('productos/codigo/<str:codigo>/', views.escanear_producto, name='escanear_producto'),
+    path('productos/<int:producto_id>/kardex/', views.kardex_producto, name='kardex_producto'),
+    path('productos/<int:producto_id>/relacionados/', views.productos_relacionados, name='productos_relacionados'),
+    path('productos/inventario/', views.lista_tomas, name='lista_tomas'),
+    path('productos/inventario/<int:toma_id>/', views.detalle_toma, name='detalle_toma'),
+    path('productos/inventario/<int:toma_id>/cargar/', views.cargar_conteo, name='cargar_conteo'),
+    path('productos/inventario/<int:toma_id>/aplicar/', views.aplicar_toma, name='aplicar_toma'),
     
+    path('perfiles/', views.lista_perfiles, name='lista_perfiles'),
+    path('perfiles/<str:ident>/', views.detalle_perfil, name='detalle_perfil'),
+    path('perfiles/<str:ident>/prof/', views.descargar_perfil, name='descargar_perfil'),
     path('logout/', views.exit, name='exit'),
     path('password_reset/', 
          auth_views.PasswordResetView.as_view(
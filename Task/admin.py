@@ -1,36 +1,169 @@
 from django.contrib import admin
-from .models import Empleados, Productos, Sucursales, Cajas, TurnosCaja, Ventas, DetallesVenta, Gastos
+from django.core.paginator import Paginator
+from django.db import connections
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.functional import cached_property
+from . import busqueda, codigos
+from .models import (
+    Empleados, Productos, Sucursales, Cajas, TurnosCaja, Ventas, DetallesVenta, Gastos,
+    VentasArchivo, DetallesVentaArchivo, Promociones,
+)
+
+RESULTADOS_BUSQUEDA_ADMIN = 200
+
+
+class PaginadorEstimado(Paginator):
+    """
+    En un changelist sin filtros usa el conteo estimado de la tabla que guarda el motor
+    en lugar de un COUNT(*) completo, que en tablas de millones de filas tarda segundos.
+    Con filtros o búsqueda se cuenta normalmente.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimado = self._conteo_estimado(self.object_list)
+            if estimado is not None:
+                return estimado
+        return super().count
+
+    @staticmethod
+    def _conteo_estimado(queryset):
+        connection = connections[queryset.db]
+        tabla = queryset.model._meta.db_table
+        if connection.vendor == 'mysql':
+            sql = (
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s"
+            )
+        elif connection.vendor == 'postgresql':
+            sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [tabla])
+            fila = cursor.fetchone()
+        # Las estadísticas pueden estar vacías en tablas recién creadas
+        if not fila or fila[0] is None or fila[0] < 1000:
+            return None
+        return int(fila[0])
+
 
 @admin.register(Empleados)
 class EmpleadosAdmin(admin.ModelAdmin):
     list_display = ['id_empleado', 'nombre', 'apellido', 'correo', 'telefono']
     search_fields = ['nombre', 'apellido', 'correo']
+    raw_id_fields = ['id_user']
 
 @admin.register(Productos)
 class ProductosAdmin(admin.ModelAdmin):
-    list_display = ['id_producto', 'nombre_producto', 'precio', 'stock']
+    list_display = ['id_producto', 'nombre_producto', 'codigo_barras', 'precio', 'stock']
     search_fields = ['nombre_producto']
+    ordering = ['nombre_producto']
+    # stock es el total de StockSucursal: se ajusta desde la edición del producto, que
+    # mueve la fila de la sucursal y lo registra en el kardex
+    readonly_fields = ['stock', 'ajustar_stock']
+
+    @admin.display(description='Ajustar stock')
+    def ajustar_stock(self, producto):
+        if producto.pk is None:
+            return 'Se carga después de crear el producto.'
+        return format_html('<a href="{}">Editar el stock por sucursal</a>', reverse('editar_producto', args=[producto.pk]))
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.stock = 0
+        super().save_model(request, obj, form, change)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Usa el índice en memoria en lugar de LIKE '%...%' (también para los autocomplete)
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        ids = busqueda.indice().buscar(search_term, k=RESULTADOS_BUSQUEDA_ADMIN)
+        escaneado = codigos.buscar(search_term)
+        if escaneado is not None:
+            ids.append(escaneado['id_producto'])
+        return queryset.filter(pk__in=ids), False
 
 @admin.register(Sucursales)
 class SucursalesAdmin(admin.ModelAdmin):
     list_display = ['id_sucursal', 'nombre_sucursal', 'direccion']
+    search_fields = ['nombre_sucursal']
 
 @admin.register(Cajas)
 class CajasAdmin(admin.ModelAdmin):
     list_display = ['id_caja', 'id_sucursal', 'ubicacion', 'estado']
+    list_select_related = ['id_sucursal']
+    search_fields = ['=id_caja', 'ubicacion']
+    autocomplete_fields = ['id_sucursal']
 
 @admin.register(TurnosCaja)
 class TurnosCajaAdmin(admin.ModelAdmin):
     list_display = ['id_turno', 'id_empleado', 'fecha_apertura', 'fecha_cierre']
+    list_select_related = ['id_empleado']
+    search_fields = ['=id_turno']
+    autocomplete_fields = ['id_caja', 'id_empleado']
+    date_hierarchy = 'fecha_apertura'
 
 @admin.register(Ventas)
 class VentasAdmin(admin.ModelAdmin):
     list_display = ['id_venta', 'nombre_cliente', 'fecha_venta', 'total_venta']
+    search_fields = ['=id_venta', 'nombre_cliente']
+    raw_id_fields = ['id_turno']
+    date_hierarchy = 'fecha_venta'
+    paginator = PaginadorEstimado
+    show_full_result_count = False
 
 @admin.register(DetallesVenta)
 class DetallesVentaAdmin(admin.ModelAdmin):
-    list_display = ['id_detalle', 'id_venta', 'id_producto', 'cantidad', 'subtotal']
+    list_display = ['id_detalle', 'id_venta', 'id_producto', 'cantidad', 'subtotal', 'descuento']
+    list_select_related = ['id_venta', 'id_producto']
+    raw_id_fields = ['id_venta']
+    autocomplete_fields = ['id_producto']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
 
 @admin.register(Gastos)
 class GastosAdmin(admin.ModelAdmin):
-    list_display = ['id_gasto', 'id_turno', 'fecha_gasto', 'monto', 'concepto']
\ No newline at end of file
+    list_display = ['id_gasto', 'id_turno', 'fecha_gasto', 'monto', 'concepto']
+    list_select_related = ['id_turno']
+    raw_id_fields = ['id_turno']
+    date_hierarchy = 'fecha_gasto'
+
+@admin.register(Promociones)
+class PromocionesAdmin(admin.ModelAdmin):
+    list_display = ['id_promocion', 'nombre', 'tipo', 'porcentaje', 'lleva', 'paga', 'desde', 'hasta', 'activa']
+    list_filter = ['tipo', 'activa']
+    search_fields = ['nombre']
+    autocomplete_fields = ['productos']
+
+
+class SoloLecturaAdmin(admin.ModelAdmin):
+    """El archivo solo lo escribe `manage.py archivar_ventas`."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(VentasArchivo)
+class VentasArchivoAdmin(SoloLecturaAdmin):
+    list_display = ['id_venta', 'nombre_cliente', 'fecha_venta', 'total_venta']
+    search_fields = ['=id_venta', 'nombre_cliente']
+    date_hierarchy = 'fecha_venta'
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+@admin.register(DetallesVentaArchivo)
+class DetallesVentaArchivoAdmin(SoloLecturaAdmin):
+    list_display = ['id_detalle', 'id_venta', 'id_producto', 'cantidad', 'subtotal']
+    list_select_related = ['id_venta', 'id_producto']
+    search_fields = ['=id_venta__id_venta']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
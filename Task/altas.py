@@ -0,0 +1,134 @@
+"""
+Alta masiva de empleados desde CSV o JSON (`manage.py alta_empleados`).
+
+Cada fila se valida con EmpleadoCreationForm, pero los usernames y correos repetidos se
+buscan para todo el archivo en una sola consulta. Las contraseñas se hashean en un pool
+de procesos (PBKDF2 es CPU puro) y usuarios, empleados y grupos se insertan con
+bulk_create en una sola transacción: o entra el archivo completo o no entra nada.
+"""
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .forms import EmpleadoCreationForm, usuarios_existentes
+from .models import AuthGroup, AuthUser, AuthUserGroups, Empleados
+
+CAMPOS = ['username', 'password', 'nombre', 'apellido', 'correo', 'rol', 'edad', 'telefono', 'direccion']
+
+
+class FilaEmpleadoForm(EmpleadoCreationForm):
+    validar_unicos = False
+
+
+def leer_filas(archivo, formato):
+    """Lista de dicts a partir de un archivo abierto en modo texto."""
+    if formato == 'json':
+        filas = json.load(archivo)
+        if not isinstance(filas, list):
+            raise ValueError("El JSON debe ser una lista de objetos.")
+        return filas
+    return list(csv.DictReader(archivo))
+
+
+def validar(filas):
+    """
+    Devuelve (formularios válidos, errores). errores es una lista de (número de fila, mensaje)
+    con la fila contada desde 1.
+    """
+    formularios, errores = [], []
+    for numero, fila in enumerate(filas, start=1):
+        # Un JSON puede traer listas o valores sueltos en vez de objetos
+        if not isinstance(fila, dict):
+            errores.append((numero, "la fila debe ser un objeto con los campos del empleado."))
+            continue
+        datos = {campo: fila.get(campo) for campo in CAMPOS}
+        datos['password1'] = datos['password2'] = datos.pop('password')
+        form = FilaEmpleadoForm(datos)
+        if form.is_valid():
+            formularios.append((numero, form))
+        else:
+            for campo, mensajes in form.errors.items():
+                errores.extend((numero, f"{campo}: {m}") for m in mensajes)
+
+    usernames, correos = usuarios_existentes(
+        [f.cleaned_data['username'] for _, f in formularios],
+        [f.cleaned_data['correo'] for _, f in formularios],
+    )
+    vistos_usernames, vistos_correos = set(), set()
+    for numero, form in formularios:
+        username, correo = form.cleaned_data['username'], form.cleaned_data['correo']
+        if username in usernames:
+            errores.append((numero, f"username: '{username}' ya está registrado."))
+        elif username in vistos_usernames:
+            errores.append((numero, f"username: '{username}' está repetido en el archivo."))
+        if correo in correos:
+            errores.append((numero, f"correo: '{correo}' ya está registrado."))
+        elif correo in vistos_correos:
+            errores.append((numero, f"correo: '{correo}' está repetido en el archivo."))
+        vistos_usernames.add(username)
+        vistos_correos.add(correo)
+
+    errores.sort()
+    return [f for _, f in formularios], errores
+
+
+def _iniciar_proceso():
+    # Con 'spawn' (macOS, Windows) el proceso hijo arranca sin Django configurado
+    django.setup()
+
+
+def hashear(passwords, procesos=None):
+    """make_password de cada contraseña repartido en un pool de procesos."""
+    # Los procesos hijos no deben heredar conexiones abiertas a la base
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+        return list(pool.map(make_password, passwords, chunksize=8))
+
+
+@transaction.atomic
+def crear(formularios, hashes):
+    """Inserta usuarios, empleados y grupos de los formularios ya validados."""
+    ahora = timezone.now()
+    usuarios = []
+    for form, hash_password in zip(formularios, hashes):
+        datos = form.cleaned_data
+        es_admin = datos['rol'] == 'administrador'
+        usuarios.append(AuthUser(
+            username=datos['username'],
+            email=datos['correo'],
+            first_name=datos['nombre'],
+            last_name=datos['apellido'],
+            is_active=True,
+            is_staff=es_admin,
+            is_superuser=es_admin,
+            password=hash_password,
+            date_joined=ahora,
+        ))
+    AuthUser.objects.bulk_create(usuarios)
+    # MySQL no devuelve los ids de bulk_create
+    ids = dict(
+        AuthUser.objects.filter(username__in=[u.username for u in usuarios]).values_list('username', 'id')
+    )
+
+    empleados = []
+    for form in formularios:
+        # La validación del ModelForm ya cargó los datos del empleado en form.instance
+        empleado = form.instance
+        empleado.id_user_id = ids[form.cleaned_data['username']]
+        empleados.append(empleado)
+    Empleados.objects.bulk_create(empleados)
+
+    roles = {form.cleaned_data['rol'] for form in formularios}
+    grupos = dict(AuthGroup.objects.filter(name__in=roles).values_list('name', 'id'))
+    for rol in roles - grupos.keys():
+        grupos[rol] = AuthGroup.objects.create(name=rol).id
+    AuthUserGroups.objects.bulk_create([
+        AuthUserGroups(user_id=ids[form.cleaned_data['username']], group_id=grupos[form.cleaned_data['rol']])
+        for form in formularios
+    ])
+    return len(empleados)
@@ -0,0 +1,87 @@
+"""
+Librerías de terceros que usan las plantillas y cómo se agrupan en paquetes.
+
+Con ASSETS_LOCALES activo las plantillas cargan los paquetes generados por
+`manage.py construir_assets` (un archivo por paquete, con hash y precomprimido);
+si no, se sigue usando cada librería desde su CDN.
+"""
+
+DATATABLES = 'https://cdn.datatables.net/v/bs5'
+
+# nombre -> (url del CDN, ruta local dentro de Task/static)
+LIBRERIAS = {
+    'bootstrap_css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+        'vendor/bootstrap/bootstrap.min.css',
+    ),
+    'bootstrap_js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+    ),
+    'fontawesome_css': (
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.2/css/all.min.css',
+        'vendor/fontawesome/css/all.min.css',
+    ),
+    'jquery': (
+        'https://cdnjs.cloudflare.com/ajax/libs/jquery/3.7.1/jquery.min.js',
+        'vendor/jquery/jquery.min.js',
+    ),
+    'datatables_css': (
+        f'{DATATABLES}/dt-2.1.8/r-3.0.3/datatables.min.css',
+        'vendor/datatables/datatables.min.css',
+    ),
+    'datatables_js': (
+        f'{DATATABLES}/dt-2.1.8/r-3.0.3/datatables.min.js',
+        'vendor/datatables/datatables.min.js',
+    ),
+    'datatables_botones_css': (
+        f'{DATATABLES}/dt-2.1.8/b-3.2.0/r-3.0.3/datatables.min.css',
+        'vendor/datatables/datatables-botones.min.css',
+    ),
+    'datatables_botones_js': (
+        f'{DATATABLES}/jszip-3.10.1/dt-2.1.8/b-3.2.0/b-html5-3.2.0/r-3.0.3/datatables.min.js',
+        'vendor/datatables/datatables-botones.min.js',
+    ),
+    'pdfmake': (
+        'https://cdnjs.cloudflare.com/ajax/libs/pdfmake/0.2.7/pdfmake.min.js',
+        'vendor/pdfmake/pdfmake.min.js',
+    ),
+    'vfs_fonts': (
+        'https://cdnjs.cloudflare.com/ajax/libs/pdfmake/0.2.7/vfs_fonts.js',
+        'vendor/pdfmake/vfs_fonts.js',
+    ),
+    'datatables_es': (
+        'https://cdn.datatables.net/plug-ins/1.11.5/i18n/es-ES.json',
+        'vendor/datatables/es-ES.json',
+    ),
+}
+
+# Archivos que all.min.css referencia como ../webfonts/*; se guardan junto a su css.
+WEBFONTS_DIR = 'vendor/fontawesome/webfonts'
+FONTAWESOME_WEBFONTS = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.2/webfonts'
+WEBFONTS = [
+    f'{familia}.{ext}'
+    for familia in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900', 'fa-v4compatibility')
+    for ext in ('woff2', 'ttf')
+]
+
+# Paquetes que arman las plantillas. 'base' se carga en todas las páginas; cada página
+# agrega a lo sumo uno de los paquetes de tablas según las funciones de DataTables que usa.
+PAQUETES = {
+    'base': {
+        'css': ['bootstrap_css', 'fontawesome_css'],
+        'js': ['jquery', 'bootstrap_js'],
+    },
+    'tablas': {
+        'css': ['datatables_css'],
+        'js': ['datatables_js'],
+    },
+    'tablas_exportar': {
+        'css': ['datatables_botones_css'],
+        'js': ['pdfmake', 'vfs_fonts', 'datatables_botones_js'],
+    },
+}
+
+
+def ruta_paquete(paquete, tipo):
+    return f'bundles/{paquete}.{tipo}'
@@ -0,0 +1,198 @@
+"""
+Índice en memoria para buscar productos por nombre y descripción.
+
+Cada proceso arma el índice una vez con una sola consulta y lo mantiene al día con las
+señales de Productos (Task.signals). Los demás procesos se enteran por la versión
+BUSQUEDA y lo rearman en la siguiente búsqueda. Para los prefijos se usa una lista
+ordenada de palabras con bisect (hace de trie) y para los errores de tipeo un índice de
+trigramas. Precio y stock no se guardan en el índice porque cambian con cada venta: se
+leen de la base solo para los k resultados.
+
+Los cambios se aplican sobre el mismo índice que están leyendo las búsquedas de otros
+threads, así que búsquedas y cambios toman el lock del índice.
+"""
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from . import versiones
+from .models import Productos
+
+# Peso de cada tipo de coincidencia por palabra buscada
+PESO_PALABRA_EXACTA = 4.0
+PESO_PREFIJO = 3.0
+PESO_DESCRIPCION = 0.5
+# Proporción mínima de trigramas compartidos para aceptar una palabra parecida
+UMBRAL_TRIGRAMAS = 0.5
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes."""
+    texto = unicodedata.normalize('NFKD', (texto or '').lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def palabras(texto):
+    return [p for p in ''.join(c if c.isalnum() else ' ' for c in normalizar(texto)).split() if p]
+
+
+def trigramas(palabra):
+    relleno = f'  {palabra} '
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+class IndiceProductos:
+    def __init__(self):
+        self.version = None
+        self._lock = threading.Lock()
+        self.nombres = {}                     # id -> nombre_producto
+        self._palabras = {}                   # id -> (palabras del nombre, palabras de la descripción)
+        self._ordenadas = []                  # (palabra del nombre, id) ordenadas, para prefijos
+        self._trigramas = defaultdict(set)    # trigrama -> {palabra}
+        self._ids_por_palabra = defaultdict(set)       # palabra del nombre -> {id}
+        self._ids_por_palabra_desc = defaultdict(set)  # palabra de la descripción -> {id}
+
+    @classmethod
+    def construir(cls, version):
+        indice = cls()
+        indice.version = version
+        filas = Productos.objects.values_list('id_producto', 'nombre_producto', 'descripcion')
+        for pk, nombre, descripcion in filas.iterator(chunk_size=2000):
+            indice._agregar(pk, nombre, descripcion, ordenar=False)
+        indice._ordenadas.sort()
+        return indice
+
+    def _agregar(self, pk, nombre, descripcion, ordenar=True):
+        del_nombre, de_descripcion = set(palabras(nombre)), set(palabras(descripcion))
+        self.nombres[pk] = nombre
+        self._palabras[pk] = (del_nombre, de_descripcion)
+        for palabra in del_nombre:
+            if ordenar:
+                insort(self._ordenadas, (palabra, pk))
+            else:
+                self._ordenadas.append((palabra, pk))
+            self._ids_por_palabra[palabra].add(pk)
+        for palabra in de_descripcion:
+            self._ids_por_palabra_desc[palabra].add(pk)
+        for palabra in del_nombre | de_descripcion:
+            for trigrama in trigramas(palabra):
+                self._trigramas[trigrama].add(palabra)
+
+    def quitar(self, pk):
+        with self._lock:
+            self._quitar(pk)
+
+    def actualizar(self, pk, nombre, descripcion):
+        with self._lock:
+            self._quitar(pk)
+            self._agregar(pk, nombre, descripcion)
+
+    def _quitar(self, pk):
+        if pk not in self._palabras:
+            return
+        del_nombre, de_descripcion = self._palabras.pop(pk)
+        del self.nombres[pk]
+        for palabra in del_nombre:
+            i = bisect_left(self._ordenadas, (palabra, pk))
+            if i < len(self._ordenadas) and self._ordenadas[i] == (palabra, pk):
+                del self._ordenadas[i]
+            self._ids_por_palabra[palabra].discard(pk)
+        for palabra in de_descripcion:
+            self._ids_por_palabra_desc[palabra].discard(pk)
+        # Los trigramas de palabras que ya nadie usa quedan; solo suman candidatos sin ids
+
+    def _por_prefijo(self, prefijo):
+        i = bisect_left(self._ordenadas, (prefijo,))
+        while i < len(self._ordenadas) and self._ordenadas[i][0].startswith(prefijo):
+            yield self._ordenadas[i]
+            i += 1
+
+    def _parecidas(self, palabra):
+        buscados = trigramas(palabra)
+        compartidos = defaultdict(int)
+        for trigrama in buscados:
+            for candidata in self._trigramas.get(trigrama, ()):
+                compartidos[candidata] += 1
+        for candidata, n in compartidos.items():
+            similitud = n / len(buscados | trigramas(candidata))
+            if similitud >= UMBRAL_TRIGRAMAS:
+                yield candidata, similitud
+
+    def buscar(self, consulta, k=10):
+        """Ids de los k productos que mejor coinciden, del mejor al peor."""
+        with self._lock:
+            return self._buscar(consulta, k)
+
+    def _buscar(self, consulta, k):
+        puntajes = defaultdict(float)
+        for palabra in dict.fromkeys(palabras(consulta)):
+            mejor = {}
+            for completa, pk in self._por_prefijo(palabra):
+                peso = PESO_PALABRA_EXACTA if completa == palabra else PESO_PREFIJO
+                mejor[pk] = max(mejor.get(pk, 0), peso)
+            for parecida, similitud in self._parecidas(palabra):
+                for pk in self._ids_por_palabra.get(parecida, ()):
+                    mejor[pk] = max(mejor.get(pk, 0), PESO_PREFIJO * similitud)
+                for pk in self._ids_por_palabra_desc.get(parecida, ()):
+                    mejor[pk] = max(mejor.get(pk, 0), PESO_DESCRIPCION * similitud)
+            for pk, peso in mejor.items():
+                puntajes[pk] += peso
+        # A igual puntaje, el nombre más corto suele ser el producto buscado
+        return heapq.nlargest(
+            k, puntajes, key=lambda pk: (puntajes[pk], -len(self.nombres[pk]), -pk)
+        )
+
+
+_indice = None
+_lock = threading.Lock()
+
+
+def indice():
+    """Índice del proceso, rearmado si otro proceso cambió productos."""
+    global _indice
+    version = versiones.version(versiones.BUSQUEDA)
+    if _indice is None or _indice.version != version:
+        with _lock:
+            if _indice is None or _indice.version != version:
+                _indice = IndiceProductos.construir(version)
+    return _indice
+
+
+def producto_guardado(producto):
+    """Al confirmarse, aplica el alta o edición al índice local y avisa a los demás procesos."""
+    pk, nombre, descripcion = producto.pk, producto.nombre_producto, producto.descripcion
+    _cambiar(lambda i: i.actualizar(pk, nombre, descripcion))
+
+
+def producto_borrado(pk):
+    _cambiar(lambda i: i.quitar(pk))
+
+
+def _cambiar(cambio):
+    versiones.incrementar(versiones.BUSQUEDA, lambda nueva: _aplicar(nueva, cambio))
+
+
+def _aplicar(nueva, cambio):
+    global _indice
+    with _lock:
+        if _indice is None:
+            return
+        # nueva - 1: nadie más cambió productos. nueva: el índice ya tiene otro cambio de la
+        # misma transacción o se rearmó después del commit; actualizar y quitar se pueden repetir
+        if _indice.version in (nueva - 1, nueva):
+            cambio(_indice)
+            _indice.version = nueva
+        else:
+            # Otro proceso cambió productos mientras tanto: se rearma en la próxima búsqueda
+            _indice = None
+
+
+def buscar(consulta, k=10):
+    """Top k productos para la consulta, con precio y stock actuales."""
+    ids = indice().buscar(consulta, k)
+    if not ids:
+        return []
+    productos = Productos.objects.only('nombre_producto', 'precio', 'stock').in_bulk(ids)
+    return [productos[pk] for pk in ids if pk in productos]
@@ -0,0 +1,134 @@
+"""
+Búsqueda de productos por código de barras para el escáner de la venta.
+
+Cada proceso guarda un diccionario código -> producto armado con una sola consulta, así
+un escaneo no toca la base. Se mantiene al día igual que el índice de Task.busqueda:
+las señales de Productos aplican el cambio localmente y los demás procesos se enteran
+por la versión CODIGOS y lo rearman en el siguiente escaneo.
+
+El stock es solo orientativo (la venta lo valida al guardar): el proceso descuenta lo
+que vende él mismo y el diccionario se rearma cada REFRESCO_SEGUNDOS para tomar lo que
+vendieron los demás.
+"""
+import threading
+import time
+
+from . import versiones
+from .models import Productos
+
+REFRESCO_SEGUNDOS = 60
+
+
+def normalizar(codigo):
+    return (codigo or '').strip() or None
+
+
+class CodigosProductos:
+    def __init__(self, version):
+        self.version = version
+        self.cargado = time.monotonic()
+        self.por_codigo = {}   # código -> [id, nombre, precio, stock]
+        self.codigos = {}      # id -> código
+
+    @classmethod
+    def construir(cls, version):
+        mapa = cls(version)
+        filas = (
+            Productos.objects
+            .filter(codigo_barras__isnull=False)
+            .values_list('id_producto', 'codigo_barras', 'nombre_producto', 'precio', 'stock')
+        )
+        for pk, codigo, nombre, precio, stock in filas.iterator(chunk_size=2000):
+            mapa._agregar(pk, codigo, nombre, precio, stock)
+        return mapa
+
+    def _agregar(self, pk, codigo, nombre, precio, stock):
+        codigo = normalizar(codigo)
+        if codigo is None:
+            return
+        self.por_codigo[codigo] = [pk, nombre, precio, stock]
+        self.codigos[pk] = codigo
+
+    def quitar(self, pk):
+        codigo = self.codigos.pop(pk, None)
+        if codigo is not None:
+            self.por_codigo.pop(codigo, None)
+
+    def actualizar(self, pk, codigo, nombre, precio, stock):
+        self.quitar(pk)
+        self._agregar(pk, codigo, nombre, precio, stock)
+
+    def mover_stock(self, deltas):
+        for pk, delta in deltas.items():
+            codigo = self.codigos.get(pk)
+            if codigo is not None:
+                self.por_codigo[codigo][3] += delta
+
+    def buscar(self, codigo):
+        """{id_producto, nombre_producto, precio, stock} del código, o None."""
+        fila = self.por_codigo.get(normalizar(codigo))
+        if fila is None:
+            return None
+        pk, nombre, precio, stock = fila
+        return {'id_producto': pk, 'nombre_producto': nombre, 'precio': str(precio), 'stock': stock}
+
+
+_mapa = None
+_lock = threading.Lock()
+
+
+def mapa():
+    """Diccionario del proceso, rearmado si otro proceso cambió productos o ya venció."""
+    global _mapa
+    version = versiones.version(versiones.CODIGOS)
+    if _vigente(_mapa, version):
+        return _mapa
+    with _lock:
+        if not _vigente(_mapa, version):
+            _mapa = CodigosProductos.construir(version)
+    return _mapa
+
+
+def _vigente(actual, version):
+    return (
+        actual is not None
+        and actual.version == version
+        and time.monotonic() - actual.cargado < REFRESCO_SEGUNDOS
+    )
+
+
+def buscar(codigo):
+    return mapa().buscar(codigo)
+
+
+def producto_guardado(pk, codigo, nombre, precio, stock):
+    _cambiar(lambda m: m.actualizar(pk, codigo, nombre, precio, stock))
+
+
+def producto_borrado(pk):
+    _cambiar(lambda m: m.quitar(pk))
+
+
+def stock_movido(deltas):
+    """Descuenta del diccionario local lo que vendió este proceso (no cambia la versión)."""
+    with _lock:
+        if _mapa is not None:
+            _mapa.mover_stock(deltas)
+
+
+def _cambiar(cambio):
+    versiones.incrementar(versiones.CODIGOS, lambda nueva: _aplicar(nueva, cambio))
+
+
+def _aplicar(nueva, cambio):
+    global _mapa
+    with _lock:
+        if _mapa is None:
+            return
+        # Igual que en busqueda: nueva quiere decir que ya se aplicó otro cambio de la misma transacción
+        if _mapa.version in (nueva - 1, nueva):
+            cambio(_mapa)
+            _mapa.version = nueva
+        else:
+            # Otro proceso cambió productos mientras tanto: se rearma en el próximo escaneo
+            _mapa = None
@@ -1,18 +1,33 @@
 from django import forms
 from django.contrib.auth.hashers import make_password
 from django.core.exceptions import ValidationError
+from django.db.models import Q
 from django.utils import timezone
-from .models import Empleados, AuthUser, AuthGroup, AuthUserGroups, Productos
+from .models import Empleados, AuthUser, AuthGroup, AuthUserGroups, Productos, StockSucursal, Sucursales
+from .permisos import ROLES, rol_principal
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Submit, Div, Field, Row, Column
 from crispy_forms.bootstrap import FormActions
 
+
+def usuarios_existentes(usernames, correos):
+    """(usernames, correos) de la lista que ya están en auth_user, en una sola consulta."""
+    usernames = [u for u in usernames if u]
+    correos = [c for c in correos if c]
+    existentes = AuthUser.objects.filter(Q(username__in=usernames) | Q(email__in=correos))
+    en_uso_usernames, en_uso_correos = set(), set()
+    for username, email in existentes.values_list('username', 'email'):
+        en_uso_usernames.add(username)
+        en_uso_correos.add(email)
+    return en_uso_usernames, en_uso_correos
+
+
 class EmpleadoCreationForm(forms.ModelForm):
     username = forms.CharField(max_length=150, required=True, label="Nombre de usuario")
     password1 = forms.CharField(widget=forms.PasswordInput, required=True, label="Contraseña")
     password2 = forms.CharField(widget=forms.PasswordInput, required=True, label="Confirmar contraseña")
     rol = forms.ChoiceField(
-        choices=[('vendedor', 'Vendedor'), ('administrador', 'Administrador')],
+        choices=ROLES,
         required=True,
         label="Rol"
     )
@@ -21,17 +36,8 @@ class EmpleadoCreationForm(forms.ModelForm):
         model = Empleados
         fields = ['nombre', 'apellido', 'edad', 'telefono', 'correo', 'direccion']
 
-    def clean_username(self):
-        username = self.cleaned_data.get('username')
-        if AuthUser.objects.filter(username=username).exists():
-            raise ValidationError("Este nombre de usuario ya está registrado.")
-        return username
-
-    def clean_correo(self):
-        correo = self.cleaned_data.get('correo')
-        if AuthUser.objects.filter(email=correo).exists():
-            raise ValidationError("Este correo electrónico ya está registrado.")
-        return correo
+    # El alta masiva (Task/altas.py) apaga este chequeo y lo hace una vez para todo el archivo
+    validar_unicos = True
 
     def clean(self):
         cleaned_data = super().clean()
@@ -39,6 +45,14 @@ class EmpleadoCreationForm(forms.ModelForm):
         password2 = cleaned_data.get("password2")
         if password1 and password2 and password1 != password2:
             raise ValidationError("Las contraseñas no coinciden.")
+
+        username, correo = cleaned_data.get('username'), cleaned_data.get('correo')
+        if self.validar_unicos and (username or correo):
+            usernames, correos = usuarios_existentes([username], [correo])
+            if username in usernames:
+                self.add_error('username', "Este nombre de usuario ya está registrado.")
+            if correo in correos:
+                self.add_error('correo', "Este correo electrónico ya está registrado.")
         return cleaned_data
 
     def save(self, commit=True, creator=None):
@@ -71,7 +85,7 @@ class EmpleadoCreationForm(forms.ModelForm):
 class EditarEmpleadoForm(forms.ModelForm):
     username = forms.CharField(max_length=150, required=True, label="Nombre de usuario")
     rol = forms.ChoiceField(
-        choices=[('vendedor', 'Vendedor'), ('administrador', 'Administrador')],
+        choices=ROLES,
         required=True,
         label="Rol"
     )
@@ -89,9 +103,9 @@ class EditarEmpleadoForm(forms.ModelForm):
             self.fields['apellido'].initial = self.instance.id_user.last_name
             self.fields['correo'].initial = self.instance.id_user.email
             self.fields['is_active'].initial = self.instance.id_user.is_active
-            user_group = AuthUserGroups.objects.filter(user=self.instance.id_user).first()
-            if user_group:
-                self.fields['rol'].initial = user_group.group.name
+            rol = rol_principal(self.instance.id_user_id)
+            if rol:
+                self.fields['rol'].initial = rol
 
     def clean_correo(self):
         correo = self.cleaned_data['correo']
@@ -181,21 +195,34 @@ class CambiarContraseñaForm(forms.Form):
 
 
 class ProductoForm(forms.ModelForm):
+    # El stock se carga por sucursal; Productos.stock es el total y lo mantiene VentasApp.stock
+    sucursal = forms.ModelChoiceField(
+        queryset=Sucursales.objects.order_by('nombre_sucursal'),
+        empty_label=None,
+        label='Sucursal',
+    )
+    stock = forms.IntegerField(
+        min_value=0,
+        label='Stock en la Sucursal',
+        help_text='Unidades disponibles en la sucursal elegida',
+        widget=forms.NumberInput(attrs={'min': '0'}),
+    )
+
     class Meta:
         model = Productos
-        fields = ['nombre_producto', 'descripcion', 'precio', 'stock', 'stock_minimo']
+        fields = ['nombre_producto', 'codigo_barras', 'descripcion', 'precio', 'stock_minimo']
         widgets = {
             'nombre_producto': forms.TextInput(attrs={'placeholder': 'Nombre del producto'}),
+            'codigo_barras': forms.TextInput(attrs={'placeholder': 'Escanear o escribir', 'autocomplete': 'off'}),
             'descripcion': forms.Textarea(attrs={'placeholder': 'Descripción del producto', 'rows': 3}),
             'precio': forms.NumberInput(attrs={'step': '0.01', 'min': '0'}),
-            'stock': forms.NumberInput(attrs={'min': '0'}),
             'stock_minimo': forms.NumberInput(attrs={'min': '1', 'value': '5'}),
         }
         labels = {
             'nombre_producto': 'Nombre del Producto',
+            'codigo_barras': 'Código de Barras',
             'descripcion': 'Descripción',
             'precio': 'precio',
-            'stock': 'Stock Actual',
             'stock_minimo': 'Stock Mínimo (Alerta)',
         }
         help_texts = {
@@ -204,6 +231,18 @@ class ProductoForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            por_sucursal = list(
+                StockSucursal.objects.filter(id_producto=self.instance)
+                .order_by('id_sucursal__nombre_sucursal')
+                .values_list('id_sucursal', 'id_sucursal__nombre_sucursal', 'stock')
+            )
+            if por_sucursal:
+                self.fields['sucursal'].initial = por_sucursal[0][0]
+                self.fields['stock'].initial = por_sucursal[0][2]
+                self.fields['stock'].help_text = 'Actual: ' + ', '.join(
+                    f'{nombre}: {stock}' for _, nombre, stock in por_sucursal
+                )
         self.helper = FormHelper()
         self.helper.form_method = 'post'
         self.helper.layout = Layout(
@@ -211,12 +250,66 @@ class ProductoForm(forms.ModelForm):
                 Column(Field('nombre_producto', css_class='form-control'), css_class='col-md-8'),
                 Column(Field('precio', css_class='form-control'), css_class='col-md-4'),
             ),
+            Field('codigo_barras', css_class='form-control'),
             Field('descripcion', css_class='form-control'),
             Row(
-                Column(Field('stock', css_class='form-control'), css_class='col-md-6'),
-                Column(Field('stock_minimo', css_class='form-control'), css_class='col-md-6'),
+                Column(Field('sucursal', css_class='form-select'), css_class='col-md-4'),
+                Column(Field('stock', css_class='form-control'), css_class='col-md-4'),
+                Column(Field('stock_minimo', css_class='form-control'), css_class='col-md-4'),
             ),
             FormActions(
                 Submit('submit', '💾 Guardar Producto', css_class='btn btn-primary'),
             )
         )
+
+    def clean_codigo_barras(self):
+        # Vacío se guarda como NULL para que no choque con el índice único
+        return (self.cleaned_data.get('codigo_barras') or '').strip() or None
+
+
+class IniciarTomaForm(forms.Form):
+    sucursal = forms.ModelChoiceField(
+        queryset=Sucursales.objects.order_by('nombre_sucursal'),
+        empty_label=None,
+        label='Sucursal',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+
+class CargarConteoForm(forms.Form):
+    archivo = forms.FileField(
+        required=False,
+        label='Archivo CSV',
+        help_text='Una línea por producto: código de barras o id, y la cantidad contada.',
+    )
+    lecturas = forms.CharField(
+        required=False,
+        label='Lecturas del escáner',
+        widget=forms.Textarea(attrs={'rows': 6, 'class': 'form-control', 'placeholder': 'Un código por línea'}),
+        help_text='Cada lectura suma una unidad; también acepta "código,cantidad".',
+    )
+    reemplazar = forms.BooleanField(
+        required=False,
+        label='Reemplazar lo ya contado de estos productos en lugar de sumar',
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        archivo = cleaned_data.get('archivo')
+        texto = cleaned_data.get('lecturas') or ''
+        if archivo:
+            try:
+                texto = archivo.read().decode('utf-8-sig') + '\n' + texto
+            except UnicodeDecodeError:
+                raise ValidationError("El archivo debe estar en UTF-8.")
+        if not texto.strip():
+            raise ValidationError("Sube un archivo o pega las lecturas del escáner.")
+        cleaned_data['texto'] = texto
+        return cleaned_data
+
+
+class AplicarTomaForm(forms.Form):
+    no_contados_en_cero = forms.BooleanField(
+        required=False,
+        label='Dejar en cero los productos que no se contaron',
+    )
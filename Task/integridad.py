@@ -0,0 +1,187 @@
+"""
+Chequeos de integridad de los datos (ver `manage.py check_integrity`).
+
+Cada chequeo recibe un rango de ids [desde, hasta] de su tabla principal y devuelve
+las discrepancias encontradas en ese rango como diccionarios listos para JSON. Las
+sumas se hacen con consultas agrupadas en la base, así cada rango trae a memoria a lo
+sumo una fila por id de la tabla principal.
+"""
+from decimal import Decimal
+
+from django.db.models import Exists, F, IntegerField, OuterRef, Q, Subquery, Sum
+
+from .models import (
+    DetallesVenta, DetallesVentaArchivo, Gastos, Productos, StockSucursal, TurnosCaja, Ventas, VentasArchivo,
+)
+
+TOLERANCIA = Decimal('0.01')
+
+
+def rangos(modelo, tamano, base='default'):
+    """Rangos [desde, hasta] de `tamano` ids que cubren la tabla."""
+    pk = modelo._meta.pk.attname
+    limites = modelo.objects.using(base).order_by().values_list(pk, flat=True)
+    primero = limites.order_by(pk).first()
+    ultimo = limites.order_by(f'-{pk}').first()
+    if primero is None:
+        return []
+    return [(desde, min(desde + tamano - 1, ultimo)) for desde in range(primero, ultimo + 1, tamano)]
+
+
+def _discrepancia(chequeo, tabla, id, **datos):
+    return {'chequeo': chequeo, 'tabla': tabla, 'id': id, **{k: _json(v) for k, v in datos.items()}}
+
+
+def _json(valor):
+    return str(valor) if isinstance(valor, Decimal) else valor
+
+
+def _difieren(a, b):
+    return abs((a or 0) - (b or 0)) > TOLERANCIA
+
+
+def _totales_venta(modelo_venta, modelo_detalle, base, desde, hasta):
+    """total_venta = suma de (subtotal - descuento) de sus líneas - descuento de la venta."""
+    tabla = modelo_venta._meta.db_table
+    netos = dict(
+        modelo_detalle.objects.using(base)
+        .filter(id_venta__gte=desde, id_venta__lte=hasta)
+        .values('id_venta')
+        .annotate(neto=Sum(F('subtotal') - F('descuento')))
+        .values_list('id_venta', 'neto')
+        .order_by()
+    )
+    ventas = (
+        modelo_venta.objects.using(base)
+        .filter(pk__gte=desde, pk__lte=hasta)
+        .values_list('pk', 'total_venta', 'descuento')
+    )
+    encontradas = []
+    for pk, total, descuento in ventas.iterator(chunk_size=5000):
+        esperado = (netos.pop(pk, None) or 0) - (descuento or 0)
+        if _difieren(total, esperado):
+            encontradas.append(_discrepancia('total_venta', tabla, pk, esperado=esperado, actual=total))
+    # Lo que quedó son líneas de ventas que no existen
+    for pk, neto in netos.items():
+        encontradas.append(_discrepancia('venta_inexistente', modelo_detalle._meta.db_table, pk, neto=neto))
+    return encontradas
+
+
+def _productos_de_lineas(modelo_detalle, base, desde, hasta):
+    """Líneas sin producto o con un producto que ya no existe (la FK no tiene restricción)."""
+    tabla = modelo_detalle._meta.db_table
+    lineas = (
+        modelo_detalle.objects.using(base)
+        .filter(pk__gte=desde, pk__lte=hasta)
+        .filter(
+            Q(id_producto__isnull=True)
+            | ~Exists(Productos.objects.using(base).filter(pk=OuterRef('id_producto')))
+        )
+        .values_list('pk', 'id_venta', 'id_producto')
+    )
+    return [
+        _discrepancia(
+            'producto_inexistente' if producto is not None else 'linea_sin_producto',
+            tabla, pk, id_venta=venta, id_producto=producto,
+        )
+        for pk, venta, producto in lineas.iterator(chunk_size=5000)
+    ]
+
+
+def totales_venta(base, desde, hasta):
+    return _totales_venta(Ventas, DetallesVenta, base, desde, hasta)
+
+
+def totales_venta_archivo(base, desde, hasta):
+    return _totales_venta(VentasArchivo, DetallesVentaArchivo, base, desde, hasta)
+
+
+def productos_de_lineas(base, desde, hasta):
+    return _productos_de_lineas(DetallesVenta, base, desde, hasta)
+
+
+def productos_de_lineas_archivo(base, desde, hasta):
+    return _productos_de_lineas(DetallesVentaArchivo, base, desde, hasta)
+
+
+def totales_turno(base, desde, hasta):
+    """ingresos = ventas del turno (vivas y archivadas), egresos = gastos y saldo = ingresos - egresos."""
+    ingresos = {}
+    for modelo in (Ventas, VentasArchivo):
+        filas = (
+            modelo.objects.using(base)
+            .filter(id_turno__gte=desde, id_turno__lte=hasta)
+            .values('id_turno')
+            .annotate(total=Sum('total_venta'))
+            .values_list('id_turno', 'total')
+            .order_by()
+        )
+        for turno, total in filas:
+            ingresos[turno] = ingresos.get(turno, 0) + (total or 0)
+    egresos = dict(
+        Gastos.objects.using(base)
+        .filter(id_turno__gte=desde, id_turno__lte=hasta)
+        .values('id_turno')
+        .annotate(total=Sum('monto'))
+        .values_list('id_turno', 'total')
+        .order_by()
+    )
+
+    turnos = (
+        TurnosCaja.objects.using(base)
+        .filter(pk__gte=desde, pk__lte=hasta)
+        .values_list('pk', 'ingresos_totales', 'egresos_totales', 'saldo_final')
+    )
+    encontradas = []
+    # Solo se comparan los totales que el turno tiene cargados
+    for pk, ingresos_turno, egresos_turno, saldo in turnos.iterator(chunk_size=5000):
+        esperado_ingresos = ingresos.get(pk, 0)
+        esperado_egresos = egresos.get(pk) or 0
+        if ingresos_turno is not None and _difieren(ingresos_turno, esperado_ingresos):
+            encontradas.append(_discrepancia(
+                'ingresos_turno', 'turnos_caja', pk, esperado=esperado_ingresos, actual=ingresos_turno,
+            ))
+        if egresos_turno is not None and _difieren(egresos_turno, esperado_egresos):
+            encontradas.append(_discrepancia(
+                'egresos_turno', 'turnos_caja', pk, esperado=esperado_egresos, actual=egresos_turno,
+            ))
+        if saldo is not None and ingresos_turno is not None and _difieren(saldo, ingresos_turno - (egresos_turno or 0)):
+            encontradas.append(_discrepancia(
+                'saldo_turno', 'turnos_caja', pk, esperado=ingresos_turno - (egresos_turno or 0), actual=saldo,
+            ))
+    return encontradas
+
+
+def stock_total(base, desde, hasta):
+    """Productos.stock = suma de stock_sucursal (solo productos con stock por sucursal)."""
+    suma = Subquery(
+        StockSucursal.objects.using(base)
+        .filter(id_producto=OuterRef('pk'))
+        .values('id_producto')
+        .annotate(total=Sum('stock'))
+        .values('total'),
+        output_field=IntegerField(),
+    )
+    productos = (
+        Productos.objects.using(base)
+        .filter(pk__gte=desde, pk__lte=hasta)
+        .annotate(suma=suma)
+        .filter(suma__isnull=False)
+        .exclude(stock=F('suma'))
+        .values_list('pk', 'suma', 'stock')
+    )
+    return [
+        _discrepancia('stock_total', 'productos', pk, esperado=esperado, actual=actual)
+        for pk, esperado, actual in productos.iterator(chunk_size=5000)
+    ]
+
+
+# nombre -> (tabla cuyos ids se reparten en rangos, función)
+CHEQUEOS = {
+    'total_venta': (Ventas, totales_venta),
+    'total_venta_archivo': (VentasArchivo, totales_venta_archivo),
+    'producto_de_linea': (DetallesVenta, productos_de_lineas),
+    'producto_de_linea_archivo': (DetallesVentaArchivo, productos_de_lineas_archivo),
+    'totales_turno': (TurnosCaja, totales_turno),
+    'stock_total': (Productos, stock_total),
+}
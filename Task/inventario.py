@@ -0,0 +1,200 @@
+"""
+Toma de inventario de una sucursal.
+
+Al iniciar se copia en ConteoInventario el stock de cada producto de la sucursal con una
+sola lectura. Los conteos se cargan de a lotes (CSV o lecturas del escáner) y guardan el
+momento de la carga. Al aplicar, lo esperado para cada producto es la copia inicial
+menos lo vendido en la sucursal entre el inicio y su conteo; la diferencia con lo
+contado se suma al stock actual con el mismo UPDATE condicional que usan las ventas
+(VentasApp.stock) y queda en el kardex como movimiento de inventario.
+
+Así la sucursal puede seguir vendiendo durante el conteo. Las ediciones y anulaciones
+de ventas hechas durante la toma no se descuentan de lo esperado.
+"""
+import csv
+import io
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from VentasApp.stock import aplicar_deltas, bloquear_stock
+
+from . import codigos
+from .models import ConteoInventario, DetallesVenta, MovimientoStock, Productos, StockSucursal, TomaInventario
+
+LOTE = 1000
+
+
+class InventarioError(Exception):
+    """Error de la toma con mensaje listo para mostrar al usuario."""
+
+
+def iniciar(sucursal, user_id=None):
+    """Abre una toma en la sucursal con la copia del stock actual de todos los productos."""
+    with transaction.atomic():
+        if TomaInventario.objects.filter(id_sucursal=sucursal, fecha_aplicada__isnull=True).exists():
+            raise InventarioError("Ya hay una toma abierta en esta sucursal.")
+        # Los productos que nunca tuvieron stock en la sucursal también entran en la toma
+        sin_fila = Productos.objects.exclude(stocksucursal__id_sucursal=sucursal).values_list('pk', flat=True)
+        StockSucursal.objects.bulk_create(
+            [StockSucursal(id_producto_id=pk, id_sucursal=sucursal, stock=0) for pk in sin_fila],
+            batch_size=LOTE,
+            ignore_conflicts=True,
+        )
+        # Una sola consulta, con las filas de la sucursal bloqueadas: las ventas que ya las
+        # movieron están confirmadas y las demás esperan, así el inicio se marca justo
+        # después de la copia sin que ninguna venta quede en los dos lados
+        stock = list(
+            StockSucursal.objects.select_for_update().filter(id_sucursal=sucursal).values_list('id_producto', 'stock')
+        )
+        toma = TomaInventario.objects.create(id_sucursal=sucursal, id_user_id=user_id, fecha_inicio=timezone.now())
+        ConteoInventario.objects.bulk_create(
+            [ConteoInventario(id_toma=toma, id_producto_id=pk, stock_inicial=n) for pk, n in stock],
+            batch_size=LOTE,
+        )
+    return toma
+
+
+def leer_conteos(texto):
+    """
+    {id_producto: cantidad} y errores de un CSV o de una tanda del escáner. Cada línea es
+    `código[,cantidad]`, con el código de barras o el id del producto; sin cantidad
+    cuenta una unidad, así cada lectura del escáner suma uno.
+    """
+    cantidades, errores = Counter(), []
+    por_codigo = codigos.mapa()
+    pendientes = defaultdict(int)   # id escrito a mano -> cantidad, se validan juntos al final
+    primera = True
+    for numero, fila in enumerate(csv.reader(io.StringIO(texto)), start=1):
+        fila = [c.strip() for c in fila]
+        if not fila or not fila[0]:
+            continue
+        encabezado, primera = primera, False
+        codigo = fila[0]
+        try:
+            cantidad = int(fila[1]) if len(fila) > 1 and fila[1] else 1
+        except ValueError:
+            if encabezado:
+                continue
+            errores.append(f"Línea {numero}: cantidad inválida '{fila[1]}'.")
+            continue
+        if cantidad < 0:
+            errores.append(f"Línea {numero}: la cantidad no puede ser negativa.")
+            continue
+        producto = por_codigo.buscar(codigo)
+        if producto is not None:
+            cantidades[producto['id_producto']] += cantidad
+        elif codigo.isdigit():
+            pendientes[int(codigo)] += cantidad
+        else:
+            errores.append(f"Línea {numero}: no hay un producto con el código '{codigo}'.")
+
+    existentes = set(Productos.objects.filter(pk__in=pendientes).values_list('pk', flat=True))
+    for pk, cantidad in pendientes.items():
+        if pk in existentes:
+            cantidades[pk] += cantidad
+        else:
+            errores.append(f"No hay un producto con el código o id '{pk}'.")
+    return cantidades, errores
+
+
+@transaction.atomic
+def cargar(toma, cantidades, reemplazar=False):
+    """Suma (o reemplaza) lo contado en la toma. Devuelve cuántos productos se tocaron."""
+    toma = TomaInventario.objects.select_for_update().get(pk=toma.pk)
+    if not toma.abierta:
+        raise InventarioError("La toma ya fue aplicada.")
+    ahora = timezone.now()
+    conteos = {c.id_producto_id: c for c in toma.conteos.filter(id_producto__in=cantidades)}
+
+    # Productos creados después de iniciar la toma
+    faltantes = cantidades.keys() - conteos.keys()
+    if faltantes:
+        actuales = dict(
+            StockSucursal.objects.filter(id_sucursal=toma.id_sucursal_id, id_producto__in=faltantes)
+            .values_list('id_producto', 'stock')
+        )
+        ConteoInventario.objects.bulk_create([
+            ConteoInventario(id_toma=toma, id_producto_id=pk, stock_inicial=actuales.get(pk, 0))
+            for pk in faltantes
+        ])
+        # Se releen para tener los ids, que bulk_create no devuelve en MySQL
+        conteos = {c.id_producto_id: c for c in toma.conteos.filter(id_producto__in=cantidades)}
+
+    for pk, cantidad in cantidades.items():
+        conteo = conteos[pk]
+        conteo.contado = cantidad if reemplazar or conteo.contado is None else conteo.contado + cantidad
+        conteo.fecha_conteo = ahora
+    ConteoInventario.objects.bulk_update(conteos.values(), ['contado', 'fecha_conteo'], batch_size=LOTE)
+    return len(conteos)
+
+
+def _vendido_desde(toma):
+    """{id_producto: [(fecha_venta, cantidad), ...]} vendido en la sucursal desde el inicio de la toma."""
+    lineas = (
+        DetallesVenta.objects
+        .filter(
+            id_venta__id_turno__id_caja__id_sucursal=toma.id_sucursal_id,
+            id_venta__fecha_venta__gte=toma.fecha_inicio,
+            id_producto__isnull=False,
+        )
+        .values_list('id_producto', 'id_venta__fecha_venta')
+        .annotate(cantidad=Sum('cantidad'))
+        .order_by()
+    )
+    vendido = defaultdict(list)
+    for pk, fecha, cantidad in lineas:
+        vendido[pk].append((fecha, cantidad))
+    return vendido
+
+
+def diferencias(toma, no_contados_en_cero=False):
+    """
+    [(ConteoInventario, esperado, diferencia)] de los productos cuyo conteo no coincide con
+    lo esperado. Sin `no_contados_en_cero` los productos sin contar se dejan como están.
+    """
+    vendido = _vendido_desde(toma)
+    conteos = toma.conteos.select_related('id_producto')
+    if not no_contados_en_cero:
+        conteos = conteos.filter(contado__isnull=False)
+    resultado = []
+    for conteo in conteos.order_by('id_producto__nombre_producto'):
+        hasta = conteo.fecha_conteo
+        vendidas = sum(n for fecha, n in vendido.get(conteo.id_producto_id, ()) if hasta is None or fecha < hasta)
+        esperado = conteo.stock_inicial - vendidas
+        diferencia = (conteo.contado or 0) - esperado
+        if diferencia:
+            resultado.append((conteo, esperado, diferencia))
+    return resultado
+
+
+def aplicar(toma, no_contados_en_cero=False):
+    """Ajusta el stock de la sucursal con las diferencias y cierra la toma."""
+    with transaction.atomic():
+        toma = TomaInventario.objects.select_for_update().get(pk=toma.pk)
+        if not toma.abierta:
+            raise InventarioError("La toma ya fue aplicada.")
+        sucursal = toma.id_sucursal_id
+        pendientes = diferencias(toma, no_contados_en_cero)
+
+        ajustados = []
+        # De a lotes, para que cada UPDATE condicional no crezca sin límite
+        for inicio in range(0, len(pendientes), LOTE):
+            lote = pendientes[inicio:inicio + LOTE]
+            filas = bloquear_stock((sucursal, conteo.id_producto_id) for conteo, _, _ in lote)
+            deltas = {}
+            for conteo, _, diferencia in lote:
+                # Lo vendido después del conteo ya salió del stock: nunca se baja de cero
+                delta = max(diferencia, -filas[(sucursal, conteo.id_producto_id)].stock)
+                conteo.ajuste = delta
+                ajustados.append(conteo)
+                if delta:
+                    deltas[(sucursal, conteo.id_producto_id)] = delta
+            aplicar_deltas(deltas, filas, MovimientoStock.INVENTARIO)
+
+        ConteoInventario.objects.bulk_update(ajustados, ['ajuste'], batch_size=LOTE)
+        toma.fecha_aplicada = timezone.now()
+        toma.save(update_fields=['fecha_aplicada'])
+    return ajustados
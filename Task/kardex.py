@@ -0,0 +1,63 @@
+"""
+Kardex: historial de movimientos de stock.
+
+Quien modifica el stock por sucursal registra en la misma transacción un MovimientoStock
+por producto con el delta aplicado (VentasApp.stock lo hace para ventas, ediciones,
+anulaciones, ajustes de productos y tomas de inventario). Productos.stock es solo un
+total que se actualiza después del commit y no entra en el kardex. `manage.py checkpoint_stock`
+guarda periódicamente el stock de cada producto, así el stock en un instante dado es
+el último checkpoint anterior más la suma de los movimientos posteriores, ambas
+búsquedas sobre índices (id_producto, fecha).
+"""
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import CheckpointStock, MovimientoStock
+
+
+def registrar(deltas, tipo, id_venta=None, fecha=None):
+    """Agrega un movimiento por cada {id_producto: delta} distinto de cero."""
+    fecha = fecha or timezone.now()
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(id_producto_id=pk, fecha=fecha, tipo=tipo, cantidad=delta, id_venta=id_venta)
+        for pk, delta in deltas.items()
+        if delta
+    ])
+
+
+def ultimo_checkpoint(producto_id, momento=None):
+    """(fecha, stock) del último checkpoint del producto en o antes de `momento`, o None."""
+    checkpoints = CheckpointStock.objects.filter(id_producto_id=producto_id)
+    if momento is not None:
+        checkpoints = checkpoints.filter(fecha__lte=momento)
+    return checkpoints.order_by('-fecha').values_list('fecha', 'stock').first()
+
+
+def suma_movimientos(producto_id, desde=None, hasta=None):
+    """Suma de los deltas del producto en (desde, hasta]."""
+    movimientos = MovimientoStock.objects.filter(id_producto_id=producto_id)
+    if desde is not None:
+        movimientos = movimientos.filter(fecha__gt=desde)
+    if hasta is not None:
+        movimientos = movimientos.filter(fecha__lte=hasta)
+    return movimientos.aggregate(total=Sum('cantidad'))['total'] or 0
+
+
+def stock_en(producto_id, momento):
+    """
+    Stock del producto en `momento`. None si es anterior al primer checkpoint, porque
+    antes de eso no hay historial desde el cual reconstruirlo.
+    """
+    checkpoint = ultimo_checkpoint(producto_id, momento)
+    if checkpoint is None:
+        return None
+    fecha, stock = checkpoint
+    return stock + suma_movimientos(producto_id, desde=fecha, hasta=momento)
+
+
+def resumen(desde, hasta, producto_id=None):
+    """Unidades movidas por tipo en (desde, hasta], p. ej. vendido contra repuesto en la semana."""
+    movimientos = MovimientoStock.objects.filter(fecha__gt=desde, fecha__lte=hasta)
+    if producto_id is not None:
+        movimientos = movimientos.filter(id_producto_id=producto_id)
+    return dict(movimientos.values_list('tipo').annotate(total=Sum('cantidad')).order_by())
@@ -0,0 +1,43 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Task import altas
+
+
+class Command(BaseCommand):
+    help = (
+        "Da de alta empleados en bloque desde un CSV (con encabezado) o un JSON (lista de objetos). "
+        f"Columnas: {', '.join(altas.CAMPOS)}. Si alguna fila no es válida no se crea ninguno."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV o JSON.')
+        parser.add_argument('--formato', choices=['csv', 'json'], help='Por defecto se deduce de la extensión.')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos para hashear contraseñas (por defecto, uno por CPU).')
+        parser.add_argument('--simular', action='store_true', help='Solo valida el archivo, sin crear nada.')
+
+    def handle(self, *args, **options):
+        ruta = Path(options['archivo'])
+        formato = options['formato'] or ('json' if ruta.suffix.lower() == '.json' else 'csv')
+        try:
+            with ruta.open(encoding='utf-8-sig', newline='') as archivo:
+                filas = altas.leer_filas(archivo, formato)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"No se pudo leer {ruta}: {e}")
+
+        formularios, errores = altas.validar(filas)
+        if errores:
+            for numero, mensaje in errores:
+                self.stderr.write(f"Fila {numero}: {mensaje}")
+            raise CommandError(f"{len(errores)} errores; no se creó ningún empleado.")
+        if options['simular'] or not formularios:
+            self.stdout.write(self.style.SUCCESS(f"{len(formularios)} filas válidas."))
+            return
+
+        inicio = time.monotonic()
+        hashes = altas.hashear([f.cleaned_data['password1'] for f in formularios], options['procesos'])
+        self.stdout.write(f"Contraseñas hasheadas en {time.monotonic() - inicio:.1f} s.")
+        creados = altas.crear(formularios, hashes)
+        self.stdout.write(self.style.SUCCESS(f"{creados} empleados creados."))
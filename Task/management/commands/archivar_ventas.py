@@ -0,0 +1,58 @@
+import calendar
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Task.models import Ventas
+from VentasApp.archivo import archivar
+
+
+def restar_meses(fecha, meses):
+    anio, mes = divmod(fecha.month - 1 - meses, 12)
+    anio += fecha.year
+    mes += 1
+    dia = min(fecha.day, calendar.monthrange(anio, mes)[1])
+    return fecha.replace(year=anio, month=mes, day=dia)
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve a ventas_archivo/detalles_venta_archivo las ventas de turnos cerrados con "
+        "más de --meses de antigüedad, por lotes y en una transacción por lote. "
+        "Pensado para ejecutarse desde cron, p. ej.: "
+        "0 4 * * 0 python manage.py archivar_ventas --meses 12"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=12, help='Antigüedad mínima de las ventas a archivar.')
+        parser.add_argument('--lote', type=int, default=500, help='Ventas a mover por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes.')
+
+    def handle(self, *args, **options):
+        if options['meses'] < 1:
+            raise CommandError("--meses debe ser al menos 1.")
+        lote = options['lote']
+        pausa = options['pausa']
+        limite = restar_meses(timezone.now(), options['meses'])
+
+        candidatas = (
+            Ventas.objects
+            .filter(fecha_venta__lt=limite, id_turno__fecha_cierre__isnull=False)
+            .order_by('id_venta')
+            .values_list('id_venta', flat=True)
+        )
+        ultimo = 0
+        total = 0
+        while True:
+            ids = list(candidatas.filter(id_venta__gt=ultimo)[:lote])
+            if not ids:
+                break
+            ultimo = ids[-1]
+            total += archivar(ids)
+            if pausa:
+                time.sleep(pausa)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} ventas anteriores al {limite:%d/%m/%Y} movidas al archivo."
+        ))
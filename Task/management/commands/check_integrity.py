@@ -0,0 +1,79 @@
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from Task.integridad import CHEQUEOS, rangos
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica los totales de ventas y turnos, que las líneas tengan productos existentes y "
+        "que Productos.stock sea la suma del stock por sucursal (ver Task/integridad.py). "
+        "Escribe una discrepancia por línea en JSON (JSON Lines) y al final una línea con el "
+        "resumen; termina con error si encontró alguna."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chequeo', action='append', choices=sorted(CHEQUEOS), dest='chequeos',
+            help='Chequeo a correr (se puede repetir; por defecto, todos).',
+        )
+        parser.add_argument('--tamano', type=int, default=100_000, help='Ids por rango.')
+        parser.add_argument('--hilos', type=int, default=4, help='Rangos que se verifican a la vez.')
+        parser.add_argument('--base', default='default', help="Alias de la base a leer (p. ej. 'replica').")
+        parser.add_argument('--salida', help='Archivo donde escribir el reporte (por defecto, la salida estándar).')
+
+    def handle(self, *args, **options):
+        if options['tamano'] < 1 or options['hilos'] < 1:
+            raise CommandError("--tamano y --hilos deben ser positivos.")
+        if options['base'] not in connections:
+            raise CommandError(f"No hay una base '{options['base']}' configurada.")
+        inicio = time.monotonic()
+        base = options['base']
+        nombres = options['chequeos'] or sorted(CHEQUEOS)
+
+        tareas = [
+            (nombre, desde, hasta)
+            for nombre in nombres
+            for desde, hasta in rangos(CHEQUEOS[nombre][0], options['tamano'], base)
+        ]
+
+        salida = open(options['salida'], 'w', encoding='utf-8') if options['salida'] else self.stdout
+        por_chequeo = Counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['hilos']) as pool:
+                futuros = [pool.submit(_verificar, nombre, base, desde, hasta) for nombre, desde, hasta in tareas]
+                for futuro in as_completed(futuros):
+                    for discrepancia in futuro.result():
+                        por_chequeo[discrepancia['chequeo']] += 1
+                        salida.write(json.dumps(discrepancia) + '\n')
+            resumen = {
+                'resumen': {
+                    'chequeos': nombres,
+                    'rangos': len(tareas),
+                    'discrepancias': sum(por_chequeo.values()),
+                    'por_chequeo': dict(por_chequeo),
+                    'segundos': round(time.monotonic() - inicio, 2),
+                }
+            }
+            salida.write(json.dumps(resumen) + '\n')
+        finally:
+            if salida is not self.stdout:
+                salida.close()
+
+        if por_chequeo:
+            raise CommandError(f"{sum(por_chequeo.values())} discrepancias encontradas.")
+        # El reporte puede estar saliendo por stdout
+        self.stderr.write(self.style.SUCCESS("Sin discrepancias."))
+
+
+def _verificar(nombre, base, desde, hasta):
+    # Cada hilo usa su propia conexión; se cierra al terminar para no dejarla abierta
+    try:
+        return CHEQUEOS[nombre][1](base, desde, hasta)
+    finally:
+        connections[base].close()
@@ -0,0 +1,102 @@
+import datetime
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from Task.models import CheckpointStock, MovimientoStock, Productos, StockSucursal
+
+
+class Command(BaseCommand):
+    help = (
+        "Guarda un checkpoint del stock de cada producto con movimientos desde su último "
+        "checkpoint (ver Task/kardex.py). Los productos sin checkpoint toman la suma de su stock "
+        "por sucursal bloqueando esas filas; los que todavía no tienen stock por sucursal se "
+        "saltean hasta que se carguen. Pensado para cron, p. ej.: 15 3 * * * python manage.py checkpoint_stock"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--margen', type=int, default=300,
+            help='Segundos hacia atrás del instante del checkpoint, para no dejar afuera '
+                 'movimientos de transacciones que todavía no confirmaron.',
+        )
+        parser.add_argument('--lote', type=int, default=1000, help='Productos por consulta.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        iniciales = self._iniciales(lote)
+        instante = timezone.now() - datetime.timedelta(seconds=options['margen'])
+        incrementales = self._incrementales(instante, lote)
+        self.stdout.write(self.style.SUCCESS(
+            f"{iniciales} checkpoints iniciales y {incrementales} incrementales guardados."
+        ))
+
+    def _iniciales(self, lote):
+        sin_checkpoint = (
+            Productos.objects
+            .filter(stocksucursal__isnull=False)
+            .exclude(pk__in=CheckpointStock.objects.values('id_producto'))
+            .distinct()
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        total = 0
+        ultimo = 0
+        while True:
+            ids = list(sin_checkpoint.filter(pk__gt=ultimo)[:lote])
+            if not ids:
+                return total
+            ultimo = ids[-1]
+            with transaction.atomic():
+                # Las ventas bloquean y mueven stock_sucursal (y escriben el kardex) en su
+                # transacción; Productos.stock recién se actualiza después del commit. Con
+                # estas filas bloqueadas ninguna venta en curso queda a medias en la suma.
+                filas = StockSucursal.objects.select_for_update().filter(id_producto__in=ids)
+                stocks = Counter()
+                for pk, stock in filas.values_list('id_producto', 'stock'):
+                    stocks[pk] += stock
+                fecha = timezone.now()
+                creados = CheckpointStock.objects.bulk_create([
+                    CheckpointStock(id_producto_id=pk, fecha=fecha, stock=stock)
+                    for pk, stock in stocks.items()
+                ])
+            total += len(creados)
+
+    def _incrementales(self, instante, lote):
+        ultimo_checkpoint = CheckpointStock.objects.filter(id_producto=OuterRef('pk')).order_by('-fecha')
+        productos = (
+            Productos.objects
+            .annotate(
+                cp_fecha=Subquery(ultimo_checkpoint.values('fecha')[:1]),
+                cp_stock=Subquery(ultimo_checkpoint.values('stock')[:1]),
+            )
+            .filter(cp_fecha__lt=instante)
+            .annotate(
+                delta=Subquery(
+                    MovimientoStock.objects
+                    .filter(id_producto=OuterRef('pk'), fecha__gt=OuterRef('cp_fecha'), fecha__lte=instante)
+                    .values('id_producto')
+                    .annotate(total=Sum('cantidad'))
+                    .values('total'),
+                    output_field=IntegerField(),
+                ),
+            )
+            .filter(delta__isnull=False)
+            .order_by('pk')
+            .values_list('pk', 'cp_stock', 'delta')
+        )
+        total = 0
+        ultimo = 0
+        while True:
+            filas = list(productos.filter(pk__gt=ultimo)[:lote])
+            if not filas:
+                return total
+            ultimo = filas[-1][0]
+            CheckpointStock.objects.bulk_create([
+                CheckpointStock(id_producto_id=pk, fecha=instante, stock=stock + delta)
+                for pk, stock, delta in filas
+            ])
+            total += len(filas)
@@ -0,0 +1,87 @@
+import posixpath
+import re
+import urllib.request
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from Task.assets import FONTAWESOME_WEBFONTS, LIBRERIAS, PAQUETES, WEBFONTS, WEBFONTS_DIR, ruta_paquete
+
+STATIC_DIR = Path(__file__).resolve().parents[2] / 'static'
+
+SOURCE_MAP = re.compile(rb'^\s*(//|/\*)# sourceMappingURL=.*$', re.M)
+URL_RELATIVA = re.compile(rb'url\((["\']?)(?!data:|https?:|/|#)([^"\')]+)\1\)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Descarga las librerías de terceros a Task/static/vendor, arma un archivo por paquete "
+        "en Task/static/bundles (cada librería una sola vez) y ejecuta collectstatic. "
+        "Con ASSETS_LOCALES=True y ManifestComprimidoStorage, STATIC_ROOT queda con nombres "
+        "con hash y sus .gz/.br; el servidor web debe servirlos con "
+        "'Cache-Control: public, max-age=31536000, immutable' (en nginx: gzip_static on; expires max;)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forzar', action='store_true', help='Vuelve a descargar aunque el archivo exista.')
+        parser.add_argument('--sin-collectstatic', action='store_true', help='Solo descarga y arma los paquetes.')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout de cada descarga en segundos.')
+
+    def handle(self, *args, **options):
+        self.timeout = options['timeout']
+
+        for nombre, (url, local) in LIBRERIAS.items():
+            self._descargar(url, STATIC_DIR / local, options['forzar'])
+        for archivo in WEBFONTS:
+            self._descargar(f'{FONTAWESOME_WEBFONTS}/{archivo}', STATIC_DIR / WEBFONTS_DIR / archivo, options['forzar'])
+
+        # Lo que ya va en 'base' no se repite en los demás paquetes
+        en_base = {tipo: set(nombres) for tipo, nombres in PAQUETES['base'].items()}
+        for paquete, tipos in PAQUETES.items():
+            for tipo, nombres in tipos.items():
+                if paquete != 'base':
+                    nombres = [n for n in nombres if n not in en_base.get(tipo, ())]
+                self._armar_paquete(paquete, tipo, list(dict.fromkeys(nombres)))
+
+        if not options['sin_collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
+
+    def _descargar(self, url, destino, forzar):
+        if destino.exists() and not forzar:
+            return
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        self.stdout.write(f"Descargando {url}")
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as respuesta:
+                contenido = respuesta.read()
+        except OSError as e:
+            raise CommandError(f"No se pudo descargar {url}: {e}")
+
+        # ManifestStaticFilesStorage falla si un sourceMappingURL apunta a un .map que no existe
+        if destino.suffix in ('.js', '.css'):
+            contenido = SOURCE_MAP.sub(b'', contenido)
+        destino.write_bytes(contenido)
+
+    def _armar_paquete(self, paquete, tipo, nombres):
+        destino = STATIC_DIR / ruta_paquete(paquete, tipo)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        separador = b'\n;\n' if tipo == 'js' else b'\n'
+        partes = []
+        for nombre in nombres:
+            local = LIBRERIAS[nombre][1]
+            contenido = (STATIC_DIR / local).read_bytes()
+            if tipo == 'css':
+                contenido = self._reubicar_urls(contenido, local, destino.relative_to(STATIC_DIR).as_posix())
+            partes.append(contenido)
+        destino.write_bytes(separador.join(partes))
+        self.stdout.write(self.style.SUCCESS(f"{destino.relative_to(STATIC_DIR)}: {', '.join(nombres)}"))
+
+    @staticmethod
+    def _reubicar_urls(contenido, origen, destino):
+        """Reescribe los url() relativos de un css para que sigan apuntando bien desde el paquete."""
+        def reubicar(match):
+            ruta = posixpath.normpath(posixpath.join(posixpath.dirname(origen), match.group(2).decode()))
+            nueva = posixpath.relpath(ruta, posixpath.dirname(destino))
+            return b'url(' + match.group(1) + nueva.encode() + match.group(1) + b')'
+        return URL_RELATIVA.sub(reubicar, contenido)
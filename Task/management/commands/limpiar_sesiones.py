@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina las sesiones vencidas de django_session por lotes. "
+        "Pensado para ejecutarse desde cron, p. ej.: "
+        "*/30 * * * * python manage.py limpiar_sesiones"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Sesiones a borrar por consulta.')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        pausa = options['pausa']
+        ahora = timezone.now()
+        total = 0
+
+        while True:
+            claves = list(
+                Session.objects.filter(expire_date__lt=ahora)
+                .values_list('session_key', flat=True)[:lote]
+            )
+            if not claves:
+                break
+            borradas, _ = Session.objects.filter(session_key__in=claves).delete()
+            total += borradas
+            if pausa:
+                time.sleep(pausa)
+
+        self.stdout.write(self.style.SUCCESS(f"{total} sesiones vencidas eliminadas."))
@@ -0,0 +1,85 @@
+import datetime
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from Task import pronostico, versiones
+from Task.models import DetallesVenta, DetallesVentaArchivo, Productos
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula Productos.stock_minimo de todo el catálogo a partir de las ventas "
+        "diarias (ver Task/pronostico.py). Los productos sin ventas en la ventana "
+        "conservan su stock_minimo. Pensado para cron, p. ej.: "
+        "30 3 * * * python manage.py pronosticar_stock"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help='Días de historial a considerar.')
+        parser.add_argument('--vida-media', type=float, default=14, help='Días en que el peso de una venta se reduce a la mitad.')
+        parser.add_argument('--demora', type=float, default=3, help='Días que tarda en llegar una reposición.')
+        parser.add_argument('--z', type=float, default=1.65, help='Factor de stock de seguridad (1.65 ≈ 95%% de servicio).')
+        parser.add_argument('--minimo', type=int, default=1, help='stock_minimo más bajo permitido.')
+        parser.add_argument('--simular', action='store_true', help='Calcula y muestra el resumen sin guardar.')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1 or options['vida_media'] <= 0 or options['demora'] <= 0:
+            raise CommandError("--dias, --vida-media y --demora deben ser positivos.")
+        inicio = time.monotonic()
+        dias = options['dias']
+        hoy = timezone.localdate()
+        desde = hoy - datetime.timedelta(days=dias - 1)
+        # Límite con zona horaria: así la base puede usar el índice de fecha_venta
+        inicio_ventana = timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min))
+
+        actuales = np.array(Productos.objects.order_by('pk').values_list('pk', 'stock_minimo'), dtype=np.int64).reshape(-1, 2)
+        if not len(actuales):
+            self.stdout.write("No hay productos.")
+            return
+        ids = actuales[:, 0]
+
+        matriz = pronostico.matriz_de_ventas(ids, dias, self._ventas_diarias(desde, inicio_ventana))
+        nuevos = pronostico.puntos_de_pedido(
+            matriz, options['vida_media'], options['demora'], options['z'], options['minimo'],
+        )
+
+        # Sin historial no hay pronóstico: no se pisa el stock_minimo cargado a mano
+        con_ventas = matriz.any(axis=1)
+        cambian = np.flatnonzero(con_ventas & (nuevos != actuales[:, 1]))
+        self.stdout.write(
+            f"{len(ids)} productos, {dias} días: {len(ids) - int(con_ventas.sum())} sin ventas, "
+            f"{len(cambian)} cambian de stock_minimo "
+            f"({time.monotonic() - inicio:.2f} s de cálculo)."
+        )
+        if options['simular'] or not len(cambian):
+            return
+
+        Productos.objects.bulk_update(
+            [Productos(pk=int(ids[i]), stock_minimo=int(nuevos[i])) for i in cambian],
+            ['stock_minimo'],
+            batch_size=1000,
+        )
+        # bulk_update no dispara señales
+        versiones.incrementar(versiones.CATALOGO)
+        self.stdout.write(self.style.SUCCESS(
+            f"stock_minimo actualizado en {len(cambian)} productos ({time.monotonic() - inicio:.2f} s en total)."
+        ))
+
+    def _ventas_diarias(self, desde, inicio_ventana):
+        """(id_producto, índice de día, unidades) de las ventas vivas y archivadas, agrupadas en la base."""
+        for modelo in (DetallesVenta, DetallesVentaArchivo):
+            filas = (
+                modelo.objects
+                .filter(id_venta__fecha_venta__gte=inicio_ventana, id_producto__isnull=False)
+                .annotate(dia=TruncDate('id_venta__fecha_venta'))
+                .values_list('id_producto', 'dia')
+                .annotate(unidades=Sum('cantidad'))
+                .order_by()
+            )
+            for producto, dia, unidades in filas.iterator(chunk_size=5000):
+                yield producto, (dia - desde).days, unidades
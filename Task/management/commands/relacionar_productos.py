@@ -0,0 +1,71 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from Task.models import DetallesVenta, DetallesVentaArchivo, ProductoRelacionado, Ventas, VentasArchivo
+from Task.relacionados import CoOcurrencias, canastas, filas_relacionadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula los productos comprados juntos (ver Task/relacionados.py) recorriendo las "
+        "ventas vivas y archivadas de a lotes. Pensado para cron, p. ej.: "
+        "45 3 * * * python manage.py relacionar_productos"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Productos relacionados a guardar por producto.')
+        parser.add_argument('--minimo', type=int, default=2, help='Ventas juntas mínimas para relacionar dos productos.')
+        parser.add_argument('--dias', type=int, help='Solo las ventas de los últimos N días (por defecto, todas).')
+        parser.add_argument('--lote', type=int, default=5000, help='Ventas por consulta.')
+        parser.add_argument('--max-pares', type=int, default=2_000_000, help='Pares distintos a mantener en memoria.')
+        parser.add_argument('--max-por-venta', type=int, default=30, help='Las ventas con más productos no cuentan pares.')
+        parser.add_argument('--simular', action='store_true', help='Calcula y muestra el resumen sin guardar.')
+
+    def handle(self, *args, **options):
+        if options['k'] < 1 or options['lote'] < 1 or options['max_pares'] < 1:
+            raise CommandError("--k, --lote y --max-pares deben ser positivos.")
+        inicio = time.monotonic()
+        desde = None
+        if options['dias']:
+            desde = timezone.now() - datetime.timedelta(days=options['dias'])
+
+        conteo = CoOcurrencias(options['max_pares'], options['max_por_venta'])
+        for ventas, detalles in ((Ventas, DetallesVenta), (VentasArchivo, DetallesVentaArchivo)):
+            for productos in canastas(self._lineas(ventas, detalles, desde, options['lote'])):
+                conteo.agregar_venta(productos)
+
+        top = conteo.top_k(options['k'], options['minimo'])
+        self.stdout.write(
+            f"{conteo.ventas} ventas, {len(conteo.pares)} pares en memoria ({conteo.podas} podas), "
+            f"{len(top)} productos con relacionados ({time.monotonic() - inicio:.2f} s de cálculo)."
+        )
+        if options['simular']:
+            return
+
+        with transaction.atomic():
+            ProductoRelacionado.objects.all().delete()
+            creadas = ProductoRelacionado.objects.bulk_create(filas_relacionadas(top), batch_size=1000)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(creadas)} relaciones guardadas ({time.monotonic() - inicio:.2f} s en total)."
+        ))
+
+    def _lineas(self, ventas, detalles, desde, lote):
+        """(id_venta, id_producto) ordenadas por venta, de a `lote` ventas por consulta."""
+        ids_ventas = ventas.objects.order_by('pk').values_list('pk', flat=True)
+        if desde is not None:
+            ids_ventas = ids_ventas.filter(fecha_venta__gte=desde)
+        ultimo = 0
+        while True:
+            ids = list(ids_ventas.filter(pk__gt=ultimo)[:lote])
+            if not ids:
+                return
+            # Por rango y no por lista: el índice de id_venta alcanza y la consulta queda corta
+            lineas = detalles.objects.filter(id_venta__gte=ids[0], id_venta__lte=ids[-1], id_producto__isnull=False)
+            if desde is not None:
+                lineas = lineas.filter(id_venta__fecha_venta__gte=desde)
+            yield from lineas.order_by('id_venta').values_list('id_venta', 'id_producto')
+            ultimo = ids[-1]
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery, Sum
+
+from Task import versiones
+from Task.models import Productos, StockSucursal, Sucursales
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula Productos.stock como la suma de stock_sucursal. Con --inicial --sucursal N "
+        "primero carga en la sucursal N el stock actual de los productos que todavía no tienen "
+        "stock por sucursal (la primera vez, después de crear la tabla)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicial', action='store_true', help='Carga el stock de los productos sin filas en stock_sucursal.')
+        parser.add_argument('--sucursal', type=int, help='Sucursal que recibe el stock con --inicial.')
+        parser.add_argument('--lote', type=int, default=1000, help='Productos por consulta.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        if options['inicial']:
+            if options['sucursal'] is None:
+                raise CommandError("--inicial requiere --sucursal.")
+            if not Sucursales.objects.filter(pk=options['sucursal']).exists():
+                raise CommandError(f"La sucursal {options['sucursal']} no existe.")
+            cargados = self._inicial(options['sucursal'], lote)
+            self.stdout.write(f"{cargados} productos cargados en la sucursal {options['sucursal']}.")
+
+        sin_filas = Productos.objects.exclude(pk__in=StockSucursal.objects.values('id_producto')).count()
+        if sin_filas:
+            self.stdout.write(self.style.WARNING(
+                f"{sin_filas} productos no tienen stock por sucursal; cargarlos con --inicial --sucursal N."
+            ))
+        corregidos = self._totales(lote)
+        if corregidos:
+            # update() no dispara señales
+            versiones.incrementar(versiones.CATALOGO)
+        self.stdout.write(self.style.SUCCESS(f"Productos.stock corregido en {corregidos} productos."))
+
+    def _inicial(self, sucursal, lote):
+        sin_filas = (
+            Productos.objects
+            .exclude(pk__in=StockSucursal.objects.values('id_producto'))
+            .order_by('pk')
+        )
+        total = 0
+        ultimo = 0
+        while True:
+            with transaction.atomic():
+                # Bloqueados para que no se venda nada entre la lectura y la carga
+                filas = list(sin_filas.select_for_update().filter(pk__gt=ultimo).values_list('pk', 'stock')[:lote])
+                if not filas:
+                    return total
+                StockSucursal.objects.bulk_create(
+                    [StockSucursal(id_producto_id=pk, id_sucursal_id=sucursal, stock=stock or 0) for pk, stock in filas],
+                    ignore_conflicts=True,
+                )
+            ultimo = filas[-1][0]
+            total += len(filas)
+
+    def _totales(self, lote):
+        suma = Subquery(
+            StockSucursal.objects
+            .filter(id_producto=OuterRef('pk'))
+            .values('id_producto')
+            .annotate(total=Sum('stock'))
+            .values('total'),
+            output_field=IntegerField(),
+        )
+        # Los productos sin filas se dejan como están hasta cargarlos con --inicial
+        distintos = (
+            Productos.objects
+            .filter(pk__in=StockSucursal.objects.values('id_producto'))
+            .annotate(suma=suma)
+            .filter(~Q(stock=F('suma')) | Q(stock__isnull=True))
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        total = 0
+        ultimo = 0
+        while True:
+            ids = list(distintos.filter(pk__gt=ultimo)[:lote])
+            if not ids:
+                return total
+            ultimo = ids[-1]
+            # La suma se calcula en el mismo UPDATE para no pisar ventas que confirmen entremedio
+            Productos.objects.filter(pk__in=ids).update(stock=suma)
+            total += len(ids)
@@ -5,6 +5,7 @@
 #   * Make sure each ForeignKey and OneToOneField has `on_delete` set to the desired behavior
 #   * Remove `managed = False` lines if you wish to allow Django to create, modify, and delete the table
 # Feel free to rename the models, but don't rename db_table values or field names.
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 
@@ -95,6 +96,7 @@ class DetallesVenta(models.Model):
     id_producto = models.ForeignKey('Productos', on_delete=models.DO_NOTHING, db_column='id_producto', null=True, blank=True)
     cantidad = models.IntegerField()
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text='Descuento de promociones sobre el subtotal')
 
     class Meta:
         managed = False
@@ -180,6 +182,7 @@ class Productos(models.Model):
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.IntegerField()
     stock_minimo = models.IntegerField(default=5, help_text='Stock mínimo antes de mostrar alerta')
+    codigo_barras = models.CharField(max_length=32, unique=True, blank=True, null=True)
 
     class Meta:
         managed = True
@@ -241,7 +244,7 @@ class Ventas(models.Model):
         blank=True
     )
     nombre_cliente = models.CharField(max_length=100, blank=True, null=True)
-    fecha_venta = models.DateTimeField(default=timezone.now)  # Se asigna automáticamente al crear
+    fecha_venta = models.DateTimeField(default=timezone.now, db_index=True)  # Se asigna automáticamente al crear
     total_venta = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     metodo_pago = models.CharField(max_length=20, choices=METODO_PAGO_CHOICES, default='Efectivo')
@@ -252,4 +255,240 @@ class Ventas(models.Model):
         db_table = 'ventas'
 
     def __str__(self):
-        return f"Venta #{self.id_venta} - Total: {self.total_venta}"
\ No newline at end of file
+        return f"Venta #{self.id_venta} - Total: {self.total_venta}"
+
+
+# ===== Archivo de ventas =====
+# Copia de ventas/detalles_venta para las ventas de turnos cerrados con más de N meses
+# (ver `manage.py archivar_ventas`). Conservan los mismos id y no tienen claves foráneas
+# reales hacia las tablas vivas, así el archivo no frena los borrados ni los ALTER de éstas.
+
+class VentasArchivo(models.Model):
+    archivada = True
+
+    id_venta = models.IntegerField(primary_key=True)
+    id_turno = models.ForeignKey(
+        'TurnosCaja',
+        on_delete=models.DO_NOTHING,
+        db_column='id_turno',
+        db_constraint=False,
+        null=True,
+        blank=True,
+    )
+    nombre_cliente = models.CharField(max_length=100, blank=True, null=True)
+    fecha_venta = models.DateTimeField(db_index=True)
+    total_venta = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    metodo_pago = models.CharField(max_length=20, choices=Ventas.METODO_PAGO_CHOICES, default='Efectivo')
+    vuelto = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'ventas_archivo'
+
+    def __str__(self):
+        return f"Venta #{self.id_venta} (archivada) - Total: {self.total_venta}"
+
+
+class DetallesVentaArchivo(models.Model):
+    id_detalle = models.IntegerField(primary_key=True)
+    id_venta = models.ForeignKey('VentasArchivo', on_delete=models.CASCADE, db_column='id_venta', null=True, blank=True)
+    id_producto = models.ForeignKey(
+        'Productos',
+        on_delete=models.DO_NOTHING,
+        db_column='id_producto',
+        db_constraint=False,
+        null=True,
+        blank=True,
+    )
+    cantidad = models.IntegerField()
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'detalles_venta_archivo'
+
+
+# ===== Kardex =====
+# Libro de movimientos de stock de solo agregado (ver Task/kardex.py). Cada cambio de
+# Productos.stock deja una fila con su delta firmado; los checkpoints guardan el stock
+# de cada producto en un instante para no sumar el historial completo.
+
+class MovimientoStock(models.Model):
+    VENTA = 'venta'
+    EDICION_VENTA = 'edicion_venta'
+    ANULACION = 'anulacion'
+    AJUSTE = 'ajuste'
+    REPOSICION = 'reposicion'
+    INVENTARIO = 'inventario'
+    TIPO_CHOICES = [
+        (VENTA, 'Venta'),
+        (EDICION_VENTA, 'Edición de venta'),
+        (ANULACION, 'Anulación de venta'),
+        (AJUSTE, 'Ajuste manual'),
+        (REPOSICION, 'Reposición'),
+        (INVENTARIO, 'Toma de inventario'),
+    ]
+
+    id_movimiento = models.BigAutoField(primary_key=True)
+    id_producto = models.ForeignKey(
+        'Productos',
+        on_delete=models.DO_NOTHING,
+        db_column='id_producto',
+        db_constraint=False,
+    )
+    fecha = models.DateTimeField(default=timezone.now)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    cantidad = models.IntegerField(help_text='Delta de stock: negativo sale, positivo entra')
+    id_venta = models.IntegerField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'movimientos_stock'
+        indexes = [models.Index(fields=['id_producto', 'fecha'], name='mov_stock_producto_fecha')]
+
+
+class CheckpointStock(models.Model):
+    id_checkpoint = models.BigAutoField(primary_key=True)
+    id_producto = models.ForeignKey(
+        'Productos',
+        on_delete=models.DO_NOTHING,
+        db_column='id_producto',
+        db_constraint=False,
+    )
+    fecha = models.DateTimeField()
+    stock = models.IntegerField()
+
+    class Meta:
+        managed = True
+        db_table = 'checkpoints_stock'
+        unique_together = (('id_producto', 'fecha'),)
+
+
+# ===== Stock por sucursal =====
+# Cada sucursal descuenta de su propia fila, así las ventas de distintas sucursales no
+# compiten por el mismo bloqueo. Productos.stock queda como el total de todas las
+# sucursales, actualizado después de cada commit (ver VentasApp/stock.py).
+
+class StockSucursal(models.Model):
+    id_producto = models.ForeignKey('Productos', on_delete=models.CASCADE, db_column='id_producto')
+    id_sucursal = models.ForeignKey('Sucursales', on_delete=models.DO_NOTHING, db_column='id_sucursal')
+    stock = models.IntegerField(default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'stock_sucursal'
+        unique_together = (('id_producto', 'id_sucursal'),)
+
+
+# ===== Promociones =====
+# Reglas de descuento que se aplican solas al registrar una venta (ver Task/promociones.py).
+# Una promoción por porcentaje sobre muchos productos hace las veces de descuento por rubro.
+
+class Promociones(models.Model):
+    PORCENTAJE = 'porcentaje'
+    LLEVA_PAGA = 'lleva_paga'
+    COMBO = 'combo'
+    TIPO_CHOICES = [
+        (PORCENTAJE, 'Porcentaje de descuento'),
+        (LLEVA_PAGA, 'Lleva N, paga M'),
+        (COMBO, 'Combo de productos'),
+    ]
+
+    id_promocion = models.AutoField(primary_key=True)
+    nombre = models.CharField(max_length=100)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    porcentaje = models.DecimalField(
+        max_digits=5, decimal_places=2, blank=True, null=True,
+        help_text='Para porcentaje y combo: cuánto se descuenta de cada producto',
+    )
+    lleva = models.PositiveSmallIntegerField(blank=True, null=True)
+    paga = models.PositiveSmallIntegerField(blank=True, null=True)
+    productos = models.ManyToManyField('Productos', db_table='promociones_productos', related_name='promociones')
+    desde = models.DateTimeField(blank=True, null=True)
+    hasta = models.DateTimeField(blank=True, null=True)
+    activa = models.BooleanField(default=True)
+
+    class Meta:
+        managed = True
+        db_table = 'promociones'
+
+    def __str__(self):
+        return self.nombre
+
+    def clean(self):
+        if self.tipo in (self.PORCENTAJE, self.COMBO) and not (self.porcentaje and 0 < self.porcentaje <= 100):
+            raise ValidationError({'porcentaje': 'Indica un porcentaje entre 0 y 100.'})
+        if self.tipo == self.LLEVA_PAGA and not (self.lleva and self.paga is not None and self.paga < self.lleva):
+            raise ValidationError({'paga': 'Debe pagar menos unidades de las que lleva.'})
+        if self.desde and self.hasta and self.hasta <= self.desde:
+            raise ValidationError({'hasta': 'La fecha de fin debe ser posterior a la de inicio.'})
+
+
+# ===== Productos relacionados =====
+# "Comprados juntos": los k productos que más aparecen en las mismas ventas que cada
+# producto, ya ordenados. Lo arma `manage.py relacionar_productos`.
+
+class ProductoRelacionado(models.Model):
+    id_producto = models.ForeignKey('Productos', on_delete=models.CASCADE, db_column='id_producto', related_name='relacionados')
+    posicion = models.PositiveSmallIntegerField()
+    id_relacionado = models.ForeignKey('Productos', on_delete=models.CASCADE, db_column='id_relacionado', related_name='+')
+    veces = models.IntegerField(help_text='Ventas en las que aparecen juntos')
+    puntaje = models.FloatField()
+
+    class Meta:
+        managed = True
+        db_table = 'productos_relacionados'
+        unique_together = (('id_producto', 'posicion'),)
+
+
+# ===== Toma de inventario =====
+# Conteo físico de una sucursal (ver Task/inventario.py). Al iniciar se copia el stock de
+# cada producto; los conteos se cargan de a lotes y al aplicar se ajusta la diferencia
+# contra esa copia menos lo vendido desde entonces, sin frenar las ventas.
+
+class TomaInventario(models.Model):
+    id_toma = models.AutoField(primary_key=True)
+    id_sucursal = models.ForeignKey('Sucursales', on_delete=models.DO_NOTHING, db_column='id_sucursal')
+    fecha_inicio = models.DateTimeField(default=timezone.now)
+    fecha_aplicada = models.DateTimeField(blank=True, null=True)
+    id_user = models.ForeignKey('AuthUser', on_delete=models.DO_NOTHING, db_column='id_user', blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'tomas_inventario'
+
+    def __str__(self):
+        return f"Toma #{self.id_toma}"
+
+    @property
+    def abierta(self):
+        return self.fecha_aplicada is None
+
+
+class ConteoInventario(models.Model):
+    id_toma = models.ForeignKey('TomaInventario', on_delete=models.CASCADE, db_column='id_toma', related_name='conteos')
+    id_producto = models.ForeignKey('Productos', on_delete=models.CASCADE, db_column='id_producto')
+    stock_inicial = models.IntegerField(help_text='Stock de la sucursal al iniciar la toma')
+    contado = models.IntegerField(blank=True, null=True)
+    fecha_conteo = models.DateTimeField(blank=True, null=True)
+    ajuste = models.IntegerField(blank=True, null=True, help_text='Delta aplicado al cerrar la toma')
+
+    class Meta:
+        managed = True
+        db_table = 'conteos_inventario'
+        unique_together = (('id_toma', 'id_producto'),)
+
+
+# ===== Versiones de datos =====
+# Contadores compartidos por todos los procesos (ver Task/versiones.py). Cada worker los
+# lee una vez por request y descarta lo que tenga cacheado de los namespaces que cambiaron.
+
+class VersionDatos(models.Model):
+    nombre = models.CharField(primary_key=True, max_length=30)
+    version = models.BigIntegerField()
+
+    class Meta:
+        managed = True
+        db_table = 'versiones_datos'
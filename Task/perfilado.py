@@ -0,0 +1,177 @@
+"""
+Perfilado de requests en producción.
+
+Con PERFILADO_DIR configurado, un usuario con la capacidad 'ver_perfiles' (los
+administradores, ver Task/permisos.py) que agrega ?perfilar=1 a la URL o manda el header
+X-Perfilar corre ese request bajo cProfile y con cada consulta SQL medida.
+Cada perfil queda en el directorio como <id>.prof (formato pstats: se abre con snakeviz
+o se pasa a flamegraph con flameprof) y <id>.json con la ruta, los tiempos y el SQL.
+Solo se guardan los últimos PERFILADO_MAXIMO; la página /perfiles/ los lista.
+
+Sin PERFILADO_DIR el middleware no se carga, así que no agrega nada a cada request. Las
+respuestas en streaming se miden hasta que la vista devuelve, sin el contenido que se
+genera al enviarlas.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from .permisos import tiene_capacidad
+
+PARAMETRO = 'perfilar'
+HEADER = 'HTTP_X_PERFILAR'
+HEADER_RESPUESTA = 'X-Perfil'
+# Consultas que se guardan una por una; el resumen por consulta repetida las cuenta todas
+MAX_CONSULTAS = 500
+_ID = re.compile(r'^\d+$')
+
+
+def directorio():
+    return Path(settings.PERFILADO_DIR) if settings.PERFILADO_DIR else None
+
+
+class PerfilarMiddleware:
+    def __init__(self, get_response):
+        if not settings.PERFILADO_DIR:
+            raise MiddlewareNotUsed
+        directorio().mkdir(parents=True, exist_ok=True)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # El usuario se mira al final, para no cargarlo en requests que no lo pidieron
+        if (HEADER in request.META or PARAMETRO in request.GET) and tiene_capacidad(request.user, 'ver_perfiles'):
+            return _perfilar(request, self.get_response)
+        return self.get_response(request)
+
+
+def _perfilar(request, get_response):
+    consultas = []
+
+    def medir(execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            consultas.append((context['connection'].alias, sql, (time.perf_counter() - inicio) * 1000))
+
+    perfil = cProfile.Profile()
+    inicio = time.perf_counter()
+    with ExitStack() as pila:
+        for conexion in connections.all():
+            pila.enter_context(conexion.execute_wrapper(medir))
+        perfil.enable()
+        try:
+            response = get_response(request)
+        finally:
+            perfil.disable()
+    ms = (time.perf_counter() - inicio) * 1000
+
+    response[HEADER_RESPUESTA] = _guardar(request, response, perfil, consultas, ms)
+    return response
+
+
+def _guardar(request, response, perfil, consultas, ms):
+    carpeta = directorio()
+    ident = str(time.time_ns())
+    perfil.dump_stats(carpeta / f'{ident}.prof')
+
+    repetidas = defaultdict(lambda: [0, 0.0])
+    for _, sql, duracion in consultas:
+        repetidas[sql][0] += 1
+        repetidas[sql][1] += duracion
+    datos = {
+        'id': ident,
+        'fecha': timezone.now().isoformat(),
+        'metodo': request.method,
+        'ruta': request.get_full_path(),
+        'usuario': request.user.get_username(),
+        'estado': response.status_code,
+        'ms': round(ms, 1),
+        'consultas': len(consultas),
+        'sql_ms': round(sum(duracion for _, _, duracion in consultas), 1),
+        # Sin parámetros: pueden traer datos de clientes
+        'sql': [
+            {'base': base, 'sql': sql, 'ms': round(duracion, 3)}
+            for base, sql, duracion in consultas[:MAX_CONSULTAS]
+        ],
+        'repetidas': sorted(
+            ({'sql': sql, 'veces': veces, 'ms': round(total, 3)} for sql, (veces, total) in repetidas.items()),
+            key=lambda fila: fila['ms'], reverse=True,
+        )[:20],
+    }
+    # Se escribe aparte y se renombra: la lista nunca lee un JSON a medias
+    temporal = carpeta / f'{ident}.json.tmp'
+    temporal.write_text(json.dumps(datos), encoding='utf-8')
+    os.replace(temporal, carpeta / f'{ident}.json')
+    _recortar(carpeta)
+    return ident
+
+
+def _recortar(carpeta):
+    """Deja solo los últimos PERFILADO_MAXIMO perfiles."""
+    viejos = sorted(carpeta.glob('*.json'), key=lambda ruta: int(ruta.stem), reverse=True)[settings.PERFILADO_MAXIMO:]
+    for ruta in viejos:
+        # Otro worker puede estar recortando a la vez
+        ruta.unlink(missing_ok=True)
+        ruta.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def recientes():
+    """Resumen de los perfiles guardados, del más nuevo al más viejo."""
+    carpeta = directorio()
+    if carpeta is None or not carpeta.exists():
+        return []
+    resultado = []
+    for ruta in sorted(carpeta.glob('*.json'), key=lambda ruta: int(ruta.stem), reverse=True):
+        try:
+            datos = json.loads(ruta.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            continue
+        datos.pop('sql')
+        datos.pop('repetidas')
+        resultado.append(datos)
+    return resultado
+
+
+def ruta_prof(ident):
+    """Ruta del .prof de un perfil, o None si el id no es válido o ya se recortó."""
+    carpeta = directorio()
+    if carpeta is None or not _ID.match(ident):
+        return None
+    ruta = carpeta / f'{ident}.prof'
+    return ruta if ruta.exists() else None
+
+
+def detalle(ident, funciones=40):
+    """Datos del perfil y sus `funciones` más costosas por tiempo acumulado, o None."""
+    ruta = ruta_prof(ident)
+    if ruta is None:
+        return None
+    try:
+        datos = json.loads(ruta.with_suffix('.json').read_text(encoding='utf-8'))
+        stats = pstats.Stats(str(ruta)).stats
+    except FileNotFoundError:
+        return None
+    filas = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:funciones]
+    datos['funciones'] = [
+        {
+            'funcion': funcion,
+            'archivo': f'{archivo}:{linea}',
+            'llamadas': llamadas,
+            'propio_ms': round(propio * 1000, 2),
+            'acumulado_ms': round(acumulado * 1000, 2),
+        }
+        for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in filas
+    ]
+    return datos
@@ -0,0 +1,84 @@
+"""
+Resolución de roles y capacidades por usuario.
+
+El mapa de roles de cada usuario (grupo -> capacidades) se guarda en la cache bajo la
+versión ROLES, que las señales de Task.signals incrementan cuando cambian los grupos de
+cualquier usuario; así los demás workers también dejan de usar el mapa viejo y los
+chequeos de permisos no hacen consultas extra mientras el mapa esté caliente.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+from . import versiones
+from .models import AuthUserGroups
+
+ROLES = [('vendedor', 'Vendedor'), ('administrador', 'Administrador')]
+
+CAPACIDADES_POR_ROL = {
+    'administrador': frozenset({
+        'gestionar_usuarios',
+        'editar_ventas',
+        'eliminar_ventas',
+        'tomar_inventario',
+        'ver_perfiles',
+    }),
+    'vendedor': frozenset(),
+}
+
+
+def _clave(user_id):
+    return f'permisos:roles:{versiones.version(versiones.ROLES)}:{user_id}'
+
+
+def mapa_de_roles(user_id):
+    """Devuelve {'roles': [...], 'capacidades': frozenset} del usuario, cacheado."""
+    mapa = cache.get(_clave(user_id))
+    if mapa is None:
+        roles = list(
+            AuthUserGroups.objects.filter(user_id=user_id)
+            .order_by('id')
+            .values_list('group__name', flat=True)
+        )
+        capacidades = frozenset().union(*(CAPACIDADES_POR_ROL.get(rol, ()) for rol in roles))
+        mapa = {'roles': roles, 'capacidades': capacidades}
+        cache.set(_clave(user_id), mapa, settings.SESSION_COOKIE_AGE)
+    return mapa
+
+
+def rol_principal(user_id):
+    roles = mapa_de_roles(user_id)['roles']
+    return roles[0] if roles else None
+
+
+def invalidar_roles():
+    # Los cambios de grupos son raros: se descartan los mapas de todos los usuarios
+    versiones.incrementar(versiones.ROLES)
+
+
+def tiene_capacidad(user, capacidad):
+    """
+    Superusuarios tienen todo y staff conserva las capacidades de administrador
+    sin consultar grupos; el resto se resuelve con el mapa cacheado.
+    """
+    if not user.is_authenticated or not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    if user.is_staff and capacidad in CAPACIDADES_POR_ROL['administrador']:
+        return True
+    return capacidad in mapa_de_roles(user.pk)['capacidades']
+
+
+def requiere_capacidad(capacidad, mensaje="No tienes permiso para realizar esta acción."):
+    """Decorador de vistas que lanza PermissionDenied si falta la capacidad."""
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if not tiene_capacidad(request.user, capacidad):
+                raise PermissionDenied(mensaje)
+            return vista(request, *args, **kwargs)
+        return envoltura
+    return decorador
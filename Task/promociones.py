@@ -0,0 +1,155 @@
+"""
+Motor de promociones para las ventas.
+
+Las promociones activas se compilan una vez por proceso en un diccionario
+id_producto -> reglas, así evaluar una venta cuesta lo que sus líneas más las reglas
+que tocan a sus productos, sin recorrer todas las promociones. Cualquier cambio en
+Promociones (o en sus productos) incrementa la versión PROMOCIONES y cada proceso
+vuelve a compilar en la siguiente venta.
+
+Las promociones no se acumulan: cada producto se lleva el mayor descuento de las
+reglas que le corresponden. Al editar una venta se usan las promociones vigentes cuando
+se hizo, no las de ahora.
+"""
+import threading
+from collections import Counter, defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import versiones
+from .models import Promociones
+
+CENTAVOS = Decimal('0.01')
+
+
+class Regla:
+    __slots__ = ('id', 'tipo', 'factor', 'lleva', 'paga', 'productos', 'desde', 'hasta')
+
+    def __init__(self, promocion, productos):
+        self.id = promocion.pk
+        self.tipo = promocion.tipo
+        self.factor = (promocion.porcentaje or 0) / Decimal(100)
+        self.lleva = promocion.lleva
+        self.paga = promocion.paga
+        self.productos = frozenset(productos)
+        self.desde = promocion.desde
+        self.hasta = promocion.hasta
+
+    def vigente(self, momento):
+        return (self.desde is None or self.desde <= momento) and (self.hasta is None or momento < self.hasta)
+
+
+class ReglasCompiladas:
+    def __init__(self, version, corte):
+        self.version = version
+        self.corte = corte       # sirven para evaluar cualquier momento desde aquí
+        self.por_producto = {}   # id_producto -> (Regla, ...)
+
+    @classmethod
+    def construir(cls, version, momento=None):
+        compiladas = cls(version, momento or timezone.now())
+        # Las que vencieron antes del corte no hace falta cargarlas; las futuras se filtran al evaluar
+        promociones = (
+            Promociones.objects
+            .filter(activa=True)
+            .filter(Q(hasta__isnull=True) | Q(hasta__gt=compiladas.corte))
+        )
+        productos = defaultdict(list)
+        relacion = Promociones.productos.through.objects.filter(promociones__in=promociones)
+        for promocion_id, producto_id in relacion.values_list('promociones_id', 'productos_id'):
+            productos[promocion_id].append(producto_id)
+
+        por_producto = defaultdict(list)
+        for promocion in promociones:
+            regla = Regla(promocion, productos[promocion.pk])
+            for producto_id in regla.productos:
+                por_producto[producto_id].append(regla)
+        compiladas.por_producto = {pk: tuple(reglas) for pk, reglas in por_producto.items()}
+        return compiladas
+
+    def descuentos(self, lineas, precios, momento=None):
+        """
+        Descuento de cada línea, en el mismo orden. `lineas` son DetallesVenta (o cualquier
+        objeto con id_producto_id y cantidad) y `precios` es {id_producto: precio}.
+        """
+        momento = momento or timezone.now()
+        cantidades = Counter()
+        for linea in lineas:
+            if linea.id_producto_id is not None:
+                cantidades[linea.id_producto_id] += linea.cantidad
+
+        combos = {}
+        por_producto = {}
+        for pk, cantidad in cantidades.items():
+            mejor = Decimal(0)
+            for regla in self.por_producto.get(pk, ()):
+                if not regla.vigente(momento):
+                    continue
+                if regla.tipo == Promociones.PORCENTAJE:
+                    descuento = precios[pk] * cantidad * regla.factor
+                elif regla.tipo == Promociones.LLEVA_PAGA:
+                    descuento = precios[pk] * (cantidad // regla.lleva) * (regla.lleva - regla.paga)
+                else:
+                    if regla.id not in combos:
+                        combos[regla.id] = min(cantidades.get(p, 0) for p in regla.productos)
+                    descuento = precios[pk] * combos[regla.id] * regla.factor
+                mejor = max(mejor, descuento)
+            if mejor:
+                por_producto[pk] = mejor.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+        return _repartir(lineas, cantidades, por_producto)
+
+
+def _repartir(lineas, cantidades, por_producto):
+    """Reparte el descuento de cada producto entre sus líneas según la cantidad."""
+    restante = dict(por_producto)
+    pendientes = Counter(cantidades)
+    resultado = []
+    for linea in lineas:
+        pk = linea.id_producto_id
+        if pk not in restante:
+            resultado.append(Decimal(0))
+            continue
+        pendientes[pk] -= linea.cantidad
+        if pendientes[pk] == 0:
+            # La última línea del producto se lleva lo que queda, sin errores de redondeo
+            descuento = restante[pk]
+        else:
+            descuento = (por_producto[pk] * linea.cantidad / cantidades[pk]).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+        restante[pk] -= descuento
+        resultado.append(descuento)
+    return resultado
+
+
+_compiladas = None
+_lock = threading.Lock()
+
+
+def reglas(momento=None):
+    """
+    Reglas del proceso, recompiladas si cambió alguna promoción. Para un momento anterior
+    a la compilación (una venta vieja) se arman aparte, con las que ya vencieron.
+    """
+    global _compiladas
+    version = versiones.version(versiones.PROMOCIONES)
+    if _compiladas is None or _compiladas.version != version:
+        with _lock:
+            if _compiladas is None or _compiladas.version != version:
+                _compiladas = ReglasCompiladas.construir(version)
+    compiladas = _compiladas
+    if momento is not None and momento < compiladas.corte:
+        return ReglasCompiladas.construir(version, momento)
+    return compiladas
+
+
+def aplicar(lineas, productos, momento=None):
+    """
+    Guarda en cada línea su descuento con las promociones vigentes en `momento` (ahora si
+    no se indica); `productos` es {id_producto: Productos}.
+    """
+    precios = {pk: producto.precio for pk, producto in productos.items()}
+    for linea, descuento in zip(lineas, reglas(momento).descuentos(lineas, precios, momento)):
+        linea.descuento = descuento
+    return sum((linea.descuento for linea in lineas), Decimal(0))
@@ -0,0 +1,46 @@
+"""
+Punto de pedido (stock_minimo) calculado a partir de las ventas diarias.
+
+Todo el catálogo se procesa junto como una matriz productos × días con NumPy: la demanda
+diaria se estima con un promedio móvil exponencial (los días recientes pesan más) y su
+variabilidad con el desvío ponderado de la misma ventana. El punto de pedido cubre la
+demanda esperada durante la demora de reposición más un stock de seguridad:
+
+    punto = media * demora + z * desvío * sqrt(demora)
+"""
+import numpy as np
+
+
+def matriz_de_ventas(productos, dias, filas):
+    """
+    Matriz (len(productos), dias) con las unidades vendidas por producto y día.
+
+    productos: array ordenado de ids; filas: iterable de (id_producto, índice de día,
+    unidades) con el día contado desde el inicio de la ventana.
+    """
+    datos = np.array(list(filas), dtype=np.int64).reshape(-1, 3)
+    matriz = np.zeros((len(productos), dias), dtype=np.float64)
+    if len(datos):
+        posiciones = np.searchsorted(productos, datos[:, 0])
+        validas = (
+            (posiciones < len(productos))
+            & (productos[np.minimum(posiciones, len(productos) - 1)] == datos[:, 0])
+            & (datos[:, 1] >= 0) & (datos[:, 1] < dias)
+        )
+        np.add.at(matriz, (posiciones[validas], datos[validas, 1]), datos[validas, 2])
+    return matriz
+
+
+def puntos_de_pedido(matriz, vida_media, demora, z, minimo):
+    """Array de stock_minimo por fila de la matriz (el último día es la columna final)."""
+    dias = matriz.shape[1]
+    antiguedad = np.arange(dias - 1, -1, -1, dtype=np.float64)
+    pesos = 0.5 ** (antiguedad / vida_media)
+    pesos /= pesos.sum()
+
+    media = matriz @ pesos
+    varianza = ((matriz - media[:, None]) ** 2) @ pesos
+    punto = media * demora + z * np.sqrt(varianza) * np.sqrt(demora)
+    # Se redondea antes del techo: el ruido de punto flotante (una varianza de 1e-31 con
+    # demanda constante) no debe subir una unidad el punto de pedido
+    return np.maximum(np.ceil(np.round(punto, 6)), minimo).astype(np.int64)
@@ -0,0 +1,91 @@
+"""
+Productos comprados juntos.
+
+`manage.py relacionar_productos` recorre las líneas de venta agrupadas por venta y va
+sumando, para cada par de productos, en cuántas ventas aparecen juntos: una matriz de
+co-ocurrencia dispersa guardada como Counter de pares. Para que la memoria no crezca
+con los años de historial, cuando hay más de `max_pares` pares se descartan los menos
+frecuentes (conteo con pérdida: un par descartado que vuelve a aparecer empieza de cero,
+lo que solo afecta a pares raros que igual no llegarían al top k).
+
+El puntaje es la similitud coseno entre productos, veces / sqrt(ventas_a * ventas_b),
+para que los productos que están en casi todas las ventas no se recomienden a todos.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from .models import ProductoRelacionado
+
+
+class CoOcurrencias:
+    def __init__(self, max_pares=2_000_000, max_por_venta=30):
+        self.max_pares = max_pares
+        self.max_por_venta = max_por_venta
+        self.pares = Counter()        # (id menor, id mayor) -> ventas en que aparecen juntos
+        self.apariciones = Counter()  # id -> ventas en que aparece
+        self.ventas = 0
+        self.podas = 0
+        self._umbral = 0
+
+    def agregar_venta(self, productos):
+        productos = sorted(set(productos))
+        self.ventas += 1
+        self.apariciones.update(productos)
+        # Las ventas muy grandes (mayoristas, cargas masivas) agregarían n² pares sin aportar
+        if len(productos) < 2 or len(productos) > self.max_por_venta:
+            return
+        self.pares.update(combinations(productos, 2))
+        if len(self.pares) > self.max_pares:
+            self._podar()
+
+    def _podar(self):
+        # Se sube el umbral hasta bajar a 3/4 del máximo, para no podar en cada venta
+        while len(self.pares) > self.max_pares * 3 // 4:
+            self._umbral += 1
+            self.pares = Counter({par: n for par, n in self.pares.items() if n > self._umbral})
+        self.podas += 1
+
+    def top_k(self, k, minimo=2):
+        """{id: [(id relacionado, veces, puntaje), ...]} con los k mejores de cada producto."""
+        vecinos = defaultdict(list)
+        for (a, b), veces in self.pares.items():
+            if veces < minimo:
+                continue
+            puntaje = veces / math.sqrt(self.apariciones[a] * self.apariciones[b])
+            vecinos[a].append((puntaje, veces, b))
+            vecinos[b].append((puntaje, veces, a))
+        return {
+            pk: [(otro, veces, puntaje) for puntaje, veces, otro in heapq.nlargest(k, candidatos)]
+            for pk, candidatos in vecinos.items()
+        }
+
+
+def canastas(filas):
+    """Agrupa (id_venta, id_producto) ordenadas por venta en listas de productos por venta."""
+    for _, grupo in groupby(filas, key=itemgetter(0)):
+        yield [producto for _, producto in grupo]
+
+
+def filas_relacionadas(top):
+    """Filas de ProductoRelacionado a partir del resultado de CoOcurrencias.top_k."""
+    for pk, relacionados in top.items():
+        for posicion, (otro, veces, puntaje) in enumerate(relacionados, start=1):
+            yield ProductoRelacionado(
+                id_producto_id=pk, posicion=posicion, id_relacionado_id=otro, veces=veces, puntaje=puntaje,
+            )
+
+
+def de_producto(pk, k=5):
+    """Los k productos más comprados junto con `pk`, en una consulta por índice."""
+    return [
+        fila.id_relacionado
+        for fila in (
+            ProductoRelacionado.objects
+            .filter(id_producto=pk)
+            .select_related('id_relacionado')
+            .order_by('posicion')[:k]
+        )
+    ]
@@ -0,0 +1,83 @@
+"""
+Lecturas en la réplica.
+
+Solo las vistas marcadas con @solo_lectura leen de la réplica ('replica' en DATABASES);
+todo lo demás, y cualquier escritura, va a 'default'. Si no hay réplica configurada
+todo va a 'default'.
+
+Para que cada usuario vea sus propios cambios (read-your-writes):
+- dentro de un request, después de la primera escritura las lecturas vuelven a 'default';
+- FijarPrimariaMiddleware deja una cookie por REPLICA_FIJACION_SEGUNDOS después de un
+  request que escribió, y mientras exista las vistas @solo_lectura leen de 'default'.
+
+No marcar vistas que llenan caches por versión (fragmentos {% cache %}, versiones.cacheado,
+el índice de búsqueda, los roles): con la réplica atrasada quedaría cacheado un dato viejo
+bajo la versión nueva.
+"""
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+REPLICA = 'replica'
+COOKIE_PRIMARIA = 'lamonona_primaria'
+
+_leer_de_replica = ContextVar('leer_de_replica', default=False)
+_escribio = ContextVar('escribio', default=False)
+
+
+def hay_replica():
+    return REPLICA in settings.DATABASES
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        if _leer_de_replica.get() and not _escribio.get() and hay_replica():
+            return REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _escribio.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Son la misma base; una instancia leída de la réplica se puede relacionar con otra de 'default'
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+def solo_lectura(vista):
+    """Lee de la réplica durante la vista, salvo en POST o si el navegador escribió hace poco."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.COOKIES.get(COOKIE_PRIMARIA):
+            return vista(request, *args, **kwargs)
+        token = _leer_de_replica.set(True)
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            _leer_de_replica.reset(token)
+    return envoltura
+
+
+class FijarPrimariaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _escribio.set(False)
+        try:
+            response = self.get_response(request)
+            escribio = _escribio.get()
+        finally:
+            _escribio.reset(token)
+        if escribio and hay_replica():
+            response.set_cookie(
+                COOKIE_PRIMARIA, '1',
+                max_age=settings.REPLICA_FIJACION_SEGUNDOS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import busqueda, codigos, versiones
+from .models import AuthUserGroups, Cajas, DetallesVenta, Productos, Promociones, Sucursales, TurnosCaja, Ventas
+from .permisos import invalidar_roles
+
+
+@receiver([post_save, post_delete], sender=AuthUserGroups)
+def invalidar_roles_por_grupo(sender, **kwargs):
+    invalidar_roles()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_roles_por_m2m(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidar_roles()
+
+
+@receiver([post_save, post_delete], sender=Productos)
+def invalidar_catalogo(sender, **kwargs):
+    versiones.incrementar(versiones.CATALOGO)
+
+
+@receiver(post_save, sender=Productos)
+def indexar_producto(sender, instance, **kwargs):
+    busqueda.producto_guardado(instance)
+
+
+@receiver(post_delete, sender=Productos)
+def desindexar_producto(sender, instance, **kwargs):
+    busqueda.producto_borrado(instance.pk)
+
+
+@receiver(post_save, sender=Productos)
+def actualizar_codigo(sender, instance, **kwargs):
+    # Se copia ahora: el stock que mueva la misma transacción llega aparte (codigos.stock_movido)
+    fila = (instance.pk, instance.codigo_barras, instance.nombre_producto, instance.precio, instance.stock)
+    codigos.producto_guardado(*fila)
+
+
+@receiver(post_delete, sender=Productos)
+def quitar_codigo(sender, instance, **kwargs):
+    codigos.producto_borrado(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Ventas)
+@receiver([post_save, post_delete], sender=DetallesVenta)
+def invalidar_ventas(sender, **kwargs):
+    versiones.incrementar(versiones.VENTAS)
+
+
+@receiver([post_save, post_delete], sender=Cajas)
+@receiver([post_save, post_delete], sender=TurnosCaja)
+def invalidar_cajas(sender, **kwargs):
+    versiones.incrementar(versiones.CAJAS)
+
+
+@receiver([post_save, post_delete], sender=Sucursales)
+def invalidar_sucursales(sender, **kwargs):
+    versiones.incrementar(versiones.SUCURSALES)
+
+
+@receiver([post_save, post_delete], sender=Promociones)
+@receiver(m2m_changed, sender=Promociones.productos.through)
+def invalidar_promociones(sender, **kwargs):
+    versiones.incrementar(versiones.PROMOCIONES)
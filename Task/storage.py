@@ -0,0 +1,50 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él solo se generan los .gz
+    brotli = None
+
+
+class ManifestComprimidoStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage que además deja junto a cada archivo con hash su versión
+    .gz (y .br si está instalado brotli), para que el servidor web los sirva
+    precomprimidos con cache de larga duración.
+    """
+    extensiones_comprimibles = ('.css', '.js', '.json', '.svg', '.ttf', '.txt')
+    tamano_minimo = 512
+
+    def post_process(self, paths, dry_run=False, **options):
+        procesados = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                procesados.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        for hashed_name in procesados:
+            if hashed_name.endswith(self.extensiones_comprimibles):
+                self._comprimir(hashed_name)
+
+    def _comprimir(self, name):
+        ruta = self.path(name)
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+        if len(contenido) < self.tamano_minimo:
+            return
+
+        variantes = [('.gz', gzip.compress(contenido, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variantes.append(('.br', brotli.compress(contenido)))
+
+        for extension, comprimido in variantes:
+            if len(comprimido) < len(contenido):
+                with open(ruta + extension, 'wb') as f:
+                    f.write(comprimido)
+            elif os.path.exists(ruta + extension):
+                os.remove(ruta + extension)
@@ -0,0 +1,30 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from Task.assets import LIBRERIAS, PAQUETES, ruta_paquete
+
+register = template.Library()
+
+
+def _urls(paquete, tipo):
+    if settings.ASSETS_LOCALES:
+        return [static(ruta_paquete(paquete, tipo))]
+    return [LIBRERIAS[nombre][0] for nombre in PAQUETES[paquete][tipo]]
+
+
+@register.simple_tag
+def assets_css(paquete):
+    return format_html_join('\n', '<link href="{}" rel="stylesheet">', ((url,) for url in _urls(paquete, 'css')))
+
+
+@register.simple_tag
+def assets_js(paquete):
+    return format_html_join('\n', '<script src="{}"></script>', ((url,) for url in _urls(paquete, 'js')))
+
+
+@register.simple_tag
+def asset_url(nombre):
+    cdn, local = LIBRERIAS[nombre]
+    return static(local) if settings.ASSETS_LOCALES else cdn
@@ -0,0 +1,1014 @@
+import datetime
+import json
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.management import CommandError, call_command
+from django.db import connection, router, transaction
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    admin as admin_task, altas, busqueda, codigos, integridad, inventario, kardex, perfilado, permisos, promociones,
+    relacionados, replicas, versiones,
+)
+from .management.commands import construir_assets
+from .models import (
+    AuthUser, Cajas, CheckpointStock, DetallesVenta, DetallesVentaArchivo, Empleados, Gastos, MovimientoStock, Productos,
+    Promociones, StockSucursal, Sucursales, TomaInventario, TurnosCaja, Ventas, VentasArchivo, VersionDatos,
+)
+
+
+def crear_base(productos=3, stock=100):
+    """Admin con empleado, dos sucursales, una caja con turno abierto y algunos productos."""
+    user = User.objects.create_superuser('admin', 'admin@lamonona.com', 'clave', is_staff=True)
+    empleado = Empleados.objects.create(
+        nombre='Ana', apellido='Pérez', correo='admin@lamonona.com', id_user=AuthUser.objects.get(pk=user.pk),
+    )
+    oeste = Sucursales.objects.create(id_sucursal=1, nombre_sucursal='Oeste')
+    norte = Sucursales.objects.create(id_sucursal=2, nombre_sucursal='Norte')
+    caja = Cajas.objects.create(id_sucursal=oeste, ubicacion='Monona, zona oeste', estado='Abierta')
+    turno = TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+    return {
+        'user': user,
+        'empleado': empleado,
+        'sucursales': (oeste, norte),
+        'caja': caja,
+        'turno': turno,
+        'productos': [
+            Productos.objects.create(nombre_producto=f'Producto {i}', precio=10 + i, stock=stock)
+            for i in range(productos)
+        ],
+    }
+
+
+def comando(nombre, *args):
+    salida = StringIO()
+    call_command(nombre, *args, stdout=salida)
+    return salida.getvalue()
+
+
+class PermisosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Los cambios de grupos publican la versión ROLES al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendedor = User.objects.create_user('vendedor', 'v@lamonona.com', 'clave')
+            self.vendedor.groups.add(Group.objects.create(name='vendedor'))
+            self.administrador = User.objects.create_user('jefa', 'j@lamonona.com', 'clave')
+            self.administrador.groups.add(Group.objects.create(name='administrador'))
+
+    def test_capacidades_por_rol(self):
+        self.assertFalse(permisos.tiene_capacidad(self.vendedor, 'editar_ventas'))
+        self.assertTrue(permisos.tiene_capacidad(self.administrador, 'editar_ventas'))
+        self.assertEqual(permisos.rol_principal(self.administrador.pk), 'administrador')
+
+    def test_superusuario_y_staff_no_consultan_grupos(self):
+        superusuario = User.objects.create_superuser('super', 's@lamonona.com', 'clave')
+        staff = User.objects.create_user('staff', 'st@lamonona.com', 'clave', is_staff=True)
+        with self.assertNumQueries(0):
+            self.assertTrue(permisos.tiene_capacidad(superusuario, 'cualquier_cosa'))
+            self.assertTrue(permisos.tiene_capacidad(staff, 'ver_perfiles'))
+
+    def test_inactivos_y_anonimos_no_tienen_capacidades(self):
+        self.administrador.is_active = False
+        self.assertFalse(permisos.tiene_capacidad(self.administrador, 'editar_ventas'))
+        self.assertFalse(permisos.tiene_capacidad(AnonymousUser(), 'editar_ventas'))
+
+    def test_el_mapa_queda_cacheado(self):
+        permisos.tiene_capacidad(self.vendedor, 'editar_ventas')
+        with self.assertNumQueries(0):
+            self.assertFalse(permisos.tiene_capacidad(self.vendedor, 'editar_ventas'))
+
+    def test_cambiar_grupos_invalida_el_mapa(self):
+        self.assertFalse(permisos.tiene_capacidad(self.vendedor, 'editar_ventas'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vendedor.groups.set([Group.objects.get(name='administrador')])
+        self.assertTrue(permisos.tiene_capacidad(self.vendedor, 'editar_ventas'))
+
+    def test_requiere_capacidad(self):
+        @permisos.requiere_capacidad('eliminar_ventas', "No.")
+        def vista(request):
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/')
+        request.user = self.administrador
+        self.assertEqual(vista(request).content, b'ok')
+        request.user = self.vendedor
+        with self.assertRaisesMessage(PermissionDenied, "No."):
+            vista(request)
+
+
+class ListaUsuariosTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base(productos=0)
+        self.client.force_login(self.datos['user'])
+        self.administrador = Group.objects.create(name='administrador')
+
+    def crear_empleados(self, cantidad):
+        inicio = Empleados.objects.count()
+        for i in range(inicio, inicio + cantidad):
+            user = User.objects.create_user(f'empleado{i}', f'e{i}@lamonona.com', 'clave')
+            user.groups.add(self.administrador)
+            Empleados.objects.create(
+                nombre=f'Empleado {i}', apellido='Gómez', correo=f'e{i}@lamonona.com',
+                id_user=AuthUser.objects.get(pk=user.pk),
+            )
+
+    def consultas(self):
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(reverse('userlist'))
+        self.assertEqual(respuesta.status_code, 200)
+        return len(capturadas)
+
+    def test_consultas_constantes_con_el_rol_anotado(self):
+        self.crear_empleados(1)
+        pocos = self.consultas()
+        self.crear_empleados(10)
+        self.assertEqual(self.consultas(), pocos)
+
+    def test_roles_y_busqueda(self):
+        self.crear_empleados(3)
+        respuesta = self.client.get(reverse('userlist'), {'q': 'empleado1'})
+
+        self.assertEqual([e.id_user.username for e in respuesta.context['empleados']], ['empleado1'])
+        self.assertEqual(respuesta.context['empleados'][0].rol, 'administrador')
+        for valor, _ in permisos.ROLES:
+            self.assertContains(respuesta, f'<option value="{valor}">')
+
+
+class StockPorSucursalTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base()
+        self.a, self.b, self.c = self.datos['productos']
+        self.oeste, self.norte = self.datos['sucursales']
+
+    def test_carga_inicial_y_totales(self):
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.norte, stock=5)
+
+        comando('sincronizar_stock', '--inicial', '--sucursal', str(self.oeste.pk))
+
+        # a ya tenía filas: no se carga en Oeste y su total pasa a ser el de Norte
+        self.assertEqual(
+            sorted(StockSucursal.objects.values_list('id_producto', 'id_sucursal', 'stock')),
+            [(self.a.pk, self.norte.pk, 5), (self.b.pk, self.oeste.pk, 100), (self.c.pk, self.oeste.pk, 100)],
+        )
+        self.assertEqual(
+            list(Productos.objects.order_by('pk').values_list('stock', flat=True)), [5, 100, 100],
+        )
+
+    def test_checkpoint_inicial_suma_las_sucursales(self):
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.oeste, stock=30)
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.norte, stock=12)
+        StockSucursal.objects.create(id_producto=self.b, id_sucursal=self.norte, stock=7)
+
+        comando('checkpoint_stock')
+
+        # Productos.stock (100) no se usa; c no tiene stock por sucursal y se saltea
+        self.assertEqual(
+            sorted(CheckpointStock.objects.values_list('id_producto', 'stock')),
+            [(self.a.pk, 42), (self.b.pk, 7)],
+        )
+        comando('checkpoint_stock')
+        self.assertEqual(CheckpointStock.objects.count(), 2)
+
+    def test_kardex_informa_el_stock_de_las_sucursales(self):
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.oeste, stock=30)
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.norte, stock=12)
+        self.client.force_login(self.datos['user'])
+
+        datos = self.client.get(reverse('kardex_producto', args=[self.a.pk])).json()
+        self.assertEqual(datos['stock'], 42)
+        self.assertEqual(datos['por_sucursal'], {str(self.oeste.pk): 30, str(self.norte.pk): 12})
+        datos = self.client.get(reverse('kardex_producto', args=[self.b.pk])).json()
+        self.assertEqual((datos['stock'], datos['por_sucursal']), (100, {}))
+
+
+class ReplicaTests(TestCase):
+    def setUp(self):
+        self.lecturas = []
+        patcher = mock.patch.object(replicas, 'hay_replica', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pedir(self, metodo='get', escribir=False, **cookies):
+        @replicas.solo_lectura
+        def vista(request):
+            self.lecturas.append(router.db_for_read(Productos))
+            if escribir:
+                Productos.objects.create(nombre_producto='Nuevo', precio=1, stock=0)
+                self.lecturas.append(router.db_for_read(Productos))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), metodo)('/')
+        request.COOKIES.update(cookies)
+        return replicas.FijarPrimariaMiddleware(vista)(request)
+
+    def test_get_lee_de_la_replica(self):
+        respuesta = self.pedir()
+
+        self.assertEqual(self.lecturas, [replicas.REPLICA])
+        self.assertNotIn(replicas.COOKIE_PRIMARIA, respuesta.cookies)
+        self.assertEqual(router.db_for_read(Productos), 'default')
+
+    def test_despues_de_escribir_lee_de_default_y_fija_la_primaria(self):
+        respuesta = self.pedir(escribir=True)
+
+        self.assertEqual(self.lecturas, [replicas.REPLICA, 'default'])
+        self.assertIn(replicas.COOKIE_PRIMARIA, respuesta.cookies)
+
+    def test_las_vistas_con_etag_no_leen_de_la_replica(self):
+        self.client.force_login(crear_base(productos=0)['user'])
+
+        # No hay una base 'replica' de verdad: si alguna la usara, fallaría la conexión
+        for nombre_url in ('lista_ventas', 'lista_cajas', 'estado_cajas', 'lista_productos'):
+            with self.subTest(nombre_url):
+                self.assertEqual(self.client.get(reverse(nombre_url)).status_code, 200)
+
+    def test_post_y_cookie_de_primaria_leen_de_default(self):
+        self.pedir(metodo='post')
+        self.pedir(**{replicas.COOKIE_PRIMARIA: '1'})
+
+        self.assertEqual(self.lecturas, ['default', 'default'])
+
+
+class KardexTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base(productos=1)
+        self.producto = self.datos['productos'][0]
+        self.inicio = timezone.now() - datetime.timedelta(days=1)
+        CheckpointStock.objects.create(id_producto=self.producto, fecha=self.inicio, stock=50)
+        kardex.registrar({self.producto.pk: -5}, MovimientoStock.VENTA, fecha=self.hora(1))
+        kardex.registrar({self.producto.pk: 3}, MovimientoStock.REPOSICION, fecha=self.hora(2))
+
+    def hora(self, horas):
+        return self.inicio + datetime.timedelta(hours=horas)
+
+    def test_stock_en_un_instante(self):
+        self.assertIsNone(kardex.stock_en(self.producto.pk, self.hora(-1)))
+        self.assertEqual(kardex.stock_en(self.producto.pk, self.hora(0)), 50)
+        self.assertEqual(kardex.stock_en(self.producto.pk, self.hora(1.5)), 45)
+        self.assertEqual(kardex.stock_en(self.producto.pk, self.hora(3)), 48)
+        self.assertEqual(
+            kardex.resumen(self.hora(0), self.hora(3)),
+            {MovimientoStock.VENTA: -5, MovimientoStock.REPOSICION: 3},
+        )
+
+    def test_checkpoint_incremental(self):
+        comando('checkpoint_stock', '--margen', '0')
+
+        ultimo = kardex.ultimo_checkpoint(self.producto.pk)
+        self.assertEqual(ultimo[1], 48)
+        # Desde el último checkpoint se suman solo los movimientos posteriores
+        kardex.registrar({self.producto.pk: -1}, MovimientoStock.VENTA)
+        with self.assertNumQueries(2):
+            self.assertEqual(kardex.stock_en(self.producto.pk, timezone.now()), 47)
+
+    def test_vista(self):
+        self.client.force_login(self.datos['user'])
+        url = reverse('kardex_producto', args=[self.producto.pk])
+
+        datos = self.client.get(url, {'en': self.hora(1.5).isoformat()}).json()
+        self.assertEqual(datos['stock_en'], 45)
+        self.assertEqual([m['cantidad'] for m in datos['movimientos']], [3, -5])
+        self.assertEqual(self.client.get(url, {'en': 'ayer'}).status_code, 400)
+
+
+class AltasTests(TestCase):
+    def fila(self, username, **extra):
+        return {
+            'username': username, 'password': 'Clave-segura-123', 'nombre': 'Luz', 'apellido': 'Díaz',
+            'correo': f'{username}@lamonona.com', 'rol': 'vendedor', **extra,
+        }
+
+    def test_errores_por_fila(self):
+        User.objects.create_user('existente', 'x@lamonona.com', 'clave')
+
+        validos, errores = altas.validar([
+            self.fila('luz'),
+            ['luz', 'clave'],
+            self.fila('luz', correo='otra@lamonona.com'),
+            self.fila('existente'),
+            self.fila('sin_nombre', nombre=''),
+        ])
+
+        self.assertEqual(len(validos), 3)
+        self.assertEqual([numero for numero, _ in errores], [2, 3, 4, 5])
+        self.assertIn('repetido en el archivo', errores[1][1])
+        self.assertIn('ya está registrado', errores[2][1])
+
+    # El pool de procesos cerraría la conexión de la base de prueba
+    @mock.patch.object(altas, 'hashear', lambda passwords, procesos=None: [make_password(p) for p in passwords])
+    def test_comando_crea_todo_o_nada(self):
+        carpeta = TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ruta = Path(carpeta.name) / 'altas.json'
+        ruta.write_text(json.dumps([self.fila('luz'), self.fila('sol', rol='administrador')]), encoding='utf-8')
+
+        comando('alta_empleados', str(ruta))
+
+        self.assertEqual(
+            sorted(Empleados.objects.values_list('id_user__username', 'id_user__is_staff')),
+            [('luz', False), ('sol', True)],
+        )
+        self.assertTrue(User.objects.get(username='luz').check_password('Clave-segura-123'))
+        self.assertEqual(permisos.rol_principal(User.objects.get(username='sol').pk), 'administrador')
+
+        ruta.write_text(json.dumps([self.fila('mar'), self.fila('luz')]), encoding='utf-8')
+        with self.assertRaises(CommandError):
+            call_command('alta_empleados', str(ruta), stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(User.objects.filter(username='mar').exists())
+
+
+class PronosticoTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base()
+        self.parejo, self.viejo, self.quieto = self.datos['productos']
+        Productos.objects.update(stock_minimo=7)
+        hoy = timezone.localdate()
+        # 4 unidades por día durante toda la ventana de 90 días
+        for dias in range(90):
+            self.vender(self.parejo, 4, hoy - datetime.timedelta(days=dias))
+        # Una sola venta de la noche anterior al primer día de la ventana
+        self.vender(self.viejo, 50, hoy - datetime.timedelta(days=90), datetime.time(23, 30))
+
+    def vender(self, producto, cantidad, dia, hora=datetime.time(12)):
+        venta = Ventas.objects.create(
+            id_turno=self.datos['turno'], total_venta=cantidad,
+            fecha_venta=timezone.make_aware(datetime.datetime.combine(dia, hora)),
+        )
+        DetallesVenta.objects.create(id_venta=venta, id_producto=producto, cantidad=cantidad, subtotal=cantidad)
+
+    def minimos(self):
+        return list(Productos.objects.order_by('pk').values_list('stock_minimo', flat=True))
+
+    def test_demanda_pareja_y_productos_sin_ventas(self):
+        comando('pronosticar_stock', '--dias', '90', '--demora', '3')
+
+        # Sin variabilidad el punto de pedido es la demanda durante la demora; los
+        # productos sin ventas en la ventana conservan su stock_minimo
+        self.assertEqual(self.minimos(), [12, 7, 7])
+
+    def test_simular_no_guarda(self):
+        salida = comando('pronosticar_stock', '--simular')
+
+        self.assertIn('2 sin ventas, 1 cambian', salida)
+        self.assertEqual(self.minimos(), [7, 7, 7])
+
+    def test_parametros_invalidos(self):
+        with self.assertRaises(CommandError):
+            comando('pronosticar_stock', '--dias', '0')
+
+
+class RelacionadosTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base(productos=4)
+        self.a, self.b, self.c, self.d = self.datos['productos']
+        for _ in range(3):
+            self.vender(self.a, self.b)
+        self.vender(self.a, self.c)
+        self.vender(self.a, self.d)
+        # Las ventas archivadas también cuentan
+        archivada = VentasArchivo.objects.create(id_venta=9999, fecha_venta=timezone.now(), total_venta=0)
+        for i, producto in enumerate((self.a, self.c)):
+            DetallesVentaArchivo.objects.create(
+                id_detalle=9999 + i, id_venta=archivada, id_producto=producto, cantidad=1, subtotal=0,
+            )
+
+    def vender(self, *productos):
+        venta = Ventas.objects.create(id_turno=self.datos['turno'], total_venta=0)
+        for producto in productos:
+            DetallesVenta.objects.create(id_venta=venta, id_producto=producto, cantidad=1, subtotal=0)
+
+    def test_comando_guarda_los_mas_comprados_juntos(self):
+        comando('relacionar_productos', '--lote', '2', '--minimo', '2')
+
+        self.assertEqual(relacionados.de_producto(self.a.pk), [self.b, self.c])
+        self.assertEqual(relacionados.de_producto(self.c.pk), [self.a])
+        self.assertEqual(relacionados.de_producto(self.d.pk), [])
+
+    def test_poda_los_pares_menos_frecuentes(self):
+        conteo = relacionados.CoOcurrencias(max_pares=4)
+        for _ in range(3):
+            conteo.agregar_venta([1, 2])
+        for otro in range(3, 8):
+            conteo.agregar_venta([1, otro])
+
+        self.assertLessEqual(len(conteo.pares), 4)
+        self.assertEqual(conteo.pares[(1, 2)], 3)
+        self.assertEqual([otro for otro, _, _ in conteo.top_k(1)[1]], [2])
+
+
+class IntegridadTests(TransactionTestCase):
+    # El comando verifica cada rango en otro hilo, con su propia conexión: los datos
+    # tienen que estar confirmados
+
+    def setUp(self):
+        self.datos = crear_base(productos=2)
+        self.a, self.b = self.datos['productos']
+        turno = self.datos['turno']
+        self.bien = Ventas.objects.create(id_turno=turno, total_venta=18, descuento=2)
+        DetallesVenta.objects.create(id_venta=self.bien, id_producto=self.a, cantidad=2, subtotal=20)
+        self.mal = Ventas.objects.create(id_turno=turno, total_venta=99)
+        DetallesVenta.objects.create(id_venta=self.mal, id_producto=self.b, cantidad=1, subtotal=11)
+        Gastos.objects.create(id_turno=turno, fecha_gasto=timezone.now(), monto=5)
+        TurnosCaja.objects.filter(pk=turno.pk).update(ingresos_totales=117, egresos_totales=5, saldo_final=100)
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.datos['sucursales'][0], stock=100)
+        StockSucursal.objects.create(id_producto=self.b, id_sucursal=self.datos['sucursales'][0], stock=90)
+
+    def reporte(self, *args):
+        salida = StringIO()
+        try:
+            call_command('check_integrity', '--tamano', '1', *args, stdout=salida, stderr=StringIO())
+        except CommandError:
+            pass
+        return [json.loads(linea) for linea in salida.getvalue().splitlines()]
+
+    def test_reporta_cada_discrepancia_y_un_resumen(self):
+        *discrepancias, resumen = self.reporte()
+
+        self.assertEqual(
+            sorted((d['chequeo'], d['id']) for d in discrepancias),
+            [('saldo_turno', self.datos['turno'].pk), ('stock_total', self.b.pk), ('total_venta', self.mal.pk)],
+        )
+        self.assertEqual(resumen['resumen']['discrepancias'], 3)
+        # Con --tamano 1 cada id es un rango
+        self.assertEqual(resumen['resumen']['rangos'], 2 + 2 + 1 + 2)
+
+    def test_sin_discrepancias(self):
+        Ventas.objects.filter(pk=self.mal.pk).update(total_venta=11)
+        salida = StringIO()
+
+        call_command('check_integrity', '--chequeo', 'total_venta', stdout=salida, stderr=StringIO())
+        self.assertEqual(json.loads(salida.getvalue())['resumen']['discrepancias'], 0)
+
+    def test_chequeo_por_rango(self):
+        self.assertEqual(
+            [d['id'] for d in integridad.totales_venta('default', self.mal.pk, self.mal.pk)], [self.mal.pk],
+        )
+        self.assertEqual(integridad.totales_venta('default', self.bien.pk, self.bien.pk), [])
+
+
+class InventarioTests(TestCase):
+    def setUp(self):
+        self.datos = crear_base()
+        self.a, self.b, self.c = self.datos['productos']
+        self.oeste = self.datos['sucursales'][0]
+        StockSucursal.objects.create(id_producto=self.a, id_sucursal=self.oeste, stock=10)
+        StockSucursal.objects.create(id_producto=self.b, id_sucursal=self.oeste, stock=5)
+        self.toma = inventario.iniciar(self.oeste)
+
+    def stock(self, producto):
+        return StockSucursal.objects.get(id_producto=producto, id_sucursal=self.oeste).stock
+
+    def test_la_copia_se_toma_con_las_filas_bloqueadas_y_antes_del_inicio(self):
+        self.toma.fecha_aplicada = timezone.now()
+        self.toma.save()
+        consultas = []
+
+        def sin_for_update(execute, sql, params, many, context):
+            # sqlite no entiende FOR UPDATE: se anota y se ejecuta sin él
+            sql, for_update, _ = sql.partition(' FOR UPDATE')
+            consultas.append((sql, bool(for_update)))
+            return execute(sql, params, many, context)
+
+        with mock.patch.object(connection.features, 'has_select_for_update', True), \
+                connection.execute_wrapper(sin_for_update):
+            inventario.iniciar(self.oeste)
+
+        tablas = {modelo: connection.ops.quote_name(modelo._meta.db_table) for modelo in (StockSucursal, TomaInventario)}
+        copia = next(
+            i for i, (sql, bloqueo) in enumerate(consultas)
+            if sql.startswith('SELECT') and f'FROM {tablas[StockSucursal]}' in sql and bloqueo
+        )
+        inicio = next(i for i, (sql, _) in enumerate(consultas) if sql.startswith(f'INSERT INTO {tablas[TomaInventario]}'))
+        self.assertLess(copia, inicio)
+
+    def test_la_sucursal_sigue_vendiendo_durante_la_toma(self):
+        # Se venden 2 de a antes de contarlo
+        venta = Ventas.objects.create(id_turno=self.datos['turno'], total_venta=20)
+        DetallesVenta.objects.create(id_venta=venta, id_producto=self.a, cantidad=2, subtotal=20)
+        StockSucursal.objects.filter(id_producto=self.a, id_sucursal=self.oeste).update(stock=8)
+
+        # Encabezado, un id con cantidad, lecturas sueltas del escáner y un código desconocido
+        texto = f"codigo,cantidad\n{self.a.pk},7\n{self.b.pk},3\n{self.b.pk}\n{self.b.pk}\nxyz\n"
+        cantidades, errores = inventario.leer_conteos(texto)
+        self.assertEqual(cantidades, {self.a.pk: 7, self.b.pk: 5})
+        self.assertEqual(len(errores), 1)
+        inventario.cargar(self.toma, cantidades)
+
+        self.assertEqual(
+            [(conteo.id_producto_id, esperado, diferencia)
+             for conteo, esperado, diferencia in inventario.diferencias(self.toma)],
+            [(self.a.pk, 8, -1)],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            inventario.aplicar(self.toma)
+
+        # c no se contó: queda como estaba
+        self.assertEqual((self.stock(self.a), self.stock(self.b), self.stock(self.c)), (7, 5, 0))
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(tipo=MovimientoStock.INVENTARIO).values_list('id_producto', 'cantidad')),
+            [(self.a.pk, -1)],
+        )
+        with self.assertRaises(inventario.InventarioError):
+            inventario.cargar(self.toma, {self.a.pk: 1})
+
+    def test_reemplazar_y_no_contados_en_cero(self):
+        inventario.cargar(self.toma, {self.a.pk: 4})
+        inventario.cargar(self.toma, {self.a.pk: 9}, reemplazar=True)
+
+        inventario.aplicar(self.toma, no_contados_en_cero=True)
+
+        self.assertEqual((self.stock(self.a), self.stock(self.b), self.stock(self.c)), (9, 0, 0))
+
+    def test_una_toma_abierta_por_sucursal(self):
+        with self.assertRaises(inventario.InventarioError):
+            inventario.iniciar(self.oeste)
+
+
+class VersionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        for nombre in (versiones.CATALOGO, versiones.VENTAS):
+            VersionDatos.objects.create(nombre=nombre, version=1)
+
+    def test_una_publicacion_por_transaccion(self):
+        publicadas = []
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(5):
+                self.assertIsNone(versiones.incrementar(versiones.CATALOGO, publicadas.append))
+            versiones.incrementar(versiones.VENTAS)
+
+        self.assertEqual(len(callbacks), 1)
+        # Savepoint, un UPDATE para todos los namespaces, la relectura y el release
+        with self.assertNumQueries(4):
+            callbacks[0]()
+        self.assertEqual(dict(VersionDatos.objects.values_list('nombre', 'version')), {
+            versiones.CATALOGO: 2, versiones.VENTAS: 2,
+        })
+        self.assertEqual(publicadas, [2] * 5)
+        self.assertEqual(versiones.version(versiones.CATALOGO), 2)
+
+    def test_savepoint_revertido(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    versiones.incrementar(versiones.VENTAS)
+                    raise ValueError
+            except ValueError:
+                pass
+            versiones.incrementar(versiones.CATALOGO)
+
+        self.assertEqual(dict(VersionDatos.objects.values_list('nombre', 'version')), {
+            versiones.CATALOGO: 2, versiones.VENTAS: 1,
+        })
+
+    def test_namespace_nuevo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            versiones.incrementar(versiones.PROMOCIONES)
+
+        self.assertTrue(VersionDatos.objects.filter(nombre=versiones.PROMOCIONES).exists())
+
+    def test_sincronizar_ve_los_cambios_de_otros_procesos(self):
+        self.assertEqual(versiones.version(versiones.CATALOGO), 1)
+        # Otro worker (o un comando de cron) publica una versión nueva
+        VersionDatos.objects.filter(nombre=versiones.CATALOGO).update(version=7)
+
+        self.assertEqual(versiones.sincronizar(), {versiones.CATALOGO: 7})
+        self.assertEqual(versiones.version(versiones.CATALOGO), 7)
+        self.assertEqual(versiones.sincronizar(), {})
+
+
+class PerfiladoTests(TestCase):
+    def setUp(self):
+        carpeta = TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        configuracion = override_settings(PERFILADO_DIR=carpeta.name, PERFILADO_MAXIMO=2)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        cache.clear()
+        self.datos = crear_base(productos=0)
+
+    def entrar(self, username, grupo=None, **extra):
+        user = User.objects.create_user(username, f'{username}@lamonona.com', 'clave', **extra)
+        if grupo:
+            user.groups.add(Group.objects.get_or_create(name=grupo)[0])
+        self.client.force_login(user)
+
+    def test_administradores_perfilan_y_ven_los_perfiles(self):
+        self.entrar('jefa', 'administrador')
+        for _ in range(3):
+            respuesta = self.client.get(reverse('lista_productos'), {perfilado.PARAMETRO: 1})
+        ident = respuesta[perfilado.HEADER_RESPUESTA]
+
+        # Solo quedan los últimos PERFILADO_MAXIMO
+        self.assertEqual(len(perfilado.recientes()), 2)
+        self.assertEqual(self.client.get(reverse('lista_perfiles')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('detalle_perfil', args=[ident])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('descargar_perfil', args=[ident])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('detalle_perfil', args=['123'])).status_code, 404)
+
+    def test_los_demas_no(self):
+        self.entrar('vendedor', 'vendedor')
+
+        respuesta = self.client.get(reverse('lista_productos'), {perfilado.PARAMETRO: 1})
+        self.assertNotIn(perfilado.HEADER_RESPUESTA, respuesta)
+        self.assertEqual(perfilado.recientes(), [])
+        self.assertEqual(self.client.get(reverse('lista_perfiles')).status_code, 403)
+
+
+class ETagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.datos = crear_base(productos=1)
+        self.client.force_login(self.datos['user'])
+
+    def pedir(self, etag=None):
+        extra = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('lista_productos'), **extra)
+
+    def test_304_hasta_que_cambia_el_catalogo(self):
+        etag = self.pedir()['ETag']
+
+        # Versiones, sesión y usuario: la vista no llega a correr
+        with self.assertNumQueries(3):
+            self.assertEqual(self.pedir(etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            versiones.incrementar(versiones.CATALOGO)
+        respuesta = self.pedir(etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_cada_usuario_tiene_su_etag(self):
+        etag = self.pedir()['ETag']
+        self.client.force_login(User.objects.create_user('otro', password='clave'))
+
+        self.assertEqual(self.pedir(etag).status_code, 200)
+
+    def test_sin_etag_con_mensajes_pendientes(self):
+        etag = self.pedir()['ETag']
+        self.client.cookies['messages'] = 'pendiente'
+
+        respuesta = self.pedir(etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.has_header('ETag'))
+
+
+class PromocionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        promociones._compiladas = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a, self.b, self.c = crear_base()['productos']
+        self.precios = dict(Productos.objects.values_list('pk', 'precio'))
+
+    def promocion(self, productos, **campos):
+        with self.captureOnCommitCallbacks(execute=True):
+            promocion = Promociones.objects.create(nombre='Promo', **campos)
+            promocion.productos.set(productos)
+        return promocion
+
+    def descuentos(self, *lineas):
+        lineas = [SimpleNamespace(id_producto_id=producto.pk, cantidad=cantidad) for producto, cantidad in lineas]
+        return promociones.reglas().descuentos(lineas, self.precios)
+
+    def test_mejor_descuento_repartido_entre_las_lineas(self):
+        self.promocion([self.a], tipo=Promociones.LLEVA_PAGA, lleva=3, paga=2)
+        self.promocion([self.a], tipo=Promociones.PORCENTAJE, porcentaje=10)
+
+        # 4 unidades: el 3x2 regala 10 y el 10% solo 4; las dos líneas se reparten los 10
+        self.assertEqual(self.descuentos((self.a, 2), (self.b, 1), (self.a, 2)), [5, 0, 5])
+
+    def test_combo_cuenta_los_juegos_completos(self):
+        self.promocion([self.a, self.b], tipo=Promociones.COMBO, porcentaje=20)
+
+        self.assertEqual(self.descuentos((self.a, 3), (self.b, 1)), [Decimal('2.00'), Decimal('2.20')])
+        self.assertEqual(self.descuentos((self.a, 3), (self.c, 1)), [0, 0])
+
+    def test_fuera_de_vigencia(self):
+        ahora = timezone.now()
+        self.promocion([self.a], tipo=Promociones.PORCENTAJE, porcentaje=50, desde=ahora + datetime.timedelta(days=1))
+        self.promocion([self.a], tipo=Promociones.PORCENTAJE, porcentaje=50, hasta=ahora)
+
+        self.assertEqual(self.descuentos((self.a, 1)), [0])
+
+    def test_recompila_cuando_cambian_las_promociones(self):
+        promocion = self.promocion([self.a], tipo=Promociones.PORCENTAJE, porcentaje=10)
+        compiladas = promociones.reglas()
+        self.assertIs(promociones.reglas(), compiladas)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            promocion.productos.add(self.b)
+
+        self.assertIsNot(promociones.reglas(), compiladas)
+        self.assertEqual(self.descuentos((self.b, 10)), [Decimal('11.00')])
+
+
+class BusquedaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        busqueda._indice = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(crear_base(productos=0)['user'])
+            self.coca, self.cocada, self.alfajor = (
+                Productos.objects.create(nombre_producto=nombre, descripcion=descripcion, precio=1, stock=1)
+                for nombre, descripcion in [
+                    ('Coca Cola 500ml', 'Gaseosa'), ('Cocadita', None), ('Alfajor de maicena', 'Con dulce de leche'),
+                ]
+            )
+
+    def buscar(self, consulta):
+        return [p.pk for p in busqueda.buscar(consulta)]
+
+    def test_prefijos_tildes_y_errores_de_tipeo(self):
+        self.assertEqual(self.buscar('cocadita'), [self.cocada.pk])
+        self.assertEqual(set(self.buscar('coc')), {self.coca.pk, self.cocada.pk})
+        self.assertEqual(self.buscar('MAICÉNA'), [self.alfajor.pk])
+        self.assertEqual(self.buscar('alfjor'), [self.alfajor.pk])
+        self.assertEqual(self.buscar('gaseosa'), [self.coca.pk])
+        self.assertEqual(self.buscar('yerba'), [])
+
+    def test_el_indice_sigue_a_los_productos_sin_rearmarse(self):
+        indice = busqueda.indice()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            yerba = Productos.objects.create(nombre_producto='Yerba mate', precio=1, stock=1)
+            Productos.objects.filter(pk=self.cocada.pk).get().delete()
+
+        self.assertIs(busqueda.indice(), indice)
+        self.assertEqual(self.buscar('yerba'), [yerba.pk])
+        self.assertEqual(self.buscar('cocadita'), [])
+
+    def test_la_busqueda_espera_a_que_termine_un_cambio(self):
+        indice = busqueda.indice()
+        resultados = []
+        buscador = threading.Thread(target=lambda: resultados.append(indice.buscar('cocadita')))
+
+        # Mientras se aplica un cambio la búsqueda no ve el índice a medio modificar
+        with indice._lock:
+            buscador.start()
+            buscador.join(0.1)
+            self.assertTrue(buscador.is_alive())
+            indice._quitar(self.cocada.pk)
+        buscador.join()
+
+        self.assertEqual(resultados, [[]])
+
+    def test_cambios_de_otro_proceso(self):
+        busqueda.indice()
+        # Otro proceso agregó un producto: solo llega la versión nueva
+        with mock.patch.object(busqueda, 'producto_guardado'), self.captureOnCommitCallbacks(execute=True):
+            yerba = Productos.objects.create(nombre_producto='Yerba mate', precio=1, stock=1)
+            versiones.incrementar(versiones.BUSQUEDA)
+
+        self.assertEqual(self.buscar('yerba'), [yerba.pk])
+
+    def test_la_vista_devuelve_stock_y_precio_actuales(self):
+        Productos.objects.filter(pk=self.cocada.pk).update(precio=25, stock=7)
+
+        respuesta = self.client.get(reverse('buscar_productos'), {'q': 'cocadita'})
+
+        self.assertEqual(respuesta.json(), {'resultados': [
+            {'id_producto': self.cocada.pk, 'nombre_producto': 'Cocadita', 'precio': '25.00', 'stock': 7},
+        ]})
+
+
+class CodigosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        codigos._mapa = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(crear_base(productos=0)['user'])
+            self.producto = Productos.objects.create(
+                nombre_producto='Yerba mate', codigo_barras='7790001', precio=Decimal('1500'), stock=20,
+            )
+
+    def escanear(self, codigo):
+        return self.client.get(reverse('escanear_producto', args=[codigo]))
+
+    def test_escanear_no_consulta_productos(self):
+        self.escanear('7790001')
+
+        # Versiones, sesión y usuario
+        with self.assertNumQueries(3):
+            respuesta = self.escanear('7790001')
+        self.assertEqual(respuesta.json(), {
+            'id_producto': self.producto.pk, 'nombre_producto': 'Yerba mate', 'precio': '1500.00', 'stock': 20,
+        })
+        self.assertEqual(self.escanear('0000').status_code, 404)
+        self.assertEqual(codigos.buscar(' 7790001 ')['id_producto'], self.producto.pk)
+
+    def test_cambiar_el_codigo(self):
+        mapa = codigos.mapa()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.codigo_barras = '7790002'
+            self.producto.save()
+
+        self.assertIs(codigos.mapa(), mapa)
+        self.assertIsNone(codigos.buscar('7790001'))
+        self.assertEqual(codigos.buscar('7790002')['id_producto'], self.producto.pk)
+
+    def test_stock_vendido_y_refresco(self):
+        codigos.mapa()
+        codigos.stock_movido({self.producto.pk: -3})
+        self.assertEqual(codigos.buscar('7790001')['stock'], 17)
+
+        # Lo que vendieron otros procesos llega al vencer el diccionario
+        Productos.objects.filter(pk=self.producto.pk).update(stock=5)
+        with mock.patch.object(codigos.time, 'monotonic', return_value=time.monotonic() + codigos.REFRESCO_SEGUNDOS):
+            self.assertEqual(codigos.buscar('7790001')['stock'], 5)
+
+
+class LimpiarSesionesTests(TestCase):
+    def test_borra_solo_las_vencidas_por_lotes(self):
+        ahora = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'vencida{i}', session_data='', expire_date=ahora - datetime.timedelta(minutes=1))
+             for i in range(5)]
+            + [Session(session_key=f'vigente{i}', session_data='', expire_date=ahora + datetime.timedelta(hours=1))
+               for i in range(2)]
+        )
+
+        # Tres lotes de a 2 (SELECT y DELETE cada uno) y el SELECT que ya no encuentra nada
+        with self.assertNumQueries(7):
+            salida = comando('limpiar_sesiones', '--lote', '2')
+
+        self.assertIn('5 sesiones vencidas eliminadas.', salida)
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), ['vigente0', 'vigente1'])
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        busqueda._indice = codigos._mapa = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.datos = crear_base()
+        self.client.force_login(self.datos['user'])
+
+    def detalles(self, cantidad):
+        venta = Ventas.objects.create(id_turno=self.datos['turno'])
+        DetallesVenta.objects.bulk_create([
+            DetallesVenta(id_venta=venta, id_producto=self.datos['productos'][i % 3], cantidad=1, subtotal=10)
+            for i in range(cantidad)
+        ])
+
+    def detalles_archivados(self, cantidad):
+        venta = VentasArchivo.objects.create(
+            id_venta=VentasArchivo.objects.count() + 1, id_turno=self.datos['turno'], fecha_venta=timezone.now(),
+        )
+        inicio = DetallesVentaArchivo.objects.count() + 1
+        DetallesVentaArchivo.objects.bulk_create([
+            DetallesVentaArchivo(
+                id_detalle=inicio + i, id_venta=venta, id_producto=self.datos['productos'][i % 3], cantidad=1, subtotal=10,
+            )
+            for i in range(cantidad)
+        ])
+
+    def test_listas_de_detalles_sin_consultas_por_fila(self):
+        for modelo, crear in [('detallesventa', self.detalles), ('detallesventaarchivo', self.detalles_archivados)]:
+            with self.subTest(modelo):
+                url = reverse(f'admin:Task_{modelo}_changelist')
+                crear(1)
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as una:
+                    self.client.get(url)
+                for _ in range(5):
+                    crear(6)
+                with CaptureQueriesContext(connection) as muchas:
+                    respuesta = self.client.get(url)
+
+                self.assertEqual(respuesta.status_code, 200)
+                self.assertEqual(len(muchas), len(una))
+
+    def test_busqueda_de_productos_por_nombre_o_codigo(self):
+        producto = self.datos['productos'][1]
+        Productos.objects.filter(pk=producto.pk).update(codigo_barras='7790001')
+        codigos._mapa = None
+
+        url = reverse('admin:Task_productos_changelist')
+        for termino in ('Producto 1', 'Prodcto', '7790001'):
+            respuesta = self.client.get(url, {'q': termino})
+            self.assertIn(producto, respuesta.context['cl'].result_list)
+
+    def test_el_stock_no_se_edita_desde_el_admin(self):
+        producto = self.datos['productos'][0]
+        datos = {'nombre_producto': 'Renombrado', 'precio': '10', 'stock_minimo': '5', 'stock': '999'}
+
+        self.client.post(reverse('admin:Task_productos_change', args=[producto.pk]), datos)
+        self.client.post(reverse('admin:Task_productos_add'), dict(datos, nombre_producto='Nuevo'))
+
+        self.assertEqual(
+            list(Productos.objects.filter(nombre_producto__in=['Renombrado', 'Nuevo'])
+                 .order_by('pk').values_list('nombre_producto', 'stock')),
+            [('Renombrado', 100), ('Nuevo', 0)],
+        )
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_paginador_estimado_solo_sin_filtros(self):
+        with mock.patch.object(admin_task.PaginadorEstimado, '_conteo_estimado', return_value=5000):
+            self.assertEqual(admin_task.PaginadorEstimado(Ventas.objects.all(), 100).count, 5000)
+            self.assertEqual(admin_task.PaginadorEstimado(Ventas.objects.filter(total_venta__gt=0), 100).count, 0)
+        # Sin estadísticas del motor (sqlite) se cuenta normalmente
+        self.assertEqual(admin_task.PaginadorEstimado(Ventas.objects.all(), 100).count, 0)
+
+
+class AssetsTests(TestCase):
+    def setUp(self):
+        carpeta = TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.static = Path(carpeta.name)
+        self.descargas = []
+        patches = [
+            mock.patch.object(construir_assets, 'STATIC_DIR', self.static),
+            mock.patch.object(construir_assets.urllib.request, 'urlopen', self.urlopen),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def urlopen(self, url, timeout):
+        self.descargas.append(url)
+        nombre = url.rsplit('/', 1)[-1].encode()
+        if url.endswith('all.min.css'):
+            contenido = b'@font-face{src:url(../webfonts/fa-solid-900.woff2)}\n/*# sourceMappingURL=all.min.css.map */'
+        else:
+            contenido = b'/* ' + nombre + b' */\n//# sourceMappingURL=x.map'
+        return mock.MagicMock(__enter__=lambda self: mock.Mock(read=lambda: contenido))
+
+    def test_arma_los_paquetes_y_no_vuelve_a_descargar(self):
+        comando('construir_assets', '--sin-collectstatic')
+
+        base_js = (self.static / 'bundles/base.js').read_bytes()
+        self.assertEqual(base_js, b'/* jquery.min.js */\n\n;\n/* bootstrap.bundle.min.js */\n')
+        base_css = (self.static / 'bundles/base.css').read_text()
+        self.assertIn('url(../vendor/fontawesome/webfonts/fa-solid-900.woff2)', base_css)
+        self.assertNotIn('sourceMappingURL', base_css)
+
+        descargadas = len(self.descargas)
+        comando('construir_assets', '--sin-collectstatic')
+        self.assertEqual(len(self.descargas), descargadas)
+
+    def test_plantillas_con_cdn_o_paquetes_locales(self):
+        plantilla = Template('{% load assets %}{% assets_js "base" %}')
+
+        self.assertEqual(plantilla.render(Context()).count('<script'), 2)
+        with override_settings(ASSETS_LOCALES=True):
+            self.assertEqual(plantilla.render(Context()), '<script src="/static/bundles/base.js"></script>')
+
+
+class FragmentosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.datos = crear_base()
+        self.client.force_login(self.datos['user'])
+
+    def consultas_a_productos(self, nombre_url):
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(reverse(nombre_url))
+        self.assertEqual(respuesta.status_code, 200)
+        return [q['sql'] for q in capturadas if Productos._meta.db_table in q['sql']], respuesta
+
+    def test_render_en_caliente_no_consulta_el_catalogo(self):
+        for nombre_url in ('lista_productos', 'dashboard_stock'):
+            with self.subTest(nombre_url):
+                cache.clear()
+                en_frio, _ = self.consultas_a_productos(nombre_url)
+                en_caliente, _ = self.consultas_a_productos(nombre_url)
+                self.assertTrue(en_frio)
+                self.assertEqual(en_caliente, [])
+
+    def test_un_cambio_en_el_catalogo_se_ve(self):
+        self.consultas_a_productos('lista_productos')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Productos.objects.create(nombre_producto='Yerba mate', precio=1, stock=1)
+
+        _, respuesta = self.consultas_a_productos('lista_productos')
+        self.assertContains(respuesta, 'Yerba mate')
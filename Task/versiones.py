@@ -0,0 +1,176 @@
+"""
+Contadores de versión de datos usados como clave de cache.
+
+Cada namespace ('catalogo', 'ventas', 'cajas', ...) tiene un número que se incrementa
+cuando cambian sus datos (ver Task.signals). Las vistas y los fragmentos {% cache %}
+incluyen la versión en la clave, así nunca hace falta borrar entradas viejas: dejan
+de usarse solas y expiran.
+
+Los números viven en la tabla versiones_datos, compartida por todos los workers; la
+cache de cada proceso (locmem por defecto) guarda la última versión vista.
+SincronizarVersionesMiddleware los relee con una consulta al empezar cada request y
+pone al día solo los namespaces que cambiaron en otro proceso (o en un comando de cron),
+con lo que sus entradas cacheadas y los índices en memoria dejan de usarse.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .models import VersionDatos
+
+CATALOGO = 'catalogo'
+VENTAS = 'ventas'
+CAJAS = 'cajas'
+# Solo cambia con altas, bajas y ediciones de productos (no con el stock que mueven las ventas)
+BUSQUEDA = 'busqueda'
+CODIGOS = 'codigos'
+PROMOCIONES = 'promociones'
+ROLES = 'roles'
+SUCURSALES = 'sucursales'
+
+# Última versión leída de la tabla por este proceso
+_vistas = {}
+
+
+def _clave(nombre):
+    return f'version:{nombre}'
+
+
+def _nueva_version():
+    return time.time_ns()
+
+
+def _recordar(versiones):
+    _vistas.update(versiones)
+    cache.set_many({_clave(nombre): numero for nombre, numero in versiones.items()}, None)
+
+
+def version(nombre):
+    actual = cache.get(_clave(nombre))
+    if actual is None:
+        sincronizar()
+        actual = _vistas.get(nombre)
+        if actual is None:
+            return _publicar({nombre: []})[nombre]
+        cache.set(_clave(nombre), actual, None)
+    return actual
+
+
+def sincronizar():
+    """Lee las versiones compartidas y devuelve {nombre: versión} de las que cambiaron."""
+    actuales = VersionDatos.objects.using(DEFAULT_DB_ALIAS).values_list('nombre', 'version')
+    cambiadas = {nombre: numero for nombre, numero in actuales if _vistas.get(nombre) != numero}
+    if cambiadas:
+        _recordar(cambiadas)
+    return cambiadas
+
+
+def incrementar(nombre, al_publicar=None):
+    """
+    Incrementa la versión de `nombre`. Fuera de una transacción se publica en el momento y
+    devuelve la nueva. Dentro de una, se junta con los demás namespaces que cambie la misma
+    transacción y al confirmarla se publican todos juntos, una vez cada uno, con una
+    consulta; devuelve None. Así una venta de muchas líneas cuesta lo mismo que una de una
+    sola y ningún proceso cachea datos sin confirmar bajo la versión nueva.
+
+    `al_publicar(nueva)` se llama después de publicar, para aplicar el cambio en lo que el
+    proceso tenga en memoria (ver busqueda._aplicar).
+    """
+    conexion = transaction.get_connection(DEFAULT_DB_ALIAS)
+    if not conexion.in_atomic_block:
+        return _publicar({nombre: [al_publicar] if al_publicar else []})[nombre]
+    cambios = _publicacion_en_curso(conexion).cambios.setdefault(nombre, [])
+    if al_publicar is not None:
+        cambios.append(al_publicar)
+    return None
+
+
+class _Publicacion:
+    """Namespaces cambiados por la transacción en curso, publicados al confirmarla."""
+
+    def __init__(self):
+        self.cambios = {}   # nombre -> [al_publicar, ...]
+
+    def __call__(self):
+        if getattr(_pendiente, 'publicacion', None) is self:
+            _pendiente.publicacion = None
+        _publicar(self.cambios)
+
+
+# Publicación de la transacción abierta en este hilo (cada hilo tiene su conexión)
+_pendiente = threading.local()
+
+
+def _publicacion_en_curso(conexion):
+    publicacion = getattr(_pendiente, 'publicacion', None)
+    # Si la transacción o el savepoint en el que se registró se revirtió, Django ya
+    # descartó el callback: se empieza una publicación nueva
+    if publicacion is None or not any(funcion is publicacion for _, funcion, *_ in conexion.run_on_commit):
+        publicacion = _pendiente.publicacion = _Publicacion()
+        transaction.on_commit(publicacion, using=DEFAULT_DB_ALIAS)
+    return publicacion
+
+
+def _publicar(cambios):
+    """Incrementa de una vez las versiones de `cambios` y devuelve {nombre: nueva}."""
+    nombres = list(cambios)
+    filas = VersionDatos.objects.using(DEFAULT_DB_ALIAS).filter(nombre__in=nombres)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if filas.update(version=F('version') + 1) < len(nombres):
+            # Los que faltan arrancan del reloj, para no reusar claves que hayan quedado en una cache compartida
+            VersionDatos.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                [VersionDatos(nombre=nombre, version=_nueva_version()) for nombre in nombres],
+                ignore_conflicts=True,
+            )
+        nuevas = dict(filas.values_list('nombre', 'version'))
+    _recordar(nuevas)
+    for nombre, funciones in cambios.items():
+        for al_publicar in funciones:
+            al_publicar(nuevas[nombre])
+    return nuevas
+
+
+class SincronizarVersionesMiddleware:
+    """Al empezar cada request descarta lo cacheado de los namespaces que cambiaron en otro proceso."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sincronizar()
+        return self.get_response(request)
+
+
+def cacheado(nombre, clave, calcular, timeout=3600):
+    """Devuelve calcular() cacheado bajo la versión actual de `nombre`."""
+    return cache.get_or_set(f'{nombre}:{version(nombre)}:{clave}', calcular, timeout)
+
+
+def condicional(*nombres, extra=None):
+    """
+    Decorador de vistas GET con ETag armado a partir de las versiones de datos.
+
+    Si el navegador ya tiene esa versión la vista no se ejecuta y se responde 304.
+    El ETag incluye al usuario (la página cambia según sea staff o no) y no se envía
+    cuando hay mensajes flash pendientes, para que siempre se muestren.
+    `extra(request)` permite sumar otro dato barato a la clave.
+    """
+    def etag(request, *args, **kwargs):
+        if request.COOKIES.get(CookieStorage.cookie_name):
+            return None
+        partes = [str(version(nombre)) for nombre in nombres]
+        if extra is not None:
+            partes.append(str(extra(request)))
+        partes.append(f'{request.user.pk}.{int(request.user.is_staff)}')
+        return '-'.join(partes)
+
+    def decorador(vista):
+        return wraps(vista)(cache_control(private=True, no_cache=True)(condition(etag_func=etag)(vista)))
+    return decorador
@@ -1,8 +1,16 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from .models import Empleados, AuthUser, AuthUserGroups, AuthUserUserPermissions, Ventas, Productos, Cajas
-from .forms import EmpleadoCreationForm, EditarEmpleadoForm, EditarPerfilForm, CambiarContraseñaForm, ProductoForm
+from .models import Empleados, AuthUser, AuthUserGroups, AuthUserUserPermissions, Ventas, Productos, Cajas, MovimientoStock, StockSucursal, TomaInventario
+from .forms import (
+    EmpleadoCreationForm, EditarEmpleadoForm, EditarPerfilForm, CambiarContraseñaForm, ProductoForm,
+    IniciarTomaForm, CargarConteoForm, AplicarTomaForm,
+)
+from .permisos import ROLES, requiere_capacidad
+from .replicas import solo_lectura
+from . import busqueda, codigos, inventario, kardex, perfilado, relacionados, versiones
+from VentasApp.stock import aplicar_deltas, bloquear_stock, stock_por_producto
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import PermissionDenied
@@ -12,11 +20,14 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.views import PasswordResetConfirmView
 from django.urls import reverse_lazy
 from django.contrib.auth.forms import PasswordChangeForm
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.db.models import Count
 from django.db.models.functions import TruncMonth,TruncWeek
 from django.utils.translation import activate
-from django.db.models import Count, Sum, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db.models import Count, Sum, F, Q, OuterRef, Subquery
+from django.core.paginator import Paginator
 import logging
 import json
 
@@ -115,35 +126,96 @@ def edit_profile(request, user_id):
 
 
 # ===== LISTA DE USUARIOS =====
+USUARIOS_POR_PAGINA = 25
+
+
+def _empleados_con_rol():
+    """Empleados con su usuario y el nombre de su grupo principal en una sola consulta."""
+    rol = (
+        AuthUserGroups.objects.filter(user_id=OuterRef('id_user'))
+        .order_by('id')
+        .values('group__name')[:1]
+    )
+    return Empleados.objects.select_related('id_user').annotate(rol=Subquery(rol))
+
+
 @login_required
+@requiere_capacidad('gestionar_usuarios', "No tienes permiso para ver la lista de usuarios.")
+@solo_lectura
 def user_list(request):
     """
     Solo administradores pueden ver la lista de usuarios.
+    Paginada y con búsqueda del lado del servidor; el rol viene anotado en la misma consulta.
+    """
+    empleados = _empleados_con_rol().order_by('apellido', 'nombre', 'id_empleado')
+
+    q = request.GET.get('q', '').strip()
+    if q:
+        empleados = empleados.filter(
+            Q(nombre__icontains=q)
+            | Q(apellido__icontains=q)
+            | Q(correo__icontains=q)
+            | Q(id_user__username__icontains=q)
+        )
+
+    page = Paginator(empleados, USUARIOS_POR_PAGINA).get_page(request.GET.get('page'))
+    return render(request, 'userlist.html', {
+        'empleados': page.object_list,
+        'page_obj': page,
+        'q': q,
+        'roles': ROLES,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+@solo_lectura
+def user_detail_json(request, user_id):
     """
-    if not request.user.is_staff:
-        raise PermissionDenied("No tienes permiso para ver la lista de usuarios.")
+    Datos de un empleado en JSON para el modal de edición, sin renderizar el formulario.
+    """
+    if not request.user.is_staff and request.user.id != user_id:
+        raise PermissionDenied("No puedes ver el perfil de otro usuario.")
 
-    empleados = Empleados.objects.all().select_related('id_user')
-    return render(request, 'userlist.html', {'empleados': empleados})
+    empleado = get_object_or_404(_empleados_con_rol(), id_user__id=user_id)
+    user = empleado.id_user
+    return JsonResponse({
+        'id_user': user.id,
+        'id_empleado': empleado.id_empleado,
+        'username': user.username,
+        'nombre': empleado.nombre,
+        'apellido': empleado.apellido,
+        'edad': empleado.edad,
+        'telefono': empleado.telefono,
+        'correo': empleado.correo,
+        'direccion': empleado.direccion,
+        'rol': empleado.rol,
+        'is_active': bool(user.is_active),
+        'is_superuser': bool(user.is_superuser),
+    })
 
 
 # ===== CREAR Y EDITAR USUARIOS =====
 @login_required
+@requiere_capacidad('gestionar_usuarios', "No tienes permiso para crear usuarios.")
 @require_http_methods(["GET", "POST"])
 def add_user(request):
     """
     Crear un nuevo usuario. Solo administradores pueden crear.
     """
-    if not request.user.is_staff:
-        raise PermissionDenied("No tienes permiso para crear usuarios.")
-
     if request.method == 'POST':
+        es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
         form = EmpleadoCreationForm(request.POST)
         if form.is_valid():
             new_user = form.save()
-            messages.success(request, f"El usuario {new_user.nombre} ha sido creado correctamente.")
-            return redirect('user_list')
+            mensaje = f"El usuario {new_user.nombre} ha sido creado correctamente."
+            if es_ajax:
+                return JsonResponse({'success': True, 'message': mensaje})
+            messages.success(request, mensaje)
+            return redirect('userlist')
         else:
+            if es_ajax:
+                return JsonResponse({'success': False, 'errors': form.errors})
             return render(request, 'add_user.html', {'form': form})
     form = EmpleadoCreationForm()
     return render(request, 'add_user.html', {'form': form})
@@ -165,11 +237,17 @@ def edit_user(request, user_id):
     form = form_class(request.POST or None, instance=empleado)
 
     if request.method == 'POST':
+        es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
         if form.is_valid():
             form.save()
-            messages.success(request, f"Perfil de {empleado.nombre} actualizado correctamente.")
-            return redirect('user_list' if request.user.is_staff else 'user_profile')
+            mensaje = f"Perfil de {empleado.nombre} actualizado correctamente."
+            if es_ajax:
+                return JsonResponse({'success': True, 'message': mensaje})
+            messages.success(request, mensaje)
+            return redirect('userlist' if request.user.is_staff else 'user_profile')
         else:
+            if es_ajax:
+                return JsonResponse({'success': False, 'errors': form.errors})
             messages.error(request, "Errores en el formulario.")
 
     return render(request, 'edit_user.html', {'form': form, 'empleado': empleado})
@@ -177,23 +255,27 @@ def edit_user(request, user_id):
 
 # ===== ACTIVAR/DESACTIVAR USUARIOS =====
 @login_required
+@requiere_capacidad('gestionar_usuarios', "No tienes permiso para cambiar estado de usuarios.")
 @require_http_methods(["POST"])
 def toggle_user_active(request, user_id):
-    if not request.user.is_staff:
-        raise PermissionDenied("No tienes permiso para cambiar estado de usuarios.")
-
     empleado = get_object_or_404(Empleados, id_user__id=user_id)
     user = empleado.id_user
 
+    es_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
     if user.is_superuser and not request.user.is_superuser:
+        if es_ajax:
+            return JsonResponse({'success': False})
         messages.error(request, "No puedes cambiar el estado de un super administrador.")
-        return redirect('user_list')
+        return redirect('userlist')
 
     user.is_active = not user.is_active
     user.save()
     status = "activado" if user.is_active else "desactivado"
+    if es_ajax:
+        return JsonResponse({'success': True, 'is_active': bool(user.is_active)})
     messages.success(request, f"El usuario {empleado.nombre} ha sido {status}.")
-    return redirect('user_list')
+    return redirect('userlist')
 
 
 # ===== RESETEO DE CONTRASEÑA =====
@@ -211,27 +293,64 @@ class CustomPasswordResetConfirmView(PasswordResetConfirmView):
 # ===== VISTAS PARA GESTIÓN DE PRODUCTOS Y STOCK =====
 
 @login_required
+@versiones.condicional(versiones.CATALOGO)
 def lista_productos(request):
     """Lista todos los productos con alertas de stock bajo"""
+    version_catalogo = versiones.version(versiones.CATALOGO)
     productos = Productos.objects.all().order_by('nombre_producto')
     productos_bajo_stock = productos.filter(stock__lte=F('stock_minimo'))
     productos_sin_stock = productos.filter(stock=0)
-    
+
+    # Las listas son perezosas: solo se consultan si el fragmento de la tabla no está en cache
     context = {
         'productos': productos,
         'productos_bajo_stock': productos_bajo_stock,
         'productos_sin_stock': productos_sin_stock,
-        'alertas_count': productos_bajo_stock.count(),
+        'alertas_count': _conteos_stock()['alertas_count'],
+        'version_catalogo': version_catalogo,
     }
     return render(request, 'productos/lista.html', context)
 
+
+def _conteos_stock():
+    """Conteos del inventario en una sola consulta, cacheados por versión del catálogo."""
+    def calcular():
+        return Productos.objects.aggregate(
+            productos_total=Count('pk'),
+            stock_normal_count=Count('pk', filter=Q(stock__gt=F('stock_minimo'))),
+            alertas_count=Count('pk', filter=Q(stock__lte=F('stock_minimo'))),
+            sin_stock_count=Count('pk', filter=Q(stock=0)),
+        )
+    return versiones.cacheado(versiones.CATALOGO, 'conteos_stock', calcular)
+
+
+def _stock_por_sucursal():
+    """Unidades y productos agotados de cada sucursal, cacheados por versión del catálogo y de las sucursales."""
+    def calcular():
+        return list(
+            StockSucursal.objects
+            .values('id_sucursal', 'id_sucursal__nombre_sucursal')
+            .annotate(unidades=Sum('stock'), sin_stock=Count('pk', filter=Q(stock__lte=0)))
+            .order_by('id_sucursal__nombre_sucursal')
+        )
+    return versiones.cacheado(
+        versiones.CATALOGO, f'stock_por_sucursal:{versiones.version(versiones.SUCURSALES)}', calcular,
+    )
+
 @login_required
+@transaction.atomic
 def crear_producto(request):
     """Crear un nuevo producto"""
     if request.method == 'POST':
         form = ProductoForm(request.POST)
         if form.is_valid():
-            producto = form.save()
+            producto = form.save(commit=False)
+            producto.stock = form.cleaned_data['stock']
+            producto.save()
+            StockSucursal.objects.create(
+                id_producto=producto, id_sucursal=form.cleaned_data['sucursal'], stock=producto.stock
+            )
+            kardex.registrar({producto.pk: producto.stock}, MovimientoStock.REPOSICION)
             messages.success(request, f'Producto "{producto.nombre_producto}" creado exitosamente.')
             return redirect('lista_productos')
         else:
@@ -242,6 +361,7 @@ def crear_producto(request):
     return render(request, 'productos/form.html', {'form': form, 'title': 'Nuevo Producto'})
 
 @login_required
+@transaction.atomic
 def editar_producto(request, producto_id):
     """Editar un producto existente"""
     producto = get_object_or_404(Productos, id_producto=producto_id)
@@ -249,7 +369,17 @@ def editar_producto(request, producto_id):
     if request.method == 'POST':
         form = ProductoForm(request.POST, instance=producto)
         if form.is_valid():
-            producto_editado = form.save()
+            producto_editado = form.save(commit=False)
+            # Productos.stock es el total de las sucursales y lo actualiza aplicar_deltas
+            producto_editado.save(update_fields=ProductoForm._meta.fields)
+
+            # Bloqueada para que una venta concurrente no quede fuera del delta del kardex
+            clave = (form.cleaned_data['sucursal'].pk, producto_editado.pk)
+            filas = bloquear_stock([clave])
+            delta = form.cleaned_data['stock'] - filas[clave].stock
+            tipo = MovimientoStock.REPOSICION if delta > 0 else MovimientoStock.AJUSTE
+            aplicar_deltas({clave: delta} if delta else {}, filas, tipo)
+            producto_editado.stock = (producto_editado.stock or 0) + delta
             messages.success(request, f'Producto "{producto_editado.nombre_producto}" actualizado exitosamente.')
             
             # Verificar si el stock está bajo después de la edición
@@ -282,13 +412,12 @@ def eliminar_producto(request, producto_id):
     return render(request, 'productos/eliminar.html', {'producto': producto})
 
 @login_required
+@versiones.condicional(versiones.CATALOGO)
 def dashboard_stock(request):
     """Dashboard con alertas de stock y estadísticas"""
     
-    productos_total = Productos.objects.count()
     productos_bajo_stock = Productos.objects.filter(stock__lte=F('stock_minimo'))
     productos_sin_stock = Productos.objects.filter(stock=0)
-    productos_stock_normal = Productos.objects.filter(stock__gt=F('stock_minimo'))
     
     # Productos que más necesitan restock (ordenados por diferencia entre stock y stock_minimo)
     productos_criticos = productos_bajo_stock.extra(
@@ -296,13 +425,216 @@ def dashboard_stock(request):
     ).order_by('-diferencia')[:5]
     
     context = {
-        'productos_total': productos_total,
         'productos_bajo_stock': productos_bajo_stock,
         'productos_sin_stock': productos_sin_stock,
-        'productos_stock_normal': productos_stock_normal,
         'productos_criticos': productos_criticos,
-        'alertas_count': productos_bajo_stock.count(),
-        'sin_stock_count': productos_sin_stock.count(),
+        'version_catalogo': versiones.version(versiones.CATALOGO),
+        'stock_por_sucursal': _stock_por_sucursal(),
+        **_conteos_stock(),
     }
-    
-    return render(request, 'productos/dashboard.html', context)
\ No newline at end of file
+
+    return render(request, 'productos/dashboard.html', context)
+
+
+@login_required
+@solo_lectura
+def kardex_producto(request, producto_id):
+    """Stock actual, stock en ?en=<fecha ISO> y últimos movimientos de un producto en JSON"""
+    producto = get_object_or_404(Productos, id_producto=producto_id)
+    por_sucursal = dict(
+        StockSucursal.objects.filter(id_producto=producto).order_by('id_sucursal').values_list('id_sucursal', 'stock')
+    )
+    datos = {
+        'id_producto': producto.id_producto,
+        'nombre_producto': producto.nombre_producto,
+        # Productos.stock solo para los productos que todavía no tienen stock por sucursal
+        'stock': sum(por_sucursal.values()) if por_sucursal else producto.stock,
+        'por_sucursal': por_sucursal,
+        'movimientos': [
+            {**m, 'fecha': m['fecha'].isoformat()}
+            for m in producto.movimientostock_set.order_by('-fecha').values('fecha', 'tipo', 'cantidad', 'id_venta')[:50]
+        ],
+    }
+
+    if request.GET.get('en'):
+        momento = parse_datetime(request.GET['en'])
+        if momento is None:
+            return JsonResponse({'error': "Fecha inválida en 'en'."}, status=400)
+        if timezone.is_naive(momento):
+            momento = timezone.make_aware(momento)
+        datos['en'] = momento.isoformat()
+        datos['stock_en'] = kardex.stock_en(producto.id_producto, momento)
+
+    return JsonResponse(datos)
+
+
+@login_required
+def buscar_productos(request):
+    """Productos que coinciden con ?q= (hasta ?k=) para el buscador de la venta, en JSON"""
+    consulta = request.GET.get('q', '').strip()
+    try:
+        k = min(max(int(request.GET.get('k', 10)), 1), 50)
+    except ValueError:
+        k = 10
+    productos = busqueda.buscar(consulta, k) if consulta else []
+    stocks = stock_por_producto([p.id_producto for p in productos]) if productos else {}
+    return JsonResponse({'resultados': [
+        {
+            'id_producto': p.id_producto,
+            'nombre_producto': p.nombre_producto,
+            'precio': str(p.precio),
+            'stock': stocks.get(p.id_producto, p.stock),
+        }
+        for p in productos
+    ]})
+
+
+@login_required
+def escanear_producto(request, codigo):
+    """Producto con el código de barras dado, en JSON, para el escáner de la venta"""
+    producto = codigos.buscar(codigo)
+    if producto is None:
+        return JsonResponse({'error': f'No hay un producto con el código {codigo}.'}, status=404)
+    return JsonResponse(producto)
+
+
+@login_required
+@solo_lectura
+def productos_relacionados(request, producto_id):
+    """Productos que suelen comprarse junto con el dado, para sugerir en la venta, en JSON"""
+    return JsonResponse({'resultados': [
+        {
+            'id_producto': p.id_producto,
+            'nombre_producto': p.nombre_producto,
+            'precio': str(p.precio),
+            'stock': p.stock,
+        }
+        for p in relacionados.de_producto(producto_id)
+    ]})
+
+
+# ===== TOMA DE INVENTARIO =====
+@login_required
+@requiere_capacidad('tomar_inventario', "Solo los administradores pueden tomar inventario.")
+@require_http_methods(["GET", "POST"])
+def lista_tomas(request):
+    """Tomas de inventario y formulario para iniciar una"""
+    if request.method == 'POST':
+        form = IniciarTomaForm(request.POST)
+        if form.is_valid():
+            try:
+                toma = inventario.iniciar(form.cleaned_data['sucursal'], request.user.pk)
+            except inventario.InventarioError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, f'Toma #{toma.pk} iniciada. Ya se pueden cargar los conteos.')
+                return redirect('detalle_toma', toma_id=toma.pk)
+    else:
+        form = IniciarTomaForm()
+
+    tomas = (
+        TomaInventario.objects
+        .select_related('id_sucursal')
+        .annotate(productos=Count('conteos'), contados=Count('conteos', filter=Q(conteos__contado__isnull=False)))
+        .order_by('-fecha_inicio')[:50]
+    )
+    return render(request, 'inventario/lista.html', {'tomas': tomas, 'form': form})
+
+
+@login_required
+@requiere_capacidad('tomar_inventario', "Solo los administradores pueden tomar inventario.")
+def detalle_toma(request, toma_id):
+    """Avance de la toma, carga de conteos y diferencias a aplicar"""
+    toma = get_object_or_404(TomaInventario.objects.select_related('id_sucursal'), pk=toma_id)
+    resumen = toma.conteos.aggregate(productos=Count('pk'), contados=Count('pk', filter=Q(contado__isnull=False)))
+    if toma.abierta:
+        diferencias = inventario.diferencias(toma)
+    else:
+        diferencias = [
+            (c, None, c.ajuste)
+            for c in toma.conteos.select_related('id_producto').exclude(ajuste=0).filter(ajuste__isnull=False)
+        ]
+    return render(request, 'inventario/detalle.html', {
+        'toma': toma,
+        'resumen': resumen,
+        'diferencias': diferencias,
+        'cargar_form': CargarConteoForm(),
+        'aplicar_form': AplicarTomaForm(),
+    })
+
+
+@login_required
+@requiere_capacidad('tomar_inventario', "Solo los administradores pueden tomar inventario.")
+@require_http_methods(["POST"])
+def cargar_conteo(request, toma_id):
+    """Suma a la toma un CSV o una tanda de lecturas del escáner"""
+    toma = get_object_or_404(TomaInventario, pk=toma_id)
+    form = CargarConteoForm(request.POST, request.FILES)
+    if not form.is_valid():
+        for error in form.non_field_errors():
+            messages.error(request, error)
+        return redirect('detalle_toma', toma_id=toma.pk)
+
+    cantidades, errores = inventario.leer_conteos(form.cleaned_data['texto'])
+    for error in errores[:20]:
+        messages.warning(request, error)
+    if len(errores) > 20:
+        messages.warning(request, f'... y {len(errores) - 20} errores más.')
+    if cantidades:
+        try:
+            cargados = inventario.cargar(toma, cantidades, form.cleaned_data['reemplazar'])
+        except inventario.InventarioError as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f'Conteo cargado para {cargados} producto(s).')
+    return redirect('detalle_toma', toma_id=toma.pk)
+
+
+@login_required
+@requiere_capacidad('tomar_inventario', "Solo los administradores pueden tomar inventario.")
+@require_http_methods(["POST"])
+def aplicar_toma(request, toma_id):
+    """Ajusta el stock de la sucursal con las diferencias de la toma y la cierra"""
+    toma = get_object_or_404(TomaInventario, pk=toma_id)
+    form = AplicarTomaForm(request.POST)
+    form.is_valid()
+    try:
+        ajustados = inventario.aplicar(toma, form.cleaned_data.get('no_contados_en_cero', False))
+    except inventario.InventarioError as e:
+        messages.error(request, str(e))
+    else:
+        cambiados = sum(1 for c in ajustados if c.ajuste)
+        messages.success(request, f'Toma #{toma.pk} aplicada: {cambiados} producto(s) ajustados.')
+    return redirect('detalle_toma', toma_id=toma.pk)
+
+
+# ===== PERFILES DE REQUESTS =====
+@login_required
+@requiere_capacidad('ver_perfiles', "Solo los administradores pueden ver los perfiles.")
+def lista_perfiles(request):
+    """Últimos requests perfilados con ?perfilar=1"""
+    return render(request, 'perfiles/lista.html', {
+        'perfiles': perfilado.recientes(),
+        'activo': perfilado.directorio() is not None,
+        'maximo': settings.PERFILADO_MAXIMO,
+    })
+
+
+@login_required
+@requiere_capacidad('ver_perfiles', "Solo los administradores pueden ver los perfiles.")
+def detalle_perfil(request, ident):
+    """Funciones más costosas y consultas SQL de un request perfilado"""
+    perfil = perfilado.detalle(ident)
+    if perfil is None:
+        raise Http404("El perfil no existe o ya fue descartado.")
+    return render(request, 'perfiles/detalle.html', {'perfil': perfil})
+
+
+@login_required
+@requiere_capacidad('ver_perfiles', "Solo los administradores pueden ver los perfiles.")
+def descargar_perfil(request, ident):
+    """Archivo .prof del perfil, para snakeviz o flameprof"""
+    ruta = perfilado.ruta_prof(ident)
+    if ruta is None:
+        raise Http404("El perfil no existe o ya fue descartado.")
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=ruta.name)
@@ -0,0 +1,79 @@
+"""
+Ventas vivas y archivadas.
+
+Las ventas de turnos cerrados con más de N meses se mueven a ventas_archivo /
+detalles_venta_archivo (`manage.py archivar_ventas`), así las pantallas del día a día
+solo recorren la tabla viva. Las consultas por rango de fechas pasan por acá para
+leer del archivo solo cuando el rango llega a fechas archivadas.
+"""
+import heapq
+from operator import attrgetter
+
+from django.db import transaction
+from django.db.models import Max
+
+from Task import versiones
+from Task.models import DetallesVenta, DetallesVentaArchivo, Ventas, VentasArchivo
+
+
+def fecha_limite_archivo():
+    """Fecha de la venta archivada más reciente, o None si el archivo está vacío."""
+    # Se cachea por versión: se lee de 'default' para no guardar el valor de una réplica atrasada
+    return versiones.cacheado(
+        versiones.VENTAS, 'archivo:limite',
+        lambda: VentasArchivo.objects.using('default').aggregate(limite=Max('fecha_venta'))['limite'],
+    )
+
+
+def _en_rango(queryset, desde, hasta):
+    if desde is not None:
+        queryset = queryset.filter(fecha_venta__gte=desde)
+    if hasta is not None:
+        queryset = queryset.filter(fecha_venta__lt=hasta)
+    return queryset
+
+
+def consultas_por_rango(desde=None, hasta=None):
+    """
+    Querysets que cubren las ventas de [desde, hasta). La tabla viva siempre se consulta
+    (puede tener ventas viejas de turnos todavía abiertos); el archivo solo si el rango
+    empieza antes de su venta más reciente.
+    """
+    consultas = [_en_rango(Ventas.objects.all(), desde, hasta)]
+    limite = fecha_limite_archivo()
+    if limite is not None and (desde is None or desde <= limite):
+        consultas.append(_en_rango(VentasArchivo.objects.all(), desde, hasta))
+    return consultas
+
+
+def ventas_en_rango(desde=None, hasta=None):
+    """Ventas vivas y archivadas de [desde, hasta), de la más reciente a la más antigua."""
+    consultas = [q.order_by('-fecha_venta') for q in consultas_por_rango(desde, hasta)]
+    return list(heapq.merge(*consultas, key=attrgetter('fecha_venta'), reverse=True))
+
+
+def detalles_de(venta):
+    """Líneas de una venta, viva o archivada."""
+    if getattr(venta, 'archivada', False):
+        return DetallesVentaArchivo.objects.filter(id_venta=venta.pk)
+    return DetallesVenta.objects.filter(id_venta=venta.pk)
+
+
+def _copiar(instancia, modelo):
+    return modelo(**{f.attname: getattr(instancia, f.attname) for f in instancia._meta.concrete_fields})
+
+
+@transaction.atomic
+def archivar(ids):
+    """Mueve las ventas indicadas y sus líneas al archivo. Devuelve cuántas ventas movió."""
+    ventas = list(Ventas.objects.select_for_update().filter(pk__in=ids))
+    if not ventas:
+        return 0
+    ids = [v.pk for v in ventas]
+    detalles = DetallesVenta.objects.filter(id_venta__in=ids)
+
+    VentasArchivo.objects.bulk_create([_copiar(v, VentasArchivo) for v in ventas])
+    DetallesVentaArchivo.objects.bulk_create([_copiar(d, DetallesVentaArchivo) for d in detalles])
+    # El CASCADE de Ventas se lleva también sus detalles
+    Ventas.objects.filter(pk__in=ids).delete()
+    return len(ventas)
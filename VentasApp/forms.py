@@ -1,5 +1,10 @@
+import datetime
+
 from django import forms
-from django.forms import inlineformset_factory
+from django.core.exceptions import ValidationError
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.utils import timezone
+from django.utils.functional import cached_property
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field, Div, Submit
 from Task.models import Ventas, DetallesVenta, Productos
@@ -14,6 +19,12 @@ class Ventasform(forms.ModelForm):
             'descuento': forms.NumberInput(attrs={'step': '0.01'}),
             'vuelto': forms.NumberInput(attrs={'step': '0.01', 'readonly': 'readonly'}),
         }
+        labels = {
+            'descuento': 'Descuento adicional',
+        }
+        help_texts = {
+            'descuento': 'Las promociones vigentes se descuentan solas en cada línea al guardar.',
+        }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -31,13 +42,149 @@ class Ventasform(forms.ModelForm):
             Submit('submit', '💾 Guardar Venta', css_class='btn btn-primary')
         )
 
+class ProductoChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField que, dentro de BaseDetalleVentaFormSet, resuelve el id contra los
+    productos que el formset precargó en una sola consulta en lugar de un SELECT por línea.
+    """
+    productos = None
+
+    def to_python(self, value):
+        if self.productos is None:
+            return super().to_python(value)
+        if value in self.empty_values:
+            return None
+        try:
+            return self.productos[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+
+class LineaExistenteField(forms.ModelChoiceField):
+    """Campo oculto de pk de la línea resuelto contra las líneas ya cargadas por el formset."""
+
+    def __init__(self, existentes, *args, **kwargs):
+        self.existentes = existentes
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.existentes()[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+
+class DetalleVentaForm(forms.ModelForm):
+    # Se elige con el buscador de productos; así no se renderiza un <select> con todo el catálogo
+    id_producto = ProductoChoiceField(
+        queryset=Productos.objects.all(),
+        required=False,
+        label='Producto',
+        widget=forms.HiddenInput(attrs={'class': 'producto-id'}),
+    )
+
+    class Meta:
+        model = DetallesVenta
+        fields = ['id_producto', 'cantidad']
+        widgets = {
+            'cantidad': forms.NumberInput(attrs={'min': 1, 'class': 'form-control'}),
+        }
+
+    def producto_elegido(self):
+        """Producto de la línea para mostrar su nombre y precio junto al buscador."""
+        if self.is_bound:
+            valor = self['id_producto'].value()
+            productos = self.fields['id_producto'].productos or {}
+            return productos.get(int(valor)) if str(valor or '').isdigit() else None
+        return self.instance.id_producto if self.instance.id_producto_id else None
+
+    def _get_validation_exclusions(self):
+        # La existencia del producto ya la verificó ProductoChoiceField; así el modelo
+        # no repite un SELECT por línea al validar la FK.
+        exclusiones = super()._get_validation_exclusions()
+        exclusiones.add('id_producto')
+        return exclusiones
+
+
+class BaseDetalleVentaFormSet(BaseInlineFormSet):
+    def __init__(self, *args, queryset=None, **kwargs):
+        if queryset is None:
+            queryset = DetallesVenta.objects.select_related('id_producto')
+        super().__init__(*args, queryset=queryset, **kwargs)
+
+    @cached_property
+    def productos_enviados(self):
+        ids = set()
+        for i in range(self.total_form_count()):
+            valor = self.data.get(f'{self.add_prefix(i)}-id_producto')
+            if valor and str(valor).isdigit():
+                ids.add(int(valor))
+        return Productos.objects.in_bulk(ids)
+
+    @cached_property
+    def lineas_existentes(self):
+        return {linea.pk: linea for linea in self.get_queryset()}
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        pk_name = self.model._meta.pk.name
+        campo = form.fields[pk_name]
+        form.fields[pk_name] = LineaExistenteField(
+            lambda: self.lineas_existentes,
+            queryset=campo.queryset,
+            initial=campo.initial,
+            required=False,
+            widget=campo.widget,
+        )
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        if self.is_bound:
+            form.fields['id_producto'].productos = self.productos_enviados
+        return form
+
+
 DetalleVentaFormSet = inlineformset_factory(
     Ventas, DetallesVenta,
+    form=DetalleVentaForm,
+    formset=BaseDetalleVentaFormSet,
     fields=['id_producto', 'cantidad'],
     extra=1,
     can_delete=True,
-    widgets={
-        'cantidad': forms.NumberInput(attrs={'min': 1, 'class': 'form-control'}),
-        'id_producto': forms.Select(attrs={'class': 'form-select'})
-    }
 )
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+
+class RangoFechasForm(forms.Form):
+    desde = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    hasta = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        desde, hasta = cleaned_data.get('desde'), cleaned_data.get('hasta')
+        if desde and hasta and desde > hasta:
+            raise ValidationError("La fecha 'desde' no puede ser posterior a 'hasta'.")
+        return cleaned_data
+
+    def rango(self):
+        """(desde, hasta) como datetimes [inicio de desde, fin de hasta), o None sin filtro."""
+        desde, hasta = self.cleaned_data.get('desde'), self.cleaned_data.get('hasta')
+        if not desde and not hasta:
+            return None
+        return (
+            _inicio_del_dia(desde) if desde else None,
+            _inicio_del_dia(hasta + datetime.timedelta(days=1)) if hasta else None,
+        )
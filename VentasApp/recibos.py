@@ -0,0 +1,132 @@
+"""
+Recibos de venta.
+
+El cuerpo HTML de cada recibo se cachea por id_venta (y el PDF aparte), sin vencimiento:
+una venta registrada no cambia salvo que se edite o anule, y esas vistas llaman a
+invalidar(), que borra solo los de esa venta. Con la cache locmem por defecto ese borrado
+no llega a los demás workers, así que ahí los recibos vencen a los RECIBOS_SEGUNDOS.
+En producción la plantilla la compila una sola vez el cached loader.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from Task.models import DetallesVenta, DetallesVentaArchivo, Ventas, VentasArchivo
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:  # xhtml2pdf es opcional; sin él solo hay recibos HTML
+    pisa = None
+
+PLANTILLA_DOCUMENTO = 'ventas/recibo.html'
+PLANTILLA_CUERPO = 'ventas/recibo_cuerpo.html'
+MARCA_CUERPO = mark_safe('<!-- recibos -->')
+RECIBOS_SEGUNDOS = 300
+
+
+def _clave(id_venta, formato):
+    return f'recibo:{formato}:{id_venta}'
+
+
+def _vencimiento():
+    return None if settings.CACHE_COMPARTIDA else RECIBOS_SEGUNDOS
+
+
+def ventas_con_lineas(queryset, relacion, modelo_detalle):
+    """Ventas con turno, caja, sucursal y empleado en el mismo JOIN y sus líneas con producto en una consulta más."""
+    return queryset.select_related(
+        'id_turno__id_caja__id_sucursal', 'id_turno__id_empleado',
+    ).prefetch_related(
+        Prefetch(relacion, queryset=modelo_detalle.objects.select_related('id_producto').order_by('id_detalle'), to_attr='lineas')
+    )
+
+
+def _cargar(ids):
+    """Ventas vivas y archivadas de `ids` con todo lo que muestra el recibo."""
+    ventas = list(ventas_con_lineas(Ventas.objects.filter(pk__in=ids), 'detallesventa_set', DetallesVenta))
+    faltantes = set(ids) - {v.pk for v in ventas}
+    if faltantes:
+        ventas += ventas_con_lineas(
+            VentasArchivo.objects.filter(pk__in=faltantes), 'detallesventaarchivo_set', DetallesVentaArchivo,
+        )
+    return ventas
+
+
+def cuerpos(ids):
+    """
+    {id_venta: HTML del recibo sin <html>} para las ventas que existen. Lo que no está en
+    cache se carga y renderiza de una vez y queda cacheado sin vencimiento.
+    """
+    claves = {_clave(pk, 'html'): pk for pk in ids}
+    cacheados = {claves[clave]: contenido for clave, contenido in cache.get_many(claves).items()}
+    faltantes = [pk for pk in ids if pk not in cacheados]
+    if faltantes:
+        nuevos = {
+            venta.pk: render_to_string(PLANTILLA_CUERPO, {'venta': venta})
+            for venta in _cargar(faltantes)
+        }
+        cache.set_many({_clave(pk, 'html'): contenido for pk, contenido in nuevos.items()}, _vencimiento())
+        cacheados.update(nuevos)
+    return cacheados
+
+
+def documento(titulo, id_venta=None, acciones=True):
+    """(encabezado, pie) del documento HTML en el que van uno o más recibos."""
+    html = render_to_string(PLANTILLA_DOCUMENTO, {
+        'titulo': titulo,
+        'id_venta': id_venta,
+        'acciones': acciones,
+        'cuerpo': MARCA_CUERPO,
+    })
+    encabezado, pie = html.split(MARCA_CUERPO)
+    return encabezado, pie
+
+
+def html(id_venta, acciones=True):
+    """Documento HTML con el recibo de la venta, o None si no existe."""
+    contenido = cuerpos([id_venta]).get(id_venta)
+    if contenido is None:
+        return None
+    encabezado, pie = documento(f'Recibo #{id_venta}', id_venta, acciones)
+    return encabezado + contenido + pie
+
+
+def pdf(id_venta):
+    """PDF del recibo, o None si la venta no existe, no está xhtml2pdf o la conversión falla."""
+    if pisa is None:
+        return None
+    clave = _clave(id_venta, 'pdf')
+    contenido = cache.get(clave)
+    if contenido is None:
+        documento_html = html(id_venta, acciones=False)
+        if documento_html is None:
+            return None
+        salida = BytesIO()
+        if pisa.CreatePDF(documento_html, dest=salida, encoding='utf-8').err:
+            return None
+        contenido = salida.getvalue()
+        cache.set(clave, contenido, _vencimiento())
+    return contenido
+
+
+def turno(ids, lote=50):
+    """Genera el documento con los recibos de `ids` en orden, por partes para un StreamingHttpResponse."""
+    encabezado, pie = documento('Recibos del turno')
+    yield encabezado
+    for i in range(0, len(ids), lote):
+        parte = ids[i:i + lote]
+        contenidos = cuerpos(parte)
+        yield ''.join(contenidos[pk] for pk in parte if pk in contenidos)
+    yield pie
+
+
+def invalidar(id_venta):
+    """Borra los recibos cacheados de la venta cuando se confirma la transacción en curso."""
+    transaction.on_commit(
+        lambda: cache.delete_many([_clave(id_venta, 'html'), _clave(id_venta, 'pdf')])
+    )
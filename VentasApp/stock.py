@@ -0,0 +1,170 @@
+"""
+Movimientos de stock de las ventas.
+
+El stock vive por sucursal en StockSucursal. Todas las operaciones que lo tocan (venta,
+edición, anulación y ajustes) pasan por acá: se calculan los deltas netos por
+(sucursal, producto) en memoria, se bloquean solo las filas de esas sucursales en una
+consulta por sucursal y se aplican con un único UPDATE condicional, así el costo no
+depende de la cantidad de líneas y dos sucursales no se esperan entre sí.
+
+Productos.stock es el total de todas las sucursales: se actualiza después del commit con
+un UPDATE corto en autocommit, sin mantener bloqueada la fila del producto durante la
+venta. Deben llamarse dentro de una transacción.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+
+from Task import codigos, kardex, versiones
+from Task.models import Productos, StockSucursal, TurnosCaja
+
+
+class StockError(Exception):
+    """Error de stock con mensaje listo para mostrar al usuario."""
+
+
+class StockInsuficiente(StockError):
+    def __init__(self, fila):
+        self.fila = fila
+        super().__init__(
+            f"Stock insuficiente para {fila.id_producto.nombre_producto} en "
+            f"{fila.id_sucursal.nombre_sucursal} (Disponible: {fila.stock})"
+        )
+
+
+def sucursal_del_turno(id_turno):
+    """Sucursal de la caja del turno, de la que se descuenta lo vendido en él."""
+    sucursal = None
+    if id_turno is not None:
+        sucursal = TurnosCaja.objects.filter(pk=id_turno).values_list('id_caja__id_sucursal', flat=True).first()
+    if sucursal is None:
+        raise StockError("La venta debe tener un turno para saber de qué sucursal descontar el stock.")
+    return sucursal
+
+
+def stock_por_producto(ids):
+    """
+    {id_producto: stock sumado de sus sucursales} en una consulta, para mostrar el stock
+    confirmado sin esperar a que se actualice Productos.stock. Los productos sin stock por
+    sucursal no aparecen.
+    """
+    return dict(
+        StockSucursal.objects
+        .filter(id_producto__in=ids)
+        .values('id_producto')
+        .annotate(total=Sum('stock'))
+        .values_list('id_producto', 'total')
+        .order_by()
+    )
+
+
+def bloquear_stock(claves):
+    """
+    {(id_sucursal, id_producto): StockSucursal} con SELECT ... FOR UPDATE, una consulta por
+    sucursal. Las filas que faltan se crean con stock 0.
+    """
+    por_sucursal = defaultdict(set)
+    for sucursal, producto in claves:
+        if producto is None:
+            raise StockError("Todas las líneas deben tener un producto.")
+        por_sucursal[sucursal].add(producto)
+
+    filas = {}
+    for sucursal, ids in por_sucursal.items():
+        existentes = _filas(sucursal, ids)
+        faltantes = ids - existentes.keys()
+        if faltantes:
+            validos = set(Productos.objects.filter(pk__in=faltantes).values_list('pk', flat=True))
+            if faltantes - validos:
+                raise StockError(f"El producto (id={min(faltantes - validos)}) no existe.")
+            StockSucursal.objects.bulk_create(
+                [StockSucursal(id_producto_id=pk, id_sucursal_id=sucursal, stock=0) for pk in faltantes],
+                ignore_conflicts=True,
+            )
+            existentes.update(_filas(sucursal, faltantes))
+        filas.update({(sucursal, pk): fila for pk, fila in existentes.items()})
+    return filas
+
+
+def _filas(sucursal, ids):
+    # Solo se bloquean las filas de stock_sucursal, no el producto ni la sucursal del JOIN:
+    # si no, dos sucursales que venden el mismo producto vuelven a esperarse entre sí
+    consulta = (
+        StockSucursal.objects.select_for_update(of=('self',))
+        .select_related('id_producto', 'id_sucursal')
+        .filter(id_sucursal=sucursal, id_producto__in=ids)
+    )
+    return {fila.id_producto_id: fila for fila in consulta}
+
+
+def productos_de(filas):
+    """{id_producto: Productos} de las filas bloqueadas, para leer precios."""
+    return {fila.id_producto_id: fila.id_producto for fila in filas.values()}
+
+
+def cantidades_por_producto(lineas):
+    """Suma las cantidades de una lista de DetallesVenta por id de producto."""
+    cantidades = Counter()
+    for linea in lineas:
+        if linea.id_producto_id is not None:
+            cantidades[linea.id_producto_id] += linea.cantidad
+    return cantidades
+
+
+def deltas_de_stock(lineas_viejas, lineas_nuevas, sucursal_vieja, sucursal_nueva=None):
+    """
+    Delta neto de stock por (sucursal, producto) al pasar de lineas_viejas a lineas_nuevas:
+    lo que estaba vendido vuelve a la sucursal vieja y lo nuevo se descuenta de la nueva
+    (la misma, salvo que la venta haya cambiado de turno).
+    """
+    if sucursal_nueva is None:
+        sucursal_nueva = sucursal_vieja
+    deltas = Counter()
+    for pk, cantidad in cantidades_por_producto(lineas_viejas).items():
+        deltas[(sucursal_vieja, pk)] += cantidad
+    for pk, cantidad in cantidades_por_producto(lineas_nuevas).items():
+        deltas[(sucursal_nueva, pk)] -= cantidad
+    return {clave: delta for clave, delta in deltas.items() if delta}
+
+
+def aplicar_deltas(deltas, filas, tipo, id_venta=None):
+    """
+    Aplica {(id_sucursal, id_producto): delta} sobre filas ya bloqueadas con bloquear_stock
+    y los registra en el kardex con el tipo de movimiento dado.
+    Valida todo antes de escribir y lanza StockInsuficiente sin tocar nada si alguna
+    fila quedaría negativa.
+    """
+    for clave, delta in deltas.items():
+        if filas[clave].stock + delta < 0:
+            raise StockInsuficiente(filas[clave])
+
+    if not deltas:
+        return
+
+    StockSucursal.objects.filter(pk__in=[filas[clave].pk for clave in deltas]).update(
+        stock=Case(
+            *(When(pk=filas[clave].pk, then=F('stock') + delta) for clave, delta in deltas.items()),
+            default=F('stock'),
+        )
+    )
+    por_producto = Counter()
+    for clave, delta in deltas.items():
+        filas[clave].stock += delta
+        por_producto[clave[1]] += delta
+    por_producto = {pk: delta for pk, delta in por_producto.items() if delta}
+    kardex.registrar(por_producto, tipo, id_venta=id_venta)
+    transaction.on_commit(lambda: _actualizar_totales(por_producto))
+
+
+def _actualizar_totales(por_producto):
+    if por_producto:
+        Productos.objects.filter(pk__in=por_producto.keys()).update(
+            stock=Case(
+                *(When(pk=pk, then=F('stock') + delta) for pk, delta in por_producto.items()),
+                default=F('stock'),
+            )
+        )
+    # update() no dispara señales
+    versiones.incrementar(versiones.CATALOGO)
+    codigos.stock_movido(por_producto)
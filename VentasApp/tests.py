@@ -1,3 +1,400 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from Task.models import (
+    Cajas, DetallesVenta, DetallesVentaArchivo, MovimientoStock, Productos, Promociones, StockSucursal, TurnosCaja,
+    Ventas, VentasArchivo,
+)
+from Task import promociones, versiones
+from Task.tests import crear_base
+
+from . import archivo, recibos
+from .forms import DetalleVentaFormSet
+from .stock import bloquear_stock, deltas_de_stock, stock_por_producto
+
+PREFIJO = DetalleVentaFormSet.get_default_prefix()
+
+
+def datos_venta(turno, lineas):
+    """
+    POST del formulario de venta. lineas: (id_detalle o None, producto, cantidad, borrar);
+    las que tienen id_detalle van primero, como las arma el formset.
+    """
+    datos = {
+        'id_turno': turno.pk,
+        'nombre_cliente': '',
+        'total_venta': '0',
+        'metodo_pago': 'Efectivo',
+        'descuento': '0',
+        'vuelto': '0',
+        f'{PREFIJO}-TOTAL_FORMS': len(lineas),
+        f'{PREFIJO}-INITIAL_FORMS': sum(1 for id_detalle, *_ in lineas if id_detalle),
+        f'{PREFIJO}-MIN_NUM_FORMS': 0,
+        f'{PREFIJO}-MAX_NUM_FORMS': 1000,
+    }
+    for i, (id_detalle, producto, cantidad, borrar) in enumerate(lineas):
+        datos[f'{PREFIJO}-{i}-id_detalle'] = id_detalle or ''
+        datos[f'{PREFIJO}-{i}-id_producto'] = producto.pk
+        datos[f'{PREFIJO}-{i}-cantidad'] = cantidad
+        if borrar:
+            datos[f'{PREFIJO}-{i}-DELETE'] = 'on'
+    return datos
+
+
+class VentasTestCase(TestCase):
+    cantidad_productos = 3
+
+    def setUp(self):
+        self.datos = crear_base(productos=self.cantidad_productos)
+        self.productos = self.datos['productos']
+        self.oeste, self.norte = self.datos['sucursales']
+        StockSucursal.objects.bulk_create(
+            [StockSucursal(id_producto=p, id_sucursal=self.oeste, stock=p.stock) for p in self.productos]
+        )
+        self.client.force_login(self.datos['user'])
+
+    def stock(self, producto, sucursal=None):
+        fila = StockSucursal.objects.filter(id_producto=producto, id_sucursal=sucursal or self.oeste).first()
+        return fila.stock if fila else None
+
+    def vender(self, *lineas, turno=None):
+        """Registra una venta con (producto, cantidad) por línea y la devuelve."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('crear_venta'), datos_venta(
+                turno or self.datos['turno'], [(None, producto, cantidad, False) for producto, cantidad in lineas],
+            ))
+        return Ventas.objects.latest('pk')
+
+    def editar(self, venta, lineas, turno=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('editar_venta', args=[venta.pk]), datos_venta(turno or venta.id_turno, lineas),
+            )
+
+
+class DeltasDeStockTests(TestCase):
+    def test_neto_por_sucursal_y_producto(self):
+        viejas = [DetallesVenta(id_producto_id=1, cantidad=2), DetallesVenta(id_producto_id=1, cantidad=1),
+                  DetallesVenta(id_producto_id=2, cantidad=4)]
+        nuevas = [DetallesVenta(id_producto_id=1, cantidad=3), DetallesVenta(id_producto_id=3, cantidad=1)]
+
+        self.assertEqual(deltas_de_stock(viejas, nuevas, 1), {(1, 2): 4, (1, 3): -1})
+
+    def test_cambio_de_sucursal(self):
+        lineas = [DetallesVenta(id_producto_id=1, cantidad=2)]
+
+        self.assertEqual(deltas_de_stock(lineas, lineas, 1, 2), {(1, 1): 2, (2, 1): -2})
+
+
+class ReconciliacionDeStockTests(VentasTestCase):
+    def test_venta_descuenta_y_registra_en_el_kardex(self):
+        a, b = self.productos[:2]
+        venta = self.vender((a, 3), (b, 1), (a, 2))
+
+        self.assertEqual((self.stock(a), self.stock(b)), (95, 99))
+        self.assertEqual(Productos.objects.get(pk=a.pk).stock, 95)
+        self.assertEqual(
+            sorted(MovimientoStock.objects.filter(id_venta=venta.pk).values_list('id_producto', 'cantidad', 'tipo')),
+            [(a.pk, -5, MovimientoStock.VENTA), (b.pk, -1, MovimientoStock.VENTA)],
+        )
+
+    def test_editar_aplica_solo_la_diferencia(self):
+        a, b, c = self.productos
+        venta = self.vender((a, 5), (b, 2))
+        linea_a, linea_b = DetallesVenta.objects.filter(id_venta=venta).order_by('pk')
+
+        self.editar(venta, [(linea_a.pk, a, 2, False), (linea_b.pk, b, 2, True), (None, c, 4, False)])
+
+        self.assertEqual((self.stock(a), self.stock(b), self.stock(c)), (98, 100, 96))
+        self.assertEqual(
+            sorted(DetallesVenta.objects.filter(id_venta=venta).values_list('id_producto', 'cantidad')),
+            [(a.pk, 2), (c.pk, 4)],
+        )
+        self.assertEqual(
+            sorted(MovimientoStock.objects.filter(id_venta=venta.pk, tipo=MovimientoStock.EDICION_VENTA)
+                   .values_list('id_producto', 'cantidad')),
+            [(a.pk, 3), (b.pk, 2), (c.pk, -4)],
+        )
+
+    def test_stock_insuficiente_no_toca_nada(self):
+        a, b = self.productos[:2]
+        venta = self.vender((a, 1))
+        linea = DetallesVenta.objects.get(id_venta=venta)
+
+        self.editar(venta, [(linea.pk, a, 1, False), (None, b, 101, False)])
+
+        self.assertEqual((self.stock(a), self.stock(b)), (99, 100))
+        self.assertEqual(DetallesVenta.objects.filter(id_venta=venta).count(), 1)
+
+    def test_anular_devuelve_todo(self):
+        a, b = self.productos[:2]
+        venta = self.vender((a, 4), (b, 6))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('eliminar_venta', args=[venta.pk]))
+
+        self.assertEqual((self.stock(a), self.stock(b)), (100, 100))
+        self.assertEqual(Productos.objects.get(pk=b.pk).stock, 100)
+        self.assertFalse(Ventas.objects.filter(pk=venta.pk).exists())
+        self.assertFalse(DetallesVenta.objects.filter(id_venta=venta.pk).exists())
+
+
+class StockPorSucursalTests(VentasTestCase):
+    def setUp(self):
+        super().setUp()
+        caja = Cajas.objects.create(id_sucursal=self.norte, ubicacion='Monona, zona norte', estado='Abierta')
+        self.turno_norte = TurnosCaja.objects.create(
+            id_caja=caja, id_empleado=self.datos['empleado'], fecha_apertura=timezone.now(),
+        )
+        a = self.productos[0]
+        StockSucursal.objects.create(id_producto=a, id_sucursal=self.norte, stock=10)
+        Productos.objects.filter(pk=a.pk).update(stock=110)
+
+    def mover(self, venta, turno):
+        lineas = DetallesVenta.objects.filter(id_venta=venta).order_by('pk')
+        return self.editar(venta, [(l.pk, l.id_producto, l.cantidad, False) for l in lineas], turno=turno)
+
+    def test_cada_sucursal_descuenta_de_su_stock(self):
+        a = self.productos[0]
+        self.vender((a, 2))
+        self.vender((a, 3), turno=self.turno_norte)
+
+        self.assertEqual((self.stock(a), self.stock(a, self.norte)), (98, 7))
+        self.assertEqual(stock_por_producto([a.pk]), {a.pk: 105})
+        self.assertEqual(Productos.objects.get(pk=a.pk).stock, 105)
+
+    def test_mover_la_venta_de_sucursal(self):
+        a = self.productos[0]
+        venta = self.vender((a, 3))
+
+        self.mover(venta, self.turno_norte)
+
+        # Lo vendido vuelve a Oeste y sale de Norte; el total no cambia
+        self.assertEqual((self.stock(a), self.stock(a, self.norte)), (100, 7))
+        self.assertEqual(Productos.objects.get(pk=a.pk).stock, 107)
+        self.assertEqual(Ventas.objects.get(pk=venta.pk).id_turno_id, self.turno_norte.pk)
+
+    def test_mover_sin_stock_en_la_otra_sucursal(self):
+        a, b = self.productos[:2]
+        venta = self.vender((a, 3), (b, 1))
+
+        self.mover(venta, self.turno_norte)
+
+        # b no tiene stock en Norte: no se mueve nada
+        self.assertEqual((self.stock(a), self.stock(a, self.norte), self.stock(b)), (97, 10, 99))
+        self.assertEqual(Ventas.objects.get(pk=venta.pk).id_turno_id, self.datos['turno'].pk)
+
+    def test_bloquea_solo_las_filas_de_stock(self):
+        a = self.productos[0]
+        bloqueos = []
+
+        def sin_for_update(execute, sql, params, many, context):
+            # sqlite no entiende FOR UPDATE: se anota y se ejecuta sin él
+            sql, for_update, bloqueo = sql.partition(' FOR UPDATE')
+            if for_update:
+                bloqueos.append(bloqueo)
+            return execute(sql, params, many, context)
+
+        features = connection.features
+        with mock.patch.object(features, 'has_select_for_update', True), \
+                mock.patch.object(features, 'has_select_for_update_of', True), \
+                connection.execute_wrapper(sin_for_update), transaction.atomic():
+            bloquear_stock([(self.oeste.pk, a.pk), (self.norte.pk, a.pk)])
+
+        self.assertEqual(bloqueos, [f' OF {connection.ops.quote_name(StockSucursal._meta.db_table)}'] * 2)
+
+
+class ArchivoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.datos = crear_base(productos=1)
+        ahora = timezone.now()
+        self.turno_cerrado = TurnosCaja.objects.create(
+            id_caja=self.datos['caja'], id_empleado=self.datos['empleado'],
+            fecha_apertura=ahora - datetime.timedelta(days=800), fecha_cierre=ahora - datetime.timedelta(days=799),
+        )
+        self.vieja = self.venta(self.turno_cerrado, ahora - datetime.timedelta(days=800))
+        # Vieja pero de un turno abierto: se queda en la tabla viva
+        self.abierta = self.venta(self.datos['turno'], ahora - datetime.timedelta(days=700))
+        self.nueva = self.venta(self.datos['turno'], ahora - datetime.timedelta(days=1))
+
+    def venta(self, turno, fecha):
+        venta = Ventas.objects.create(id_turno=turno, fecha_venta=fecha, total_venta=20)
+        DetallesVenta.objects.create(id_venta=venta, id_producto=self.datos['productos'][0], cantidad=2, subtotal=20)
+        return venta
+
+    def archivar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archivar_ventas', '--meses', '12', stdout=StringIO())
+
+    def test_mueve_ventas_y_lineas_de_turnos_cerrados(self):
+        self.archivar()
+
+        self.assertEqual(list(VentasArchivo.objects.values_list('pk', flat=True)), [self.vieja.pk])
+        self.assertEqual(
+            list(DetallesVentaArchivo.objects.values_list('id_venta', 'cantidad', 'subtotal')),
+            [(self.vieja.pk, 2, 20)],
+        )
+        self.assertEqual(sorted(Ventas.objects.values_list('pk', flat=True)), [self.abierta.pk, self.nueva.pk])
+        self.assertFalse(DetallesVenta.objects.filter(id_venta=self.vieja.pk).exists())
+
+    def test_rango_junta_vivas_y_archivadas(self):
+        self.archivar()
+
+        ventas = archivo.ventas_en_rango()
+        self.assertEqual([v.pk for v in ventas], [self.nueva.pk, self.abierta.pk, self.vieja.pk])
+        self.assertEqual([l.cantidad for l in archivo.detalles_de(ventas[-1])], [2])
+        self.assertEqual(archivo.fecha_limite_archivo(), self.vieja.fecha_venta)
+
+    def test_rangos_recientes_no_leen_el_archivo(self):
+        self.archivar()
+
+        desde = timezone.now() - datetime.timedelta(days=30)
+        self.assertEqual([q.model for q in archivo.consultas_por_rango(desde)], [Ventas])
+        self.assertEqual([v.pk for v in archivo.ventas_en_rango(desde)], [self.nueva.pk])
+        antes = self.vieja.fecha_venta - datetime.timedelta(days=1)
+        self.assertEqual([q.model for q in archivo.consultas_por_rango(antes)], [Ventas, VentasArchivo])
+
+
+class RecibosTests(VentasTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def recibo(self, venta):
+        return self.client.get(reverse('recibo_venta', args=[venta.pk]))
+
+    def test_el_segundo_recibo_sale_de_la_cache(self):
+        venta = self.vender((self.productos[0], 2))
+
+        with CaptureQueriesContext(connection) as primero:
+            contenido = self.recibo(venta).content
+        with CaptureQueriesContext(connection) as segundo:
+            self.assertEqual(self.recibo(venta).content, contenido)
+
+        self.assertIn(f'Venta #{venta.pk}'.encode(), contenido)
+        # Solo quedan las de la sesión y el usuario
+        self.assertLess(len(segundo), len(primero))
+
+    def test_editar_invalida_solo_esa_venta(self):
+        a, b = self.productos[:2]
+        editada, otra = self.vender((a, 1)), self.vender((a, 1))
+        self.recibo(editada)
+        self.recibo(otra)
+        linea = DetallesVenta.objects.get(id_venta=editada)
+
+        self.editar(editada, [(linea.pk, a, 1, True), (None, b, 1, False)])
+
+        self.assertIsNone(cache.get(recibos._clave(editada.pk, 'html')))
+        self.assertIsNotNone(cache.get(recibos._clave(otra.pk, 'html')))
+        self.assertContains(self.recibo(editada), b.nombre_producto)
+
+    def test_anular_borra_el_recibo(self):
+        venta = self.vender((self.productos[0], 1))
+        self.recibo(venta)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('eliminar_venta', args=[venta.pk]))
+
+        self.assertEqual(self.recibo(venta).status_code, 404)
+
+    def test_reimprimir_el_turno(self):
+        primera, segunda = self.vender((self.productos[0], 1)), self.vender((self.productos[1], 1))
+
+        respuesta = self.client.get(reverse('reimprimir_turno', args=[self.datos['turno'].pk]))
+        contenido = b''.join(respuesta.streaming_content).decode()
+
+        self.assertLess(contenido.index(f'Venta #{primera.pk}<'), contenido.index(f'Venta #{segunda.pk}<'))
+
+
+class PromocionesEnVentasTests(VentasTestCase):
+    def setUp(self):
+        cache.clear()
+        versiones._vistas.clear()
+        promociones._compiladas = None
+        with self.captureOnCommitCallbacks(execute=True):
+            super().setUp()
+            promocion = Promociones.objects.create(nombre='3x2', tipo=Promociones.LLEVA_PAGA, lleva=3, paga=2)
+            promocion.productos.add(self.productos[0])
+
+    def test_la_venta_guarda_el_descuento_de_cada_linea(self):
+        a, b = self.productos[:2]
+        venta = self.vender((a, 3), (b, 1))
+
+        self.assertEqual(
+            list(DetallesVenta.objects.filter(id_venta=venta).order_by('pk').values_list('subtotal', 'descuento')),
+            [(30, 10), (11, 0)],
+        )
+        self.assertEqual(Ventas.objects.get(pk=venta.pk).total_venta, 31)
+
+    def test_editar_recalcula_el_descuento(self):
+        a = self.productos[0]
+        venta = self.vender((a, 3))
+        linea = DetallesVenta.objects.get(id_venta=venta)
+
+        self.editar(venta, [(linea.pk, a, 2, False)])
+
+        self.assertEqual(DetallesVenta.objects.get(pk=linea.pk).descuento, 0)
+        self.assertEqual(Ventas.objects.get(pk=venta.pk).total_venta, 20)
+
+    def venta_de_hace_dias(self, *lineas, dias=2):
+        venta = self.vender(*lineas)
+        Ventas.objects.filter(pk=venta.pk).update(fecha_venta=timezone.now() - datetime.timedelta(days=dias))
+        return Ventas.objects.get(pk=venta.pk)
+
+    def test_editar_usa_las_promociones_de_cuando_se_vendio(self):
+        a, b = self.productos[:2]
+        venta = self.venta_de_hace_dias((a, 3))
+        linea = DetallesVenta.objects.get(id_venta=venta)
+        ahora = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            # El 3x2 terminó ayer y desde hoy b tiene 50%
+            Promociones.objects.update(hasta=ahora - datetime.timedelta(days=1))
+            Promociones.objects.create(
+                nombre='Mitad', tipo=Promociones.PORCENTAJE, porcentaje=50, desde=ahora,
+            ).productos.add(b)
+
+        self.editar(venta, [(linea.pk, a, 3, False), (None, b, 1, False)])
+
+        self.assertEqual(
+            list(DetallesVenta.objects.filter(id_venta=venta).order_by('pk').values_list('descuento', flat=True)),
+            [10, 0],
+        )
+        self.assertEqual(Ventas.objects.get(pk=venta.pk).total_venta, 31)
+
+
+class CostoConstanteTests(VentasTestCase):
+    cantidad_productos = 30
+
+    def consultas(self, funcion):
+        """Consultas de funcion(), incluidas las que corren al confirmar la transacción."""
+        with CaptureQueriesContext(connection) as capturadas:
+            funcion()
+        return len(capturadas)
+
+    def anular(self, venta):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('eliminar_venta', args=[venta.pk]))
+
+    def test_vender_no_depende_de_las_lineas(self):
+        pocas = self.consultas(lambda: self.vender(*((p, 1) for p in self.productos[:2])))
+        muchas = self.consultas(lambda: self.vender(*((p, 1) for p in self.productos)))
+
+        self.assertEqual(muchas, pocas)
+        self.assertEqual((self.stock(self.productos[0]), self.stock(self.productos[-1])), (98, 99))
+
+    def test_anular_no_depende_de_las_lineas(self):
+        chica = self.vender(*((p, 1) for p in self.productos[:2]))
+        grande = self.vender(*((p, 1) for p in self.productos))
 
-# Create your tests here.
+        self.assertEqual(self.consultas(lambda: self.anular(grande)), self.consultas(lambda: self.anular(chica)))
+        self.assertEqual(self.stock(self.productos[-1]), 100)
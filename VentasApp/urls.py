@@ -6,4 +6,7 @@ urlpatterns = [
     path('nueva/', views.crear_venta, name='crear_venta'),
     path('editar/<int:pk>/', views.editar_venta, name='editar_venta'),
     path('eliminar/<int:pk>/', views.eliminar_venta, name='eliminar_venta'),
+    path('recibo/<int:pk>/', views.recibo_venta, name='recibo_venta'),
+    path('recibo/<int:pk>/pdf/', views.recibo_venta_pdf, name='recibo_venta_pdf'),
+    path('turno/<int:id_turno>/recibos/', views.reimprimir_turno, name='reimprimir_turno'),
 ]
@@ -1,17 +1,37 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.core.exceptions import PermissionDenied
-from Task.models import TurnosCaja, Productos, Ventas, DetallesVenta
-from .forms import Ventasform, DetalleVentaFormSet
+from Task.models import TurnosCaja, Ventas, VentasArchivo, DetallesVenta, MovimientoStock
+from Task.permisos import requiere_capacidad
+from Task import promociones, versiones
+from django.db.models import Max
+from .forms import Ventasform, DetalleVentaFormSet, RangoFechasForm
+from .archivo import ventas_en_rango
+from . import recibos
+from .stock import StockError, aplicar_deltas, bloquear_stock, deltas_de_stock, productos_de, sucursal_del_turno
 from django.db import transaction
 
+def _ultima_venta(request):
+    # Cubre ventas registradas por otros procesos aunque su contador de versión no se haya enterado
+    return Ventas.objects.aggregate(ultima=Max('id_venta'))['ultima'] or 0
+
+
+# Sin @solo_lectura: ETag y página salen de la primaria (ver Task/replicas.py)
 @login_required
+@versiones.condicional(versiones.VENTAS, extra=_ultima_venta)
 def lista_ventas(request):
-    ventas = Ventas.objects.all()
-    return render(request, 'ventas/lista.html', {'ventas': ventas})
+    filtro = RangoFechasForm(request.GET or None)
+    rango = filtro.rango() if filtro.is_valid() else None
+    if rango:
+        # Solo con un rango explícito se mira el archivo, y solo si el rango lo alcanza
+        ventas = ventas_en_rango(*rango)
+    else:
+        ventas = Ventas.objects.all()
+    return render(request, 'ventas/lista.html', {'ventas': ventas, 'filtro': filtro})
 
 @login_required
 @require_http_methods(["GET", "POST"])
@@ -37,85 +57,201 @@ def crear_venta(request):
 
             detalles = formset.save(commit=False)
 
-            # 1) Validar stock para todos los detalles antes de tocar nada
-            for detalle in detalles:
-                # detalle.id_producto_id obtiene el PK del producto (sin resolver la relación)
-                prod_pk = detalle.id_producto_id
-                try:
-                    producto = Productos.objects.select_for_update().get(pk=prod_pk)
-                except Productos.DoesNotExist:
-                    messages.error(request, f"El producto (id={prod_pk}) no existe.")
-                    transaction.set_rollback(True)
-                    return redirect('crear_venta')
-
-                if producto.stock is None:
-                    messages.error(request, f"Stock no definido para {producto.nombre_producto}.")
-                    transaction.set_rollback(True)
-                    return redirect('crear_venta')
-
-                if producto.stock < detalle.cantidad:
-                    messages.error(
-                        request,
-                        f"Stock insuficiente para {producto.nombre_producto} (Disponible: {producto.stock})"
-                    )
-                    transaction.set_rollback(True)
-                    return redirect('crear_venta')
-
-            # 2) Si todo ok, guardar cada detalle y descontar stock
-            total = 0
-            for detalle in detalles:
-                producto = Productos.objects.select_for_update().get(pk=detalle.id_producto_id)
+            # 1) Bloquear el stock de la sucursal del turno y validar antes de tocar nada
+            try:
+                sucursal = sucursal_del_turno(venta.id_turno_id)
+                filas = bloquear_stock((sucursal, d.id_producto_id) for d in detalles)
+                aplicar_deltas(deltas_de_stock([], detalles, sucursal), filas, MovimientoStock.VENTA, venta.pk)
+            except StockError as e:
+                messages.error(request, str(e))
+                transaction.set_rollback(True)
+                return redirect('crear_venta')
 
+            # 2) Guardar los detalles con su subtotal y promociones en un solo INSERT
+            productos = productos_de(filas)
+            for detalle in detalles:
                 detalle.id_venta = venta
-                detalle.subtotal = producto.precio * detalle.cantidad  # usa 'precio' según tu modelo
-                detalle.save()
-
-                # descontar stock y guardar producto
-                producto.stock -= detalle.cantidad
-                producto.save()
-
-                total += detalle.subtotal
+                detalle.subtotal = productos[detalle.id_producto_id].precio * detalle.cantidad
+            promociones.aplicar(detalles, productos)
+            DetallesVenta.objects.bulk_create(detalles)
 
             # 3) actualizar total de la venta y redirigir
-            venta.total_venta = total - (venta.descuento or 0)
+            venta.total_venta = _total_lineas(detalles) - (venta.descuento or 0)
             venta.save()
 
             messages.success(request, f'Venta registrada ✅ Total: ${venta.total_venta:.2f}')
-            return redirect('lista_ventas')
+            return redirect('recibo_venta', pk=venta.pk)
     else:
         form = Ventasform(instance=venta)
         form.fields['id_turno'].queryset = turnos_abiertos
         formset = DetalleVentaFormSet(instance=venta)
 
-    productos = Productos.objects.all()
     return render(request, 'ventas/form.html', {
         'form': form,
         'formset': formset,
-        'productos': productos
     })
     
 @login_required
+@requiere_capacidad('editar_ventas', "Solo los administradores pueden editar ventas.")
+@require_http_methods(["GET", "POST"])
+@transaction.atomic
 def editar_venta(request, pk):
-    if not request.user.is_staff:
-        raise PermissionDenied("Solo los administradores pueden editar ventas.")
-    venta = get_object_or_404(Ventas, pk=pk)
+    """
+    Edita la venta y sus líneas. El stock se reconcilia con la diferencia entre las
+    líneas guardadas y las nuevas, sin importar cuántas líneas tenga la venta.
+    """
+    venta = get_object_or_404(Ventas.objects.select_for_update(), pk=pk)
     if request.method == 'POST':
+        # El form modifica la instancia al validar; el turno guardado se toma antes
+        turno_anterior = venta.id_turno_id
         form = Ventasform(request.POST, instance=venta)
-        if form.is_valid():
-            form.save()
+        formset = DetalleVentaFormSet(request.POST, instance=venta)
+        if form.is_valid() and formset.is_valid():
+            viejas = list(DetallesVenta.objects.select_for_update().filter(id_venta=venta))
+            borradas, nuevas = _lineas_del_formset(formset)
+
+            try:
+                # Si la venta cambió de turno, lo vendido vuelve a la sucursal anterior
+                sucursal_vieja = sucursal_del_turno(turno_anterior) if viejas else None
+                sucursal_nueva = sucursal_del_turno(form.instance.id_turno_id)
+                filas = bloquear_stock(
+                    {(sucursal_vieja, l.id_producto_id) for l in viejas if l.id_producto_id}
+                    | {(sucursal_nueva, l.id_producto_id) for l in nuevas}
+                )
+                deltas = deltas_de_stock(viejas, nuevas, sucursal_vieja, sucursal_nueva)
+                aplicar_deltas(deltas, filas, MovimientoStock.EDICION_VENTA, venta.pk)
+            except StockError as e:
+                messages.error(request, str(e))
+                transaction.set_rollback(True)
+                return redirect('editar_venta', pk=venta.pk)
+
+            # Con las promociones de cuando se hizo la venta, no las de hoy
+            _guardar_lineas(venta, viejas, borradas, nuevas, productos_de(filas), venta.fecha_venta)
+
+            venta = form.save(commit=False)
+            venta.total_venta = _total_lineas(nuevas) - (venta.descuento or 0)
+            venta.save()
+            recibos.invalidar(venta.pk)
             messages.success(request, 'Venta actualizada correctamente.')
             return redirect('lista_ventas')
     else:
         form = Ventasform(instance=venta)
-    return render(request, 'ventas/form.html', {'form': form})
+        formset = DetalleVentaFormSet(instance=venta)
+
+    return render(request, 'ventas/form.html', {
+        'form': form,
+        'formset': formset,
+        'titulo': f'Editar Venta #{venta.pk}',
+    })
+
+
+def _lineas_del_formset(formset):
+    """Separa las líneas del formset en (ids a borrar, líneas que quedan en la venta)."""
+    borradas, nuevas = set(), []
+    for f in formset.forms:
+        linea = f.instance
+        if formset.can_delete and formset._should_delete_form(f):
+            if linea.pk:
+                borradas.add(linea.pk)
+            continue
+        if linea.pk is None and not f.has_changed():
+            continue
+        nuevas.append(linea)
+    return borradas, nuevas
+
+
+def _total_lineas(lineas):
+    return sum((l.subtotal - l.descuento for l in lineas), 0)
+
+
+def _guardar_lineas(venta, viejas, borradas, nuevas, productos, momento):
+    """Aplica el diff de líneas con un DELETE, un INSERT y un UPDATE como máximo."""
+    guardadas = {l.pk: l for l in viejas}
+    crear, actualizar = [], []
+    cambiaron = False
+    for linea in nuevas:
+        anterior = guardadas.get(linea.pk)
+        if (
+            anterior is None
+            or anterior.id_producto_id != linea.id_producto_id
+            or anterior.cantidad != linea.cantidad
+        ):
+            linea.subtotal = productos[linea.id_producto_id].precio * linea.cantidad
+            cambiaron = True
+        linea.id_venta = venta
+        (actualizar if anterior is not None else crear).append(linea)
+
+    # Líneas que ya no vienen en el formset también se borran
+    borradas |= guardadas.keys() - {l.pk for l in actualizar}
+    if cambiaron or borradas:
+        # Los combos dependen de toda la venta: se recalculan todas las líneas
+        promociones.aplicar(nuevas, productos, momento)
+    if borradas:
+        DetallesVenta.objects.filter(pk__in=borradas).delete()
+    if crear:
+        DetallesVenta.objects.bulk_create(crear)
+    if actualizar:
+        DetallesVenta.objects.bulk_update(actualizar, ['id_producto', 'cantidad', 'subtotal', 'descuento'])
+
 
 @login_required
+@requiere_capacidad('eliminar_ventas', "Solo los administradores pueden eliminar ventas.")
+@require_http_methods(["GET", "POST"])
+@transaction.atomic
 def eliminar_venta(request, pk):
-    if not request.user.is_staff:
-        raise PermissionDenied("Solo los administradores pueden eliminar ventas.")
-    venta = get_object_or_404(Ventas, pk=pk)
+    """Anula la venta devolviendo al stock todas sus unidades."""
+    venta = get_object_or_404(Ventas.objects.select_for_update(), pk=pk)
     if request.method == 'POST':
+        lineas = [l for l in DetallesVenta.objects.select_for_update().filter(id_venta=venta) if l.id_producto_id]
+        try:
+            sucursal = sucursal_del_turno(venta.id_turno_id) if lineas else None
+            filas = bloquear_stock((sucursal, l.id_producto_id) for l in lineas)
+        except StockError as e:
+            messages.error(request, str(e))
+            transaction.set_rollback(True)
+            return redirect('lista_ventas')
+        aplicar_deltas(deltas_de_stock(lineas, [], sucursal), filas, MovimientoStock.ANULACION, venta.pk)
+
+        DetallesVenta.objects.filter(id_venta=venta).delete()
+        recibos.invalidar(venta.pk)
         venta.delete()
         messages.success(request, 'Venta eliminada correctamente.')
         return redirect('lista_ventas')
     return render(request, 'ventas/eliminar.html', {'venta': venta})
+
+
+@login_required
+def recibo_venta(request, pk):
+    """Recibo HTML de la venta para la impresora térmica."""
+    contenido = recibos.html(pk)
+    if contenido is None:
+        raise Http404("La venta no existe.")
+    return HttpResponse(contenido)
+
+
+@login_required
+def recibo_venta_pdf(request, pk):
+    """Recibo de la venta en PDF."""
+    if recibos.pisa is None:
+        messages.warning(request, 'La generación de PDF no está disponible (falta xhtml2pdf).')
+        return redirect('recibo_venta', pk=pk)
+    contenido = recibos.pdf(pk)
+    if contenido is None:
+        raise Http404("La venta no existe o no se pudo generar el PDF.")
+    respuesta = HttpResponse(contenido, content_type='application/pdf')
+    respuesta['Content-Disposition'] = f'inline; filename="recibo-{pk}.pdf"'
+    return respuesta
+
+
+@login_required
+def reimprimir_turno(request, id_turno):
+    """Todos los recibos de un turno en un solo documento, enviado por partes."""
+    turno = get_object_or_404(TurnosCaja, pk=id_turno)
+    ventas = sorted(
+        list(VentasArchivo.objects.filter(id_turno=turno).values_list('fecha_venta', 'id_venta'))
+        + list(Ventas.objects.filter(id_turno=turno).values_list('fecha_venta', 'id_venta'))
+    )
+    return StreamingHttpResponse(
+        recibos.turno([pk for _, pk in ventas]),
+        content_type='text/html; charset=utf-8',
+    )